@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CarnavalMapConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "carnaval_map"
+
+    def ready(self):
+        from .search import restore_fts_triggers
+
+        # Reconstruções da tabela de blocos em migrações apagam os triggers da busca
+        post_migrate.connect(restore_fts_triggers, sender=self)
@@ -0,0 +1,217 @@
+"""
+Batched backfill of fields derived from other Bloco columns.
+
+Extractors are registered with the ``extractor`` decorator: each one reads
+some source fields and returns the values of the fields it derives. A
+backfill streams the blocos with ``.iterator()``, loading only the columns
+the selected extractors need, and writes the changed rows with
+``bulk_update`` restricted to the fields that actually changed.
+"""
+
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+
+from django.db import transaction
+
+from .models import Bloco
+from .parser import NEIGHBORHOOD_RE
+from .serializers import SUMMARY_SOURCE_FIELDS, summary_fragment
+
+
+@dataclass(frozen=True)
+class Extractor:
+    """A registered derived-field extractor."""
+
+    name: str
+    sources: tuple
+    fields: tuple
+    function: callable
+
+
+# Extratores na ordem de registro, que é a ordem de execução
+EXTRACTORS = {}
+
+
+def extractor(name, sources, fields):
+    """
+    Registers a function that derives `fields` from `sources`.
+
+    The function receives a dict with the source values (and the values
+    already derived by the extractors registered before it) and returns a
+    dict with the derived values. Fields missing from the result are left
+    untouched.
+
+    Args:
+        name (str): The extractor name used on the command line.
+        sources (tuple): Bloco fields read by the function.
+        fields (tuple): Bloco fields the function may change.
+    """
+
+    def register(function):
+        EXTRACTORS[name] = Extractor(name, tuple(sources), tuple(fields), function)
+        return function
+
+    return register
+
+
+TIME_RE = re.compile(r"(\d{1,2})\s*(?:h|:)\s*(\d{2})?")
+SUBTITLE_TIME_RE = re.compile(r"\d{2}/\d{2}/\d{4} - .*? - (\d{1,2}\s*(?:h|:)\s*\d{0,2})")
+
+# Nomes dos dias como aparecem no site, indexados por date.weekday()
+WEEKDAYS = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo")
+
+
+def normalize_time(value):
+    """
+    Normalizes times such as "9:00", "16h" or "16h30" to "HH:MM".
+
+    Args:
+        value (str): The raw time.
+
+    Returns:
+        str: The normalized time, or None when the value is not a time.
+    """
+    match = TIME_RE.search(value or "")
+    if match is None:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return f"{hours:02d}:{minutes:02d}"
+
+
+@extractor("neighborhood", sources=("subtitle",), fields=("neighborhood",))
+def extract_neighborhood(values):
+    match = NEIGHBORHOOD_RE.search(values["subtitle"] or "")
+    if match is None:
+        return {}
+    return {"neighborhood": match.group(1).strip()}
+
+
+@extractor("time", sources=("subtitle", "event_time"), fields=("event_time",))
+def extract_time(values):
+    match = SUBTITLE_TIME_RE.search(values["subtitle"] or "")
+    event_time = normalize_time(match.group(1) if match else values["event_time"])
+    if event_time is None:
+        return {}
+    return {"event_time": event_time}
+
+
+@extractor("weekday", sources=("event_date",), fields=("event_day",))
+def extract_weekday(values):
+    event_date = values["event_date"]
+    if not isinstance(event_date, date):
+        return {}
+    return {"event_day": WEEKDAYS[event_date.weekday()]}
+
+
+# Registrado por último: vê os valores já corrigidos pelos demais extratores
+@extractor(
+    "summary",
+    sources=tuple(field for field in SUMMARY_SOURCE_FIELDS if field != "id"),
+    fields=("summary_json",),
+)
+def extract_summary(values):
+    return {"summary_json": summary_fragment(values)}
+
+
+@dataclass
+class BackfillResult:
+    """Counters of a backfill run."""
+
+    scanned: int = 0
+    updated: int = 0
+    changes: Counter = field(default_factory=Counter)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.scanned / self.seconds if self.seconds else 0.0
+
+
+def get_extractors(names=None):
+    """
+    Returns the registered extractors, in registration order. Selecting an
+    extractor that changes a summary field also selects "summary".
+
+    Args:
+        names (list): Extractor names; all of them when empty.
+
+    Raises:
+        KeyError: If a name is not registered.
+    """
+    if not names:
+        return list(EXTRACTORS.values())
+    unknown = [name for name in names if name not in EXTRACTORS]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+
+    # O resumo pré-renderizado acompanha os campos que ele publica
+    names = set(names)
+    summary_sources = set(EXTRACTORS["summary"].sources)
+    if any(summary_sources & set(EXTRACTORS[name].fields) for name in names):
+        names.add("summary")
+    return [extractor for name, extractor in EXTRACTORS.items() if name in names]
+
+
+def run_backfill(names=None, chunk_size=2000, dry_run=False, queryset=None, progress=None):
+    """
+    Runs the selected extractors over every bloco.
+
+    Args:
+        names (list): Extractor names; all of them when empty.
+        chunk_size (int): Rows fetched per round trip and written per bulk_update.
+        dry_run (bool): Count the changes without writing them.
+        queryset (QuerySet): The blocos to process; all of them when None.
+        progress (callable): Called with the BackfillResult after each chunk.
+
+    Returns:
+        BackfillResult: The counters of the run.
+    """
+    extractors = get_extractors(names)
+    sources = {source for extractor in extractors for source in extractor.sources}
+    sources |= {field for extractor in extractors for field in extractor.fields}
+
+    result = BackfillResult()
+    started = time.perf_counter()
+    pending = []
+    pending_fields = set()
+
+    def flush():
+        if pending and not dry_run:
+            with transaction.atomic():
+                Bloco.objects.bulk_update(pending, sorted(pending_fields))
+        pending.clear()
+        pending_fields.clear()
+        result.seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(result)
+
+    # Ordenado por id: as escritas só atingem linhas já lidas pelo iterator
+    blocos = (queryset if queryset is not None else Bloco.objects.all()).only(*sources)
+    for bloco in blocos.order_by("id").iterator(chunk_size=chunk_size):
+        result.scanned += 1
+        values = {source: getattr(bloco, source) for source in sources}
+        changed = set()
+
+        for extractor in extractors:
+            for name, value in extractor.function(values).items():
+                values[name] = value
+                if getattr(bloco, name) != value:
+                    setattr(bloco, name, value)
+                    changed.add(name)
+
+        if changed:
+            result.updated += 1
+            result.changes.update(changed)
+            pending.append(bloco)
+            pending_fields.update(changed)
+
+        if result.scanned % chunk_size == 0:
+            flush()
+
+    flush()
+    return result
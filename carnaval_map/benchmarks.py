@@ -0,0 +1,173 @@
+"""
+Latency, query-count and payload benchmarks of the map endpoints.
+
+Requests go through the Django test client against whatever is in the
+current database, so the numbers include URL routing, middleware, the view
+and JSON encoding, but no network. Each case is requested once to warm the
+facet index and the snapshot, then ``rounds`` times while timing.
+
+The application cache is replaced by a dummy backend while timing, since
+after an ingest every timed round would otherwise be a cache hit and the
+views themselves would never run. The cached path is reported separately,
+as the "warm" figures.
+
+Results are plain dicts, ready to be saved as JSON and compared with a
+previous run by ``compare_results``.
+"""
+
+import time
+from collections import Counter
+
+import numpy as np
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Bloco
+
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def representative_filters():
+    """
+    Picks the filter values of the benchmark from the data: the busiest city,
+    its busiest date and its busiest neighborhood, which are the slowest
+    realistic requests.
+
+    Returns:
+        dict: The city, date and neighborhood, empty strings when there are
+        no blocos.
+    """
+    city = date = neighborhood = ""
+    cities = Counter(Bloco.objects.values_list("city", flat=True))
+    if cities:
+        city = cities.most_common(1)[0][0]
+        rows = Bloco.objects.filter(city=city).values_list("event_date", "neighborhood")
+        dates = Counter(event_date for event_date, _ in rows if event_date)
+        neighborhoods = Counter(name for _, name in rows if name)
+        date = dates.most_common(1)[0][0].isoformat() if dates else ""
+        neighborhood = neighborhoods.most_common(1)[0][0] if neighborhoods else ""
+    return {"city": city, "date": date, "neighborhood": neighborhood}
+
+
+def build_cases(filters=None):
+    """
+    Returns the benchmarked requests: the index page and the filter
+    combinations used by the map.
+
+    Args:
+        filters (dict): The city, date and neighborhood to use; picked from
+            the data when None.
+
+    Returns:
+        dict: (path, query params) keyed by case name.
+    """
+    filters = filters or representative_filters()
+    city, date, neighborhood = filters["city"], filters["date"], filters["neighborhood"]
+    filter_url = reverse("filter_blocos")
+    return {
+        "index": (reverse("index"), {}),
+        "filter": (filter_url, {}),
+        "filter_city": (filter_url, {"city": city}),
+        "filter_date": (filter_url, {"date": date}),
+        "filter_city_date": (filter_url, {"city": city, "date": date}),
+        "filter_city_neighborhood": (filter_url, {"city": city, "neighborhood": neighborhood}),
+        "filter_city_date_neighborhood": (
+            filter_url,
+            {"city": city, "date": date, "neighborhood": neighborhood},
+        ),
+    }
+
+
+def measure(client, path, params, rounds):
+    """
+    Times a request.
+
+    Returns:
+        dict: Status, latency percentiles in ms, queries and bytes of one
+        response.
+    """
+    # Aquecimento: índice de facetas, snapshot e caches do Django
+    client.get(path, params)
+
+    samples = []
+    for _ in range(rounds):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(path, params)
+            samples.append(time.perf_counter() - start)
+
+    milliseconds = np.array(samples) * 1000
+    return {
+        "status": response.status_code,
+        "rounds": rounds,
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p90_ms": round(float(np.percentile(milliseconds, 90)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "max_ms": round(float(milliseconds.max()), 3),
+        "queries": len(queries),
+        "bytes": len(response.content),
+    }
+
+
+def run_suite(rounds=20, cases=None):
+    """
+    Benchmarks every case against the current database, with the
+    application cache disabled and then enabled.
+
+    Args:
+        rounds (int): Timed requests per case.
+        cases (dict): The cases, as returned by ``build_cases``.
+
+    Returns:
+        dict: The measurements keyed by case name; "warm_p50_ms" and
+        "warm_queries" come from the run with the cache enabled.
+    """
+    client = Client()
+    cases = cases or build_cases()
+    results = {}
+    for name, (path, params) in cases.items():
+        with override_settings(CACHES=NO_CACHE):
+            results[name] = measure(client, path, params, rounds)
+        warm = measure(client, path, params, rounds)
+        results[name]["warm_p50_ms"] = warm["p50_ms"]
+        results[name]["warm_queries"] = warm["queries"]
+    return results
+
+
+def compare_results(previous, current, threshold=1.2):
+    """
+    Compares the p50 latency, query count and bytes of two benchmark runs.
+
+    Args:
+        previous (dict): The saved results of the baseline run.
+        current (dict): The results of this run.
+        threshold (float): p50 ratio above which a case is a regression.
+
+    Returns:
+        list: One dict per case present in both runs, with the ratios and
+        a "regression" flag.
+    """
+    previous_runs = {run["size"]: run["cases"] for run in previous.get("runs", [])}
+    comparison = []
+    for run in current.get("runs", []):
+        baseline = previous_runs.get(run["size"])
+        if baseline is None:
+            continue
+        for name, result in run["cases"].items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+            comparison.append(
+                {
+                    "size": run["size"],
+                    "case": name,
+                    "p50_ratio": round(ratio, 2),
+                    "queries": (before["queries"], result["queries"]),
+                    "bytes": (before["bytes"], result["bytes"]),
+                    "regression": ratio > threshold or result["queries"] > before["queries"],
+                }
+            )
+    return comparison
@@ -0,0 +1,91 @@
+"""
+Application cache keyed by the data version.
+
+Every entry is stored under the current data version (``get_data_version``),
+which the ingest commands bump after committing. A new version makes every
+older entry unreachable, so nothing is ever invalidated by hand and nothing
+is served stale; old entries simply expire or are culled.
+
+Cold keys are protected against stampedes: within a process, threads
+asking for the same key wait on a striped lock while one of them computes;
+across processes, a short-lived lock entry added with ``cache.add`` lets a
+single worker compute while the others poll for its result.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .versioning import get_data_version
+
+LOCK_TIMEOUT = 10  # Segundos até um cálculo travado deixar de bloquear os demais
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def make_key(*parts):
+    """
+    Builds a cache key from arbitrary parts (accents and spaces included).
+
+    Returns:
+        str: A short key safe for every cache backend.
+    """
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f"{parts[0]}:{digest}"
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the value cached for the current data version, computing and
+    storing it on a miss. Concurrent misses of the same key compute it once.
+
+    Nothing is cached before the first ingest publishes a data version,
+    since there would be no version to invalidate the entries.
+
+    Args:
+        key (str): The cache key, without the version.
+        compute (callable): Builds the value; called without arguments.
+        timeout (int): Expiration in seconds; the backend default if omitted.
+
+    Returns:
+        The cached or computed value.
+    """
+    version = get_data_version()
+    if version == "0":
+        return compute()
+
+    value = cache.get(key, _MISSING, version=version)
+    if value is not _MISSING:
+        return value
+
+    with _locks[hash(key) % len(_locks)]:
+        value = cache.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        acquired = cache.add(lock_key, True, LOCK_TIMEOUT, version=version)
+        while not acquired:
+            # Outro processo está calculando: aguarda o resultado dele
+            time.sleep(POLL_INTERVAL)
+            value = cache.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                break
+            acquired = cache.add(lock_key, True, LOCK_TIMEOUT, version=version)
+
+        try:
+            value = compute()
+            cache.set(key, value, timeout, version=version)
+        finally:
+            # Após o prazo calcula sem o lock: o dele pertence a outro processo
+            if acquired:
+                cache.delete(lock_key, version=version)
+    return value
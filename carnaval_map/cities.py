@@ -0,0 +1,81 @@
+"""City statistics derived from the geocoded blocos."""
+
+from django.db.models import Avg, Count, Max, Min
+
+from .models import Bloco, City
+
+
+def city_stats_query(cities=None):
+    """
+    Builds the grouped query with the coordinate statistics of each city.
+
+    Args:
+        cities (iterable): Restricts the query to these cities; all when None.
+
+    Returns:
+        QuerySet: One row per city with the bounding box, centroid and count.
+    """
+    blocos = Bloco.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    if cities is not None:
+        blocos = blocos.filter(city__in=list(cities))
+    return (
+        blocos.values("city")
+        .order_by("city")
+        .annotate(
+            min_latitude=Min("latitude"),
+            max_latitude=Max("latitude"),
+            min_longitude=Min("longitude"),
+            max_longitude=Max("longitude"),
+            centroid_latitude=Avg("latitude"),
+            centroid_longitude=Avg("longitude"),
+            bloco_count=Count("id"),
+        )
+    )
+
+
+def touched_cities(since):
+    """
+    Returns the cities with blocos created or updated since a moment.
+
+    Args:
+        since (datetime): The start of the current ingest.
+
+    Returns:
+        list: The city slugs.
+    """
+    return list(
+        Bloco.objects.filter(processed_at__gte=since)
+        .values_list("city", flat=True)
+        .order_by("city")
+        .distinct()
+    )
+
+
+def update_city_coordinates(cities=None):
+    """
+    Updates the coordinates and statistics of each city based on the Bloco
+    model, computed with a single grouped query.
+
+    Args:
+        cities (iterable): The cities touched by the current ingest; all
+            cities when None.
+    """
+    stats = {row.pop("city"): row for row in city_stats_query(cities)}
+    existing = City.objects.in_bulk(list(stats), field_name="name")
+
+    for city, row in stats.items():
+        print(f"Processando cidade: {city}")
+
+        # Centro da bounding box, usado pelo mapa ao trocar de cidade
+        row["avg_latitude"] = (row["min_latitude"] + row["max_latitude"]) / 2
+        row["avg_longitude"] = (row["min_longitude"] + row["max_longitude"]) / 2
+
+        if city in existing:
+            City.objects.filter(name=city).update(**row)
+            print(f"🔄 Cidade atualizada: {city} ({row['avg_latitude']}, {row['avg_longitude']})")
+        else:
+            City.objects.create(name=city, **row)
+            print(f"📍 Cidade adicionada: {city} ({row['avg_latitude']}, {row['avg_longitude']})")
+
+    for city in sorted(set(cities or ()) - set(stats)):
+        print(f"Pulando {city}, pois não há coordenadas suficientes.")
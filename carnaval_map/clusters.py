@@ -0,0 +1,91 @@
+"""
+Hierarchical marker clustering, precomputed per zoom level.
+
+Points are projected to Web Mercator and merged zoom by zoom: the clusters of
+zoom ``z`` are built from the clusters of zoom ``z + 1``, grouping those that
+fall in the same grid cell of ``radius`` pixels.
+"""
+
+import math
+
+MIN_ZOOM = 0
+MAX_ZOOM = 16  # Acima deste zoom os blocos são sempre enviados individualmente
+RADIUS = 60  # Raio do cluster, em pixels
+TILE_SIZE = 256
+MAX_LATITUDE = 85.05112878  # Limite da projeção Web Mercator
+
+
+def project(latitude, longitude):
+    """Projects a lat/lng pair to Web Mercator coordinates in [0, 1]."""
+    # Nos polos o log diverge: a projeção só vai até MAX_LATITUDE
+    latitude = min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE)
+    sin = math.sin(math.radians(latitude))
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return longitude / 360 + 0.5, min(max(y, 0), 1)
+
+
+def unproject(x, y):
+    """Converts Web Mercator coordinates in [0, 1] back to lat/lng."""
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return latitude, (x - 0.5) * 360
+
+
+class ClusterTree:
+    """
+    Cluster levels of a set of points, from MAX_ZOOM + 1 (one node per point)
+    down to MIN_ZOOM.
+
+    Each node is a tuple (x, y, count, position), where position is the point
+    position for single-point nodes and None for clusters.
+    """
+
+    def __init__(self, points):
+        """
+        Args:
+            points (iterable): (position, latitude, longitude) tuples. Points
+                without coordinates are skipped.
+        """
+        level = [
+            (*project(latitude, longitude), 1, position)
+            for position, latitude, longitude in points
+            if latitude is not None and longitude is not None
+        ]
+        self.levels = {MAX_ZOOM + 1: level}
+
+        for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+            cell_size = RADIUS / (TILE_SIZE * 2**zoom)
+            buckets = {}
+            for node in level:
+                cell = (math.floor(node[0] / cell_size), math.floor(node[1] / cell_size))
+                buckets.setdefault(cell, []).append(node)
+            level = [self._merge(nodes) for nodes in buckets.values()]
+            self.levels[zoom] = level
+
+    @staticmethod
+    def _merge(nodes):
+        if len(nodes) == 1:
+            return nodes[0]
+        count = sum(node[2] for node in nodes)
+        x = sum(node[0] * node[2] for node in nodes) / count
+        y = sum(node[1] * node[2] for node in nodes) / count
+        return (x, y, count, None)
+
+    def get_nodes(self, zoom, bbox=None):
+        """
+        Returns the nodes of a zoom level, optionally restricted to a bbox.
+
+        Args:
+            zoom (int): The map zoom.
+            bbox (tuple): (south, west, north, east) or None.
+
+        Returns:
+            list: The (x, y, count, position) nodes.
+        """
+        level = self.levels[min(max(zoom, MIN_ZOOM), MAX_ZOOM + 1)]
+        if bbox is None:
+            return level
+
+        south, west, north, east = bbox
+        min_x, max_y = project(south, west)
+        max_x, min_y = project(north, east)
+        return [node for node in level if min_x <= node[0] <= max_x and min_y <= node[1] <= max_y]
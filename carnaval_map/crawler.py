@@ -0,0 +1,327 @@
+"""
+Asyncio crawl engine for blocosderua.com.
+
+City discovery, ``?paged=N`` pagination and event-page fetches run
+concurrently, limited per host by a semaphore. Requests go through a shared
+``requests.Session`` (one connection pool for the whole crawl), executed in
+worker threads so the event loop never blocks. When an ``HttpCache`` is
+given, every fetch is revalidated against it and unchanged listing pages
+reuse their previously parsed links; cache reads and writes also run in
+worker threads.
+"""
+
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .http_cache import CachedPage
+
+BASE_URL = "https://www.blocosderua.com/"
+
+# Respostas que valem uma nova tentativa
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_cities_urls(html, base_url=BASE_URL):
+    """
+    Extracts the city URLs from the city selector of the home page.
+
+    Args:
+        html (str): The home page HTML.
+        base_url (str): The home page URL, which is the São Paulo listing.
+
+    Returns:
+        list: The city URLs, the home page included.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    options = soup.find("select", class_="dms-select").find_all("option")
+    return [option["value"] for option in options if option["value"]] + [base_url]
+
+
+def parse_full_page_url(html, city_url):
+    """
+    Extracts the "see all events" URL of a city page.
+
+    Args:
+        html (str): The city page HTML.
+        city_url (str): The city URL.
+
+    Returns:
+        str: The full listing URL or None if the page has no such button.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    btn_links = [
+        link["href"]
+        for link in soup.find_all("a", class_="btn")
+        if city_url in link.get("href", "")
+    ]
+    return btn_links[0] if btn_links else None
+
+
+def parse_event_links(html):
+    """
+    Extracts the event links of a listing page.
+
+    Args:
+        html (str): The listing page HTML.
+
+    Returns:
+        list: The event page URLs.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    return [
+        link["href"]
+        for link in soup.find_all("a", class_="card")
+        if "programacao/" in link.get("href", "")
+    ]
+
+
+class Crawler:
+    """
+    Concurrent fetcher with per-host limits, timeouts and retry with
+    exponential backoff.
+    """
+
+    def __init__(
+        self,
+        base_url=BASE_URL,
+        per_host_limit=4,
+        timeout=10,
+        retries=3,
+        backoff=0.5,
+        page_window=None,
+        cache=None,
+    ):
+        """
+        Args:
+            base_url (str): The home page of the site.
+            per_host_limit (int): Maximum concurrent requests per host.
+            timeout (float): Timeout of each request, in seconds.
+            retries (int): Extra attempts after a failed request.
+            backoff (float): Base delay between attempts, doubled every retry.
+            page_window (int): Listing pages requested at once while
+                paginating. Defaults to per_host_limit.
+            cache (HttpCache): Optional on-disk cache used to revalidate pages.
+        """
+        self.base_url = base_url
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.page_window = page_window or per_host_limit
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=per_host_limit)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphores = {}
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._semaphores[host]
+
+    def _get(self, url, headers):
+        return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    async def fetch(self, url, headers=None):
+        """
+        Fetches a URL, retrying on network errors and retryable statuses.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (dict): Extra request headers.
+
+        Returns:
+            requests.Response: The last response or None if every attempt
+            failed with a network error.
+        """
+        response = None
+        async with self._semaphore(url):
+            for attempt in range(self.retries + 1):
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.to_thread(self._get, url, headers)
+                except requests.RequestException as e:
+                    print(f"Requests Error ({attempt + 1}/{self.retries + 1}): {e}")
+                    metrics.incr("http.errors")
+                    response = None
+                else:
+                    metrics.incr("http.requests")
+                    metrics.incr(f"http.status.{response.status_code}")
+                    metrics.incr("http.bytes", len(response.content))
+                    if response.status_code not in RETRY_STATUSES:
+                        return response
+                finally:
+                    metrics.observe("http.latency", time.perf_counter() - start)
+
+                if attempt < self.retries:
+                    metrics.incr("http.retries")
+                    await asyncio.sleep(self.backoff * 2**attempt)
+        return response
+
+    async def fetch_page(self, url):
+        """
+        Fetches a page, revalidating it against the cache when there is one.
+
+        Args:
+            url (str): The page URL.
+
+        Returns:
+            CachedPage: The page or None if it could not be fetched.
+        """
+        headers = None
+        if self.cache:
+            headers = await asyncio.to_thread(self.cache.conditional_headers, url)
+        response = await self.fetch(url, headers)
+        if response is None:
+            return None
+
+        if self.cache and response.status_code in (200, 304):
+            return await asyncio.to_thread(self.cache.handle_response, url, response)
+        if response.status_code != 200:
+            return None
+        return CachedPage(url, response.text)
+
+    async def fetch_text(self, url):
+        """
+        Returns the body of a successful response, or None.
+        """
+        page = await self.fetch_page(url)
+        return page.text if page else None
+
+    async def fetch_parsed(self, url, key, parse):
+        """
+        Fetches a page and parses it, reusing the cached result when the page
+        did not change.
+
+        Args:
+            url (str): The page URL.
+            key (str): Name of the parse result in the cache entry.
+            parse (callable): Function taking the HTML.
+
+        Returns:
+            The parse result, or None if the page could not be fetched.
+        """
+        page = await self.fetch_page(url)
+        if page is None:
+            return None
+        if not page.changed and key in page.derived:
+            return page.derived[key]
+
+        result = parse(page.text)
+        if self.cache:
+            await asyncio.to_thread(self.cache.set_derived, url, {**page.derived, key: result})
+        return result
+
+    async def get_cities_urls(self):
+        try:
+            cities_urls = await self.fetch_parsed(
+                self.base_url, "cities", lambda html: parse_cities_urls(html, self.base_url)
+            )
+        except Exception as e:
+            print(f"Error: {e}")
+            return []
+        return cities_urls or []
+
+    async def get_city_full_page_url(self, city_url):
+        return await self.fetch_parsed(
+            city_url, "full_page_url", lambda html: parse_full_page_url(html, city_url)
+        )
+
+    async def get_listing_page_links(self, full_page_url, page):
+        links = await self.fetch_parsed(
+            f"{full_page_url}?paged={page}&data=&bairro=", "event_links", parse_event_links
+        )
+        return links or []
+
+    async def get_city_events_links(self, city_url):
+        """
+        Fetches all event links of a city, requesting ``page_window`` listing
+        pages at a time until an empty page is found.
+
+        Args:
+            city_url (str): The URL of the city.
+
+        Returns:
+            list: The event links, in listing order.
+        """
+        full_page_url = await self.get_city_full_page_url(city_url)
+        if not full_page_url:
+            return []
+
+        print(f"Getting events links from {city_url}")
+        links = []
+        page = 1
+        while True:
+            pages = range(page, page + self.page_window)
+            results = await asyncio.gather(
+                *(self.get_listing_page_links(full_page_url, n) for n in pages)
+            )
+            for page_links in results:
+                if not page_links:
+                    return links
+                links.extend(page_links)
+            page += self.page_window
+
+    async def crawl_events_links(self):
+        """
+        Discovers every city and fetches their event links concurrently.
+
+        Returns:
+            dict: Event links keyed by city URL.
+        """
+        cities_urls = await self.get_cities_urls()
+        results = await asyncio.gather(
+            *(self.get_city_events_links(url) for url in cities_urls)
+        )
+        return dict(zip(cities_urls, results))
+
+    async def fetch_pages(self, urls):
+        """
+        Fetches several pages concurrently.
+
+        Args:
+            urls (list): The page URLs.
+
+        Returns:
+            list: The page bodies (None for failures), in the order of urls.
+        """
+        return await asyncio.gather(*(self.fetch_text(url) for url in urls))
+
+    async def fetch_many(self, urls):
+        """
+        Fetches several pages concurrently, keeping the cache information.
+
+        Args:
+            urls (list): The page URLs.
+
+        Returns:
+            list: CachedPage objects (None for failures), in the order of urls.
+        """
+        return await asyncio.gather(*(self.fetch_page(url) for url in urls))
+
+    def run(self, coroutine):
+        """Runs a crawl coroutine to completion, reporting its duration."""
+        # Semáforos ficam presos ao event loop em que foram usados
+        self._semaphores = {}
+        start = time.perf_counter()
+        result = asyncio.run(coroutine)
+        print(f"Crawl finished in {time.perf_counter() - start:.1f}s")
+        return result
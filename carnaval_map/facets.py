@@ -0,0 +1,309 @@
+"""
+Per-process, immutable in-memory index used to answer the bloco filters
+without querying the database.
+
+The index is built once per data version. Readers keep using the instance
+they already hold while a new version is being built, and the swap is a
+single reference assignment.
+"""
+
+import logging
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from django.utils import timezone
+
+from .clusters import ClusterTree
+from .models import Bloco
+from .serializers import SUMMARY_SOURCE_FIELDS, bloco_json, summarize, summary_fragment
+from .spatial import GridIndex
+from .versioning import get_data_version
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ("city", "event_date", "neighborhood")
+
+
+def _sort_key(value):
+    # None vai para o fim em vez de quebrar a ordenação
+    return (value is None, value)
+
+
+def deep_getsizeof(obj):
+    """
+    Estimates the memory used by an object and everything it references.
+
+    Args:
+        obj: The root object.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(item.__dict__)
+    return size
+
+
+class FacetIndex:
+    """
+    Posting lists of bloco positions keyed by city, event_date and
+    neighborhood, plus the facet values and counts of every city.
+
+    Positions follow the (event_date, id) order, so sorting a set of positions
+    gives the blocos in the same order as the database query. ``values`` keeps
+    the fields read from the database, ``rows`` the summaries returned to
+    the client and ``fragments`` their JSON, built from the stored
+    ``summary_json``.
+    """
+
+    def __init__(self, version, values):
+        self.version = version
+        values = tuple(values)
+        self.fragments = tuple(
+            bloco_json(row["id"], row.pop("summary_json", "") or summary_fragment(row))
+            for row in values
+        )
+        self.values = values
+        self.rows = tuple(summarize(row) for row in self.values)
+        self.position_by_id = {row["id"]: position for position, row in enumerate(self.values)}
+
+        postings = {field: {} for field in FACET_FIELDS}
+        for position, row in enumerate(self.values):
+            for field in FACET_FIELDS:
+                postings[field].setdefault(row[field], []).append(position)
+        self.postings = {
+            field: {value: frozenset(positions) for value, positions in values.items()}
+            for field, values in postings.items()
+        }
+        self.counts = {
+            field: {value: len(positions) for value, positions in values.items()}
+            for field, values in self.postings.items()
+        }
+
+        # Facetas pré-calculadas para "todas as cidades" e para cada cidade
+        self.city_facets = {"": self._compute_facets(range(len(self.values)))}
+        for city, positions in self.postings["city"].items():
+            self.city_facets[city] = self._compute_facets(positions)
+
+        self.grid = GridIndex(
+            (position, row["latitude"], row["longitude"])
+            for position, row in enumerate(self.values)
+        )
+
+        # Clusters de cada fatia cidade/data, calculados uma vez por versão.
+        # O dicionário não muda depois daqui: leitores concorrentes dispensam lock.
+        self.cluster_trees = {
+            (city, date): self._build_cluster_tree(self.filter(city, date))
+            for city in ["", *self.postings["city"]]
+            for date in [None] + [value for value, _ in self.city_facets[city]["dates"]]
+        }
+
+        # Fatias "a partir de" (since), usadas por padrão pelo mapa. A chave é a
+        # primeira data existente >= since, então há no máximo uma árvore por
+        # cidade/data. A de hoje já sai pronta; as demais são criadas no uso.
+        self.dates_by_city = {
+            city: [value for value, _ in facets["dates"] if value]
+            for city, facets in self.city_facets.items()
+        }
+        self.upcoming_trees = {}
+        self._upcoming_lock = threading.Lock()
+        today = timezone.localdate()
+        for city in self.city_facets:
+            self._upcoming_tree(city, today)
+
+        self.memory_bytes = deep_getsizeof(self)
+
+    @classmethod
+    def build(cls, version):
+        """
+        Loads every Bloco in a single query and indexes it.
+
+        Args:
+            version (str): The data version the index represents.
+
+        Returns:
+            FacetIndex: The new index.
+        """
+        values = Bloco.objects.values(*SUMMARY_SOURCE_FIELDS, "summary_json").order_by(
+            "event_date", "id"
+        )
+        return cls(version, values)
+
+    def _compute_facets(self, positions):
+        dates = Counter(self.values[position]["event_date"] for position in positions)
+        neighborhoods = Counter(self.values[position]["neighborhood"] for position in positions)
+        return {
+            "dates": sorted(dates.items(), key=lambda item: _sort_key(item[0])),
+            "neighborhoods": sorted(neighborhoods.items(), key=lambda item: _sort_key(item[0])),
+        }
+
+    def filter(self, city="", date=None, neighborhood="", bbox=None):
+        """
+        Intersects the posting lists of the given filters.
+
+        Args:
+            city (str): The city slug or "" for all cities.
+            date (date): The event date or None for all dates.
+            neighborhood (str): The neighborhood or "" for all neighborhoods.
+            bbox (tuple): (south, west, north, east) or None for the whole map.
+
+        Returns:
+            list: The matching positions, in (event_date, id) order.
+        """
+        postings = []
+        if bbox:
+            postings.append(self.grid.query(*bbox))
+        if city:
+            postings.append(self.postings["city"].get(city, frozenset()))
+        if date:
+            postings.append(self.postings["event_date"].get(date, frozenset()))
+        if neighborhood:
+            postings.append(self.postings["neighborhood"].get(neighborhood, frozenset()))
+
+        if not postings:
+            return list(range(len(self.values)))
+
+        postings.sort(key=len)
+        return sorted(postings[0].intersection(*postings[1:]))
+
+    def facets(self, positions, city="", date=None, neighborhood=""):
+        """
+        Returns the date and neighborhood facets (value, count) of a result.
+
+        City-only filters reuse the precomputed facets.
+        """
+        if not date and not neighborhood and city in self.city_facets:
+            return self.city_facets[city]
+        return self._compute_facets(positions)
+
+    def filter_response(self, city="", date=None, neighborhood=""):
+        """
+        Returns the parts of the filter response: the JSON of the matching
+        blocos, the (date, label) pairs and the neighborhoods of the result.
+        """
+        positions = self.filter(city, date, neighborhood)
+        facets = self.facets(positions, city, date, neighborhood)
+        dates = [
+            (value, value.strftime("%d/%m/%Y")) for value, _ in facets["dates"] if value
+        ]
+        neighborhoods = [neighborhood for neighborhood, _ in facets["neighborhoods"]]
+        return self.blocos_json(positions), dates, neighborhoods
+
+    def cluster_tree(self, city="", date=None, neighborhood="", since=None):
+        """
+        Returns the cluster tree of a filter slice.
+
+        City and city/date slices come from the trees built with the index,
+        and city/``since`` slices are stored once per existing date. Other
+        slices (neighborhoods, unknown values) are computed on each call and
+        never stored, so client input cannot grow the index.
+
+        Args:
+            city (str): The city slug or "" for all cities.
+            date (date): The event date or None for all dates.
+            neighborhood (str): The neighborhood or "" for all neighborhoods.
+            since (date): Only blocos on or after this date, or None for all.
+
+        Returns:
+            ClusterTree: The clusters of the slice.
+        """
+        if not neighborhood and since is not None and city in self.city_facets:
+            if date is None:
+                return self._upcoming_tree(city, since)
+            if date < since:
+                return self._build_cluster_tree([])
+            since = None
+        if not neighborhood and since is None:
+            tree = self.cluster_trees.get((city, date))
+            if tree is not None:
+                return tree
+
+        positions = self.filter(city, date, neighborhood)
+        if since is not None:
+            positions = [
+                position
+                for position in positions
+                if self.values[position]["event_date"]
+                and self.values[position]["event_date"] >= since
+            ]
+        return self._build_cluster_tree(positions)
+
+    def _upcoming_tree(self, city, since):
+        dates = self.dates_by_city[city]
+        start = bisect_left(dates, since)
+        key = (city, dates[start] if start < len(dates) else None)
+        tree = self.upcoming_trees.get(key)
+        if tree is not None:
+            return tree
+
+        with self._upcoming_lock:
+            tree = self.upcoming_trees.get(key)
+            if tree is None:
+                postings = self.postings["event_date"]
+                positions = set().union(*(postings[value] for value in dates[start:]))
+                if city:
+                    positions &= self.postings["city"][city]
+                tree = self._build_cluster_tree(sorted(positions))
+                self.upcoming_trees[key] = tree
+        return tree
+
+    def _build_cluster_tree(self, positions):
+        return ClusterTree(
+            (position, self.values[position]["latitude"], self.values[position]["longitude"])
+            for position in positions
+        )
+
+    def blocos(self, positions):
+        return [self.rows[position] for position in positions]
+
+    def blocos_json(self, positions):
+        return [self.fragments[position] for position in positions]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_facet_index():
+    """
+    Returns the index of the current data version, rebuilding it when the
+    version changed.
+
+    Returns:
+        FacetIndex: The current index.
+    """
+    global _index
+
+    version = get_data_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or index.version != version:
+            index = FacetIndex.build(version)
+            _index = index
+            logger.info(
+                "Facet index built for version %s: %d blocos, %.1f KiB",
+                version,
+                len(index.rows),
+                index.memory_bytes / 1024,
+            )
+    return index
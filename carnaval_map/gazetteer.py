@@ -0,0 +1,204 @@
+"""
+Offline gazetteer built from the blocos that are already geocoded.
+
+Recurring blocos parade on the same streets and squares every year, so most
+new addresses are already known. The gazetteer indexes, per city, the
+normalized addresses, the street/venue names (without house numbers) and
+the neighborhood centroids. New addresses are resolved by exact match on
+the address, then on the street, then by fuzzy match on the street name;
+the neighborhood centroid is the last resort when the API also fails.
+
+Matching runs on whole batches: exact matches are pandas merges and fuzzy
+matches compare hashed character-trigram vectors with one matrix product
+per city.
+"""
+
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .geocoding import normalize_text
+from .models import Bloco
+
+# Similaridade mínima (cosseno dos trigramas) para aceitar um nome de rua parecido
+FUZZY_THRESHOLD = 0.86
+TRIGRAM_DIMENSIONS = 4096
+
+ABBREVIATIONS = {
+    "r": "rua",
+    "av": "avenida",
+    "pca": "praca",
+    "pc": "praca",
+    "al": "alameda",
+    "est": "estrada",
+    "tv": "travessa",
+    "trav": "travessa",
+    "rod": "rodovia",
+    "lgo": "largo",
+    "lg": "largo",
+    "cel": "coronel",
+    "gen": "general",
+    "dr": "doutor",
+    "prof": "professor",
+    "sto": "santo",
+    "sta": "santa",
+}
+STREET_TYPES = {"rua", "avenida", "praca", "alameda", "estrada", "travessa", "rodovia", "largo"}
+NUMBER_RE = re.compile(r"\b\w*\d\w*\b|\bs ?n\b")
+
+
+def street_key(address):
+    """
+    Reduces an address to its street or venue name: normalized, with the
+    common abbreviations expanded and the house numbers removed.
+
+    Args:
+        address (str): The textual address.
+
+    Returns:
+        str: The street key, e.g. "rua harmonia" for "R. Harmonia 67", or
+        an empty string when nothing but the street type is left.
+    """
+    text = NUMBER_RE.sub(" ", normalize_text(address))
+    tokens = [ABBREVIATIONS.get(token, token) for token in text.split()]
+    if all(token in STREET_TYPES for token in tokens):
+        return ""
+    return " ".join(tokens)
+
+
+def trigram_vectors(keys):
+    """
+    Builds L2-normalized hashed character-trigram vectors.
+
+    Args:
+        keys (list): The strings.
+
+    Returns:
+        numpy.ndarray: One row per key.
+    """
+    rows, columns = [], []
+    for row, key in enumerate(keys):
+        padded = f"  {key} "
+        for start in range(len(padded) - 2):
+            rows.append(row)
+            columns.append(zlib.crc32(padded[start : start + 3].encode()) % TRIGRAM_DIMENSIONS)
+
+    matrix = np.zeros((len(keys), TRIGRAM_DIMENSIONS), dtype=np.float32)
+    np.add.at(matrix, (rows, columns), 1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class Gazetteer:
+    """
+    Address, street and neighborhood index of the geocoded blocos.
+    """
+
+    def __init__(self, frame):
+        """
+        Args:
+            frame (pandas.DataFrame): Columns city, address, neighborhood,
+                latitude and longitude of geocoded blocos.
+        """
+        frame = frame.dropna(subset=["latitude", "longitude"]).copy()
+        frame["key"] = frame["address"].map(normalize_text)
+        frame["street"] = frame["address"].map(street_key)
+        frame["neighborhood"] = frame["neighborhood"].map(normalize_text)
+
+        # Mediana: robusta a uma ou outra geocodificação errada
+        coords = ["latitude", "longitude"]
+        self.addresses = frame.groupby(["city", "key"], as_index=False)[coords].median()
+        streets = frame[frame["street"] != ""]
+        self.streets = streets.groupby(["city", "street"], as_index=False)[coords].median()
+        neighborhoods = frame[frame["neighborhood"] != ""]
+        neighborhoods = neighborhoods.groupby(["city", "neighborhood"])[coords].median()
+        self.neighborhoods = {
+            key: (float(row.latitude), float(row.longitude))
+            for key, row in neighborhoods.iterrows()
+        }
+
+        self._street_vectors = {
+            city: (trigram_vectors(list(rows["street"])), rows[coords].to_numpy())
+            for city, rows in self.streets.groupby("city")
+        }
+
+    @classmethod
+    def build(cls):
+        """
+        Builds the gazetteer from the blocos geocoded by the provider. Blocos
+        placed by the gazetteer itself or at a neighborhood centroid are left
+        out, so a guess never becomes an exact match.
+
+        Returns:
+            Gazetteer: The index.
+        """
+        values = Bloco.objects.filter(
+            geocode_source=Bloco.PROVIDER, latitude__isnull=False, longitude__isnull=False
+        ).values("city", "address", "neighborhood", "latitude", "longitude")
+        columns = ["city", "address", "neighborhood", "latitude", "longitude"]
+        return cls(pd.DataFrame.from_records(list(values), columns=columns))
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def resolve_many(self, addresses):
+        """
+        Resolves addresses without calling any provider.
+
+        Args:
+            addresses (list): (city, address) pairs.
+
+        Returns:
+            dict: (coords, method) keyed by the resolved (city, address)
+            pairs, where method is "address", "street" or "fuzzy".
+        """
+        if not addresses or not len(self.addresses):
+            return {}
+
+        queries = pd.DataFrame(addresses, columns=["city", "address"]).drop_duplicates()
+        queries["key"] = queries["address"].map(normalize_text)
+        queries["street"] = queries["address"].map(street_key)
+
+        resolved = {}
+
+        def collect(matches, method):
+            for row in matches.itertuples(index=False):
+                coords = (float(row.latitude), float(row.longitude))
+                resolved[(row.city, row.address)] = (coords, method)
+            matched = set(zip(matches["city"], matches["address"]))
+            pairs = zip(queries["city"], queries["address"])
+            return queries[np.array([pair not in matched for pair in pairs], dtype=bool)]
+
+        queries = collect(queries.merge(self.addresses, on=["city", "key"]), "address")
+        queries = queries[queries["street"] != ""]
+        queries = collect(queries.merge(self.streets, on=["city", "street"]), "street")
+
+        for city, pending in queries.groupby("city"):
+            if city not in self._street_vectors:
+                continue
+            vectors, coords = self._street_vectors[city]
+            similarity = trigram_vectors(list(pending["street"])) @ vectors.T
+            best = similarity.argmax(axis=1)
+            accepted = similarity[np.arange(len(best)), best] >= FUZZY_THRESHOLD
+
+            for address, index in zip(pending["address"][accepted], best[accepted]):
+                latitude, longitude = coords[index]
+                resolved[(city, address)] = ((float(latitude), float(longitude)), "fuzzy")
+
+        return resolved
+
+    def neighborhood_centroid(self, city, neighborhood):
+        """
+        Returns the centroid of the geocoded blocos of a neighborhood.
+
+        Args:
+            city (str): The city slug.
+            neighborhood (str): The neighborhood name.
+
+        Returns:
+            tuple: (latitude, longitude) or None if the neighborhood is unknown.
+        """
+        return self.neighborhoods.get((city, normalize_text(neighborhood)))
@@ -0,0 +1,432 @@
+"""
+Geocoding with a persistent cache keyed by the normalized "city + address".
+
+Blocos that share a street or a square, as recurring blocos do year after
+year, are geocoded once: the cache is consulted before any API call,
+addresses are deduplicated within a batch, failed lookups are cached for a
+shorter time (negative caching) and network errors are not cached at all.
+
+Providers implement the Geocoder interface. RateLimitedGeocoder runs the
+lookups of a batch concurrently under a token bucket, so the throughput
+follows the provider's quota instead of a fixed sleep between requests.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import googlemaps
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+from .models import Bloco, GeocodeCache
+
+STATUS_OK = "OK"
+STATUS_ZERO_RESULTS = "ZERO_RESULTS"
+STATUS_OVER_QUERY_LIMIT = "OVER_QUERY_LIMIT"
+STATUS_ERROR = "ERROR"  # Falha de rede/provedor: nunca vai para o cache
+
+# Limite de parâmetros por consulta "IN" no SQLite
+CACHE_LOOKUP_BATCH_SIZE = 500
+
+
+def geocoding_address(city, address):
+    """
+    Builds the address sent to the geocoder.
+
+    Args:
+        city (str): The city slug.
+        address (str): The textual address.
+
+    Returns:
+        str: The full address.
+    """
+    return f"Brasil, {city.replace('-', ' ')}, {address}"
+
+
+def normalize_text(value):
+    """
+    Removes accents, case, punctuation and repeated spaces from a text.
+
+    Args:
+        value (str): The text.
+
+    Returns:
+        str: The normalized text.
+    """
+    text = unicodedata.normalize("NFKD", value or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return re.sub(r"[^\w]+", " ", text).strip()
+
+
+def normalize_address(city, address):
+    """
+    Builds the cache key of an address: accents, case, punctuation and
+    repeated spaces do not matter.
+
+    Args:
+        city (str): The city slug.
+        address (str): The textual address.
+
+    Returns:
+        str: The normalized "city|address" key.
+    """
+    return f"{city}|{normalize_text(address)}"
+
+
+class Geocoder:
+    """
+    Interface of a geocoding provider.
+
+    Subclasses implement lookup(), which receives the full address and returns
+    (status, coords), where coords is a (latitude, longitude) tuple or None.
+    """
+
+    def lookup(self, address):
+        raise NotImplementedError
+
+    def lookup_many(self, addresses):
+        """
+        Looks up several addresses.
+
+        Args:
+            addresses (list): Full addresses.
+
+        Returns:
+            dict: (status, coords) keyed by address.
+        """
+        return {address: self.lookup(address) for address in addresses}
+
+
+class GoogleMapsGeocoder(Geocoder):
+    """
+    Geocoder backed by the Google Maps Geocoding API.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._client = None
+
+    @property
+    def client(self):
+        # Criado no primeiro uso para que o módulo funcione sem API key.
+        # O rate limit e os retries ficam com o RateLimitedGeocoder.
+        if self._client is None:
+            self._client = googlemaps.Client(
+                key=self.key, retry_over_query_limit=False, queries_per_second=1000
+            )
+        return self._client
+
+    def lookup(self, address):
+        try:
+            geocode_result = self.client.geocode(address)
+        except googlemaps.exceptions.ApiError as e:
+            if e.status in (STATUS_OVER_QUERY_LIMIT, STATUS_ZERO_RESULTS):
+                return e.status, None
+            print(f"Erro ao buscar {address}: {e}")
+            return STATUS_ERROR, None
+        except Exception as e:
+            print(f"Erro ao buscar {address}: {e}")
+            return STATUS_ERROR, None
+
+        if not geocode_result:
+            return STATUS_ZERO_RESULTS, None
+        location = geocode_result[0]["geometry"]["location"]
+        return STATUS_OK, (location["lat"], location["lng"])
+
+
+class FakeGeocoder(Geocoder):
+    """
+    Local provider for tests and benchmarks: answers from a dict, optionally
+    with a fixed latency and a number of OVER_QUERY_LIMIT answers up front.
+    """
+
+    def __init__(self, results=None, latency=0, over_query_limit=0):
+        """
+        Args:
+            results (dict): Coordinates keyed by full address; other
+                addresses answer ZERO_RESULTS.
+            latency (float): Seconds spent on each lookup.
+            over_query_limit (int): How many of the first lookups are refused.
+        """
+        self.results = results or {}
+        self.latency = latency
+        self.over_query_limit = over_query_limit
+
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, address):
+        with self._lock:
+            self.calls.append(address)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            refused = self.over_query_limit > 0
+            if refused:
+                self.over_query_limit -= 1
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if refused:
+                return STATUS_OVER_QUERY_LIMIT, None
+            coords = self.results.get(address)
+            if coords is None:
+                return STATUS_ZERO_RESULTS, None
+            return STATUS_OK, coords
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills `rate` tokens per second up to `burst`.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (int): Bucket capacity, i.e. requests allowed back to back.
+            clock (callable): Monotonic clock, replaceable in tests.
+            sleep (callable): Sleep function, replaceable in tests.
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, waiting until it is available.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class RateLimitedGeocoder(Geocoder):
+    """
+    Runs lookups concurrently under a token bucket and retries with
+    exponential backoff when the provider answers OVER_QUERY_LIMIT.
+    """
+
+    def __init__(self, geocoder, rate=None, burst=None, workers=None, retries=3, backoff=1.0):
+        """
+        Args:
+            geocoder (Geocoder): The wrapped provider.
+            rate (float): Requests per second.
+            burst (int): Requests allowed back to back.
+            workers (int): Maximum lookups in flight.
+            retries (int): Extra attempts after OVER_QUERY_LIMIT.
+            backoff (float): Base delay of the retries, in seconds.
+        """
+        self.geocoder = geocoder
+        self.bucket = TokenBucket(
+            rate or settings.GEOCODE_RATE_LIMIT, burst or settings.GEOCODE_BURST
+        )
+        self.workers = workers or settings.GEOCODE_WORKERS
+        self.retries = retries
+        self.backoff = backoff
+        self.throttled = 0
+
+    def lookup(self, address):
+        for attempt in range(self.retries + 1):
+            metrics.observe("geocode.rate_wait", self.bucket.acquire())
+            with metrics.timer("geocode.latency"):
+                status, coords = self.geocoder.lookup(address)
+            metrics.incr(f"geocode.status.{status}")
+            if status != STATUS_OVER_QUERY_LIMIT:
+                return status, coords
+            self.throttled += 1
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2**attempt)
+
+        print(f"Limite de consultas excedido para: {address}")
+        return STATUS_ERROR, None
+
+    def lookup_many(self, addresses):
+        if len(addresses) <= 1:
+            return super().lookup_many(addresses)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return dict(zip(addresses, executor.map(self.lookup, addresses)))
+
+
+class CachedGeocoder:
+    """
+    Puts the GeocodeCache table in front of a Geocoder.
+    """
+
+    def __init__(self, geocoder, ttl=None, negative_ttl=None, gazetteer=None):
+        """
+        Args:
+            geocoder (Geocoder): The provider used for cache misses.
+            ttl (timedelta): How long a successful result stays valid.
+            negative_ttl (timedelta): How long a ZERO_RESULTS answer stays valid.
+            gazetteer (Gazetteer): Offline index consulted before the provider.
+        """
+        self.geocoder = geocoder
+        self.gazetteer = gazetteer
+        self.ttl = ttl or timedelta(days=settings.GEOCODE_CACHE_TTL_DAYS)
+        self.negative_ttl = negative_ttl or timedelta(days=settings.GEOCODE_NEGATIVE_TTL_DAYS)
+
+        self.requested = 0
+        self.unique = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.gazetteer_hits = 0
+        self.api_calls = 0
+
+    def _is_fresh(self, entry, now):
+        ttl = self.ttl if entry.status == STATUS_OK else self.negative_ttl
+        return now - entry.updated_at < ttl
+
+    def _load(self, keys):
+        entries = {}
+        for start in range(0, len(keys), CACHE_LOOKUP_BATCH_SIZE):
+            batch = keys[start : start + CACHE_LOOKUP_BATCH_SIZE]
+            entries.update(
+                (entry.key, entry) for entry in GeocodeCache.objects.filter(key__in=batch)
+            )
+        return entries
+
+    def _store(self, key, status, coords):
+        latitude, longitude = coords or (None, None)
+        GeocodeCache.objects.update_or_create(
+            key=key,
+            defaults={"status": status, "latitude": latitude, "longitude": longitude},
+        )
+
+    def geocode_many(self, addresses, with_sources=False):
+        """
+        Geocodes a batch of addresses, calling the provider once per unique
+        address missing from the cache. The misses and the cached ZERO_RESULTS
+        are first looked up in the gazetteer; the remaining misses are sent to
+        the provider as a single batch.
+
+        Args:
+            addresses (list): (city, address) pairs.
+            with_sources (bool): Also returns where each coordinate came from
+                (Bloco.PROVIDER or Bloco.GAZETTEER, None when not found).
+
+        Returns:
+            dict: Coordinates (or None) keyed by (city, address), or
+                (coordinates, source) pairs when with_sources is set.
+        """
+        pairs_by_key = {}
+        for city, address in addresses:
+            pairs_by_key.setdefault(normalize_address(city, address), (city, address))
+        self.requested += len(addresses)
+        self.unique += len(pairs_by_key)
+
+        now = timezone.now()
+        entries = self._load(list(pairs_by_key))
+        coords_by_key = {}
+        gazetteer_keys = set()
+        missing = {}
+        unresolved = []
+
+        for key, (city, address) in pairs_by_key.items():
+            entry = entries.get(key)
+            if entry is not None and self._is_fresh(entry, now):
+                if entry.status == STATUS_OK:
+                    self.hits += 1
+                    metrics.incr("geocode.cache_hits")
+                    coords_by_key[key] = (entry.latitude, entry.longitude)
+                else:
+                    self.negative_hits += 1
+                    metrics.incr("geocode.negative_hits")
+                    coords_by_key[key] = None
+                    unresolved.append(key)
+                continue
+            missing[key] = (city, address)
+
+        if self.gazetteer is not None:
+            # Não vai para o GeocodeCache: é recalculado a cada execução
+            pairs = list(missing.values()) + [pairs_by_key[key] for key in unresolved]
+            for pair, (coords, _) in self.gazetteer.resolve_many(pairs).items():
+                key = normalize_address(*pair)
+                coords_by_key[key] = coords
+                gazetteer_keys.add(key)
+                missing.pop(key, None)
+                self.gazetteer_hits += 1
+                metrics.incr("geocode.gazetteer_hits")
+
+        full_addresses = {geocoding_address(*pair): key for key, pair in missing.items()}
+        results = self.geocoder.lookup_many(list(full_addresses))
+        self.api_calls += len(full_addresses)
+        metrics.incr("geocode.api_calls", len(full_addresses))
+        for full_address, key in full_addresses.items():
+            status, coords = results[full_address]
+            if status != STATUS_ERROR:
+                self._store(key, status, coords)
+            coords_by_key[key] = coords
+
+        if not with_sources:
+            return {
+                (city, address): coords_by_key[normalize_address(city, address)]
+                for city, address in addresses
+            }
+
+        results = {}
+        for city, address in addresses:
+            key = normalize_address(city, address)
+            coords = coords_by_key[key]
+            if coords is None:
+                source = None
+            elif key in gazetteer_keys:
+                source = Bloco.GAZETTEER
+            else:
+                source = Bloco.PROVIDER
+            results[(city, address)] = (coords, source)
+        return results
+
+    def geocode(self, city, address):
+        """
+        Geocodes a single address through the cache.
+
+        Returns:
+            tuple: (latitude, longitude) or None.
+        """
+        return self.geocode_many([(city, address)])[(city, address)]
+
+    def stats(self):
+        """
+        Returns the counters of this run.
+
+        Returns:
+            dict: requested, unique, hits, negative_hits, gazetteer_hits,
+            api_calls and hit_rate (cached answers over unique addresses).
+        """
+        cached = self.hits + self.negative_hits
+        return {
+            "requested": self.requested,
+            "unique": self.unique,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "gazetteer_hits": self.gazetteer_hits,
+            "api_calls": self.api_calls,
+            "hit_rate": round(cached / self.unique, 3) if self.unique else 0.0,
+        }
@@ -0,0 +1,229 @@
+"""
+Persistent on-disk HTTP cache for the scraper.
+
+Bodies are stored as files keyed by a hash of the URL, and the metadata
+(validators, body hash, size, last access and data derived from the body)
+lives in a small SQLite index next to them. Later runs revalidate with
+If-None-Match/If-Modified-Since, and callers can skip re-parsing pages whose
+body did not change.
+
+Every method does blocking disk and SQLite I/O behind a lock; async callers
+run them with ``asyncio.to_thread`` so other fetches keep going meanwhile.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import metrics
+
+
+@dataclass
+class CachedPage:
+    """A fetched page and whether its body changed since the last run."""
+
+    url: str
+    text: str
+    changed: bool = True
+    derived: dict = field(default_factory=dict)
+
+
+class HttpCache:
+    """
+    URL-keyed response cache with LRU eviction under a size cap.
+    """
+
+    def __init__(self, root, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            root (Path): Directory holding the bodies and the index.
+            max_bytes (int): Maximum total size of the stored bodies.
+        """
+        self.root = Path(root)
+        self.bodies_dir = self.root / "bodies"
+        self.bodies_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self.hits = 0  # 304: corpo reaproveitado do disco
+        self.unchanged = 0  # 200 com o mesmo conteúdo já armazenado
+        self.misses = 0  # conteúdo novo ou alterado
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite3", check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                derived TEXT NOT NULL DEFAULT '{}'
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._db.commit()
+        # Total dos corpos mantido em memória: a evicção não precisa somar a tabela
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _body_path(self, url):
+        return self.bodies_dir / hashlib.sha256(url.encode()).hexdigest()
+
+    def _lookup(self, url):
+        row = self._db.execute(
+            "SELECT etag, last_modified, body_hash, size, derived FROM entries WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, size, derived = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "body_hash": body_hash,
+            "size": size,
+            "derived": json.loads(derived),
+            "exists": self._body_path(url).exists(),
+        }
+
+    def conditional_headers(self, url):
+        """
+        Returns the revalidation headers for a cached URL.
+
+        Args:
+            url (str): The URL about to be requested.
+
+        Returns:
+            dict: If-None-Match/If-Modified-Since headers (empty if not cached).
+        """
+        with self._lock:
+            entry = self._lookup(url)
+        if entry is None or not entry["exists"]:
+            return {}
+
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def handle_response(self, url, response):
+        """
+        Resolves a response against the cache, storing new bodies.
+
+        Args:
+            url (str): The requested URL.
+            response (requests.Response): A 200 or 304 response.
+
+        Returns:
+            CachedPage: The page, or None for a 304 whose body is gone.
+        """
+        with self._lock:
+            entry = self._lookup(url)
+            now = time.time()
+
+            if response.status_code == 304:
+                if entry is None or not entry["exists"]:
+                    return None
+                self.hits += 1
+                metrics.incr("http_cache.hits")
+                self._touch(url, now)
+                text = self._body_path(url).read_bytes().decode()
+                return CachedPage(url, text, changed=False, derived=entry["derived"])
+
+            body = response.text.encode()
+            body_hash = hashlib.sha256(body).hexdigest()
+            if entry is not None and entry["exists"] and entry["body_hash"] == body_hash:
+                self.unchanged += 1
+                metrics.incr("http_cache.unchanged")
+                self._db.execute(
+                    "UPDATE entries SET etag = ?, last_modified = ?, accessed_at = ? WHERE url = ?",
+                    (response.headers.get("ETag"), response.headers.get("Last-Modified"), now, url),
+                )
+                self._db.commit()
+                return CachedPage(url, response.text, changed=False, derived=entry["derived"])
+
+            self.misses += 1
+            metrics.incr("http_cache.misses")
+            self._body_path(url).write_bytes(body)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(url, etag, last_modified, body_hash, size, accessed_at, derived) "
+                "VALUES (?, ?, ?, ?, ?, ?, '{}')",
+                (
+                    url,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    body_hash,
+                    len(body),
+                    now,
+                ),
+            )
+            self._db.commit()
+            self._total += len(body) - (entry["size"] if entry is not None else 0)
+            self._evict()
+            return CachedPage(url, response.text, changed=True)
+
+    def set_derived(self, url, derived):
+        """
+        Stores data parsed from a page so unchanged pages need no re-parse.
+
+        Args:
+            url (str): The page URL.
+            derived (dict): JSON-serializable parse results.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET derived = ? WHERE url = ?", (json.dumps(derived), url)
+            )
+            self._db.commit()
+
+    def _touch(self, url, now):
+        self._db.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (now, url))
+        self._db.commit()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+
+        rows = self._db.execute("SELECT url, size FROM entries ORDER BY accessed_at")
+        evicted = []
+        for url, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            evicted.append(url)
+            self._total -= size
+        for url in evicted:
+            self._body_path(url).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self.evictions += 1
+            metrics.incr("http_cache.evictions")
+        self._db.commit()
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this run.
+
+        Returns:
+            dict: hits, unchanged, misses, evictions and hit_rate.
+        """
+        requests = self.hits + self.unchanged + self.misses
+        return {
+            "hits": self.hits,
+            "unchanged": self.unchanged,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.unchanged) / requests, 3) if requests else 0.0,
+        }
@@ -0,0 +1,19 @@
+"""Steps shared by every command that changes the published blocos."""
+
+from .shards import export_shards
+from .snapshot import build_snapshot
+from .versioning import bump_data_version
+
+
+def finish_ingest():
+    """
+    Publishes the data committed by an ingest: bumps the data version,
+    exports the static filter shards and rebuilds the snapshot served to the
+    index page.
+
+    Returns:
+        str: The new data version.
+    """
+    version = bump_data_version()
+    build_snapshot(shards=export_shards())
+    return version
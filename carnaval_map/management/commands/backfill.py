@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from carnaval_map.backfill import EXTRACTORS, get_extractors, run_backfill
+from carnaval_map.ingest import finish_ingest
+
+
+class Command(BaseCommand):
+    help = "Recalcula campos derivados dos blocos (bairro, horário, dia da semana, resumo JSON)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "extractors",
+            nargs="*",
+            help=f"Extratores a executar, na ordem de registro: {', '.join(EXTRACTORS)}.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="Linhas lidas e gravadas por lote."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Conta as alterações sem gravá-las."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            extractors = get_extractors(options["extractors"])
+        except KeyError as e:
+            raise CommandError(f"Extrator desconhecido: {e.args[0]}")
+
+        self.stdout.write(f"Extratores: {', '.join(e.name for e in extractors)}")
+        result = run_backfill(
+            [extractor.name for extractor in extractors],
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+            progress=self.report_progress,
+        )
+
+        for field, count in sorted(result.changes.items()):
+            self.stdout.write(f"  {field}: {count}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"{result.updated} registros seriam corrigidos (dry-run).")
+            return
+
+        if result.updated:
+            finish_ingest()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{result.updated} registros corrigidos em {result.seconds:.2f}s "
+                f"({result.rows_per_second:.0f} linhas/s)."
+            )
+        )
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"{result.scanned} linhas lidas, {result.updated} alteradas "
+            f"({result.rows_per_second:.0f} linhas/s)"
+        )
@@ -0,0 +1,181 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from carnaval_map.benchmarks import (
+    build_cases,
+    compare_results,
+    representative_filters,
+    run_suite,
+)
+from carnaval_map.ingest import finish_ingest
+from carnaval_map.models import Bloco
+from carnaval_map.synthetic import clear_dataset, generate_dataset
+
+
+def parse_sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(",") if size.strip()]
+    except ValueError:
+        raise CommandError(f"Tamanhos inválidos: {value}")
+    if not sizes or min(sizes) < 1:
+        raise CommandError(f"Tamanhos inválidos: {value}")
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p90/p99), consultas e bytes da página inicial e dos filtros "
+        "com datasets sintéticos de vários tamanhos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000,100000",
+            help="Tamanhos dos datasets, separados por vírgula.",
+        )
+        parser.add_argument("--cities", type=int, default=9, help="Quantidade de cidades.")
+        parser.add_argument(
+            "--neighborhoods", type=int, default=40, help="Bairros por cidade."
+        )
+        parser.add_argument(
+            "--skew", type=float, default=1.0, help="Expoente Zipf da concentração por bairro."
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Semente aleatória.")
+        parser.add_argument(
+            "--rounds", type=int, default=20, help="Requisições medidas por caso."
+        )
+        parser.add_argument("--output", help="Arquivo JSON onde salvar os resultados.")
+        parser.add_argument(
+            "--compare", help="Resultados JSON de uma execução anterior para comparar."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.2,
+            help="Razão de p50 acima da qual um caso é considerado regressão.",
+        )
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            "--current",
+            action="store_true",
+            help="Mede os dados atuais do banco, sem gerar dados sintéticos.",
+        )
+        mode.add_argument(
+            "--in-place",
+            action="store_true",
+            help=(
+                "Gera os dados sintéticos no banco atual (removidos ao final) em vez de "
+                "um banco de teste descartável."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        previous = None
+        if options["compare"]:
+            try:
+                previous = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Não foi possível ler {options['compare']}: {e}")
+
+        results = {
+            "started_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "rounds": options["rounds"],
+            "cities": options["cities"],
+            "neighborhoods": options["neighborhoods"],
+            "skew": options["skew"],
+            "seed": options["seed"],
+        }
+
+        if options["current"]:
+            results["runs"] = [self.benchmark_current(options["rounds"])]
+        elif options["in_place"]:
+            results["runs"] = self.benchmark_sizes(parse_sizes(options["sizes"]), options)
+        else:
+            # Banco descartável: os dados sintéticos nunca tocam o banco real
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                results["runs"] = self.benchmark_sizes(parse_sizes(options["sizes"]), options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Resultados salvos em {options['output']}.")
+
+        if previous is not None:
+            self.report_comparison(compare_results(previous, results, options["threshold"]))
+
+    def benchmark_current(self, rounds):
+        filters = representative_filters()
+        self.stdout.write(f"Dados atuais: {Bloco.objects.count()} blocos")
+        cases = run_suite(rounds, build_cases(filters))
+        self.report_cases(cases)
+        return {"size": Bloco.objects.count(), "filters": filters, "cases": cases}
+
+    def benchmark_sizes(self, sizes, options):
+        runs = []
+        # Versão de dados e snapshot próprios, para não invalidar os do site
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            SNAPSHOT_ROOT=Path(root), DATA_VERSION_FILE=Path(root) / "version"
+        ):
+            try:
+                for size in sizes:
+                    with transaction.atomic():
+                        clear_dataset()
+                        generate_dataset(
+                            size,
+                            cities=options["cities"],
+                            neighborhoods=options["neighborhoods"],
+                            skew=options["skew"],
+                            seed=options["seed"],
+                        )
+                    finish_ingest()
+
+                    filters = representative_filters()
+                    self.stdout.write(f"{size} blocos sintéticos")
+                    cases = run_suite(options["rounds"], build_cases(filters))
+                    self.report_cases(cases)
+                    runs.append({"size": size, "filters": filters, "cases": cases})
+            finally:
+                clear_dataset()
+        return runs
+
+    def report_cases(self, cases):
+        for name, result in cases.items():
+            self.stdout.write(
+                f"  {name:<30} p50 {result['p50_ms']:8.2f}ms  p90 {result['p90_ms']:8.2f}ms  "
+                f"p99 {result['p99_ms']:8.2f}ms  {result['queries']:3d} consultas  "
+                f"{result['bytes']:>10} bytes  "
+                f"(cache: p50 {result['warm_p50_ms']:.2f}ms, {result['warm_queries']} consultas)"
+            )
+
+    def report_comparison(self, comparison):
+        if not comparison:
+            self.stdout.write("Nenhum caso em comum com a execução anterior.")
+            return
+
+        regressions = 0
+        for row in comparison:
+            line = (
+                f"  {row['size']:>7} {row['case']:<30} p50 x{row['p50_ratio']:.2f}  "
+                f"consultas {row['queries'][0]} -> {row['queries'][1]}  "
+                f"bytes {row['bytes'][0]} -> {row['bytes'][1]}"
+            )
+            if row["regression"]:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            self.stdout.write(self.style.ERROR(f"{regressions} regressões."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Sem regressões."))
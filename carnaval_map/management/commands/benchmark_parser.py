@@ -0,0 +1,114 @@
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand
+
+from carnaval_map.parser import ParseError, parse_event_page
+
+CORPUS_DIR = Path(__file__).resolve().parents[2] / "testdata" / "event_pages"
+
+
+def legacy_parse_event_page(city, url, html):
+    """
+    The event-page parsing of the former ``fetch_event_page``, kept as the
+    baseline of the benchmark.
+    """
+    try:
+        soup = BeautifulSoup(html, "html.parser")
+        data = {
+            "city": city,
+            "name": soup.find("h1", class_=["text-secondary", "h2", "text-center"]).text,
+            "subtitle": soup.find(
+                "h2", class_=["card-text", "text-white", "h6", "text-center", "text-default"]
+            ).text,
+            "description": soup.find(
+                "h2", class_=["card-text", "text-white", "h6", "text-center", "text-default"]
+            )
+            .find_next("p")
+            .text,
+            "ticket_info": soup.find_all("h6")[0].text.strip(),
+            "ticket_url": (
+                soup.find_all("h6")[0].find("a")["href"]
+                if soup.find_all("h6")[0].find("a")
+                else ""
+            ),
+            "address": soup.find_all("h6")[1].text.strip(),
+            "address_gmaps_url": soup.find_all("h6")[1].find("a")["href"],
+            "event_page_url": url,
+        }
+        data["event_date"], data["event_day"], data["event_time"] = data["subtitle"].split(" - ")
+
+        data["event_date"] = datetime.strptime(data["event_date"], "%d/%m/%Y").strftime(
+            "%Y-%m-%d"
+        )
+        data["event_time"] = data["event_time"].split(" ")[0]
+
+        match = re.search(r"\d{2}/\d{2}/\d{4} - .*? - \d{2}:\d{2}\s*(.*)", data["subtitle"])
+        data["neighborhood"] = match.group(1).strip() if match else None
+        return data
+
+    except Exception:
+        return None
+
+
+def parse_or_none(city, url, html):
+    try:
+        return parse_event_page(html, city, url).as_dict()
+    except ParseError:
+        return None
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """
+    Loads the saved event pages. File names are "<city>--<slug>.html".
+
+    Returns:
+        list: (city, url, html) tuples.
+    """
+    pages = []
+    for path in sorted(Path(corpus_dir).glob("*.html")):
+        city, slug = path.stem.split("--", 1)
+        url = f"https://www.blocosderua.com/programacao/{slug}/"
+        pages.append((city, url, path.read_text()))
+    return pages
+
+
+class Command(BaseCommand):
+    help = "Compara a velocidade do parser de páginas de evento com a implementação anterior."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=50, help="Passadas sobre o corpus.")
+        parser.add_argument(
+            "--corpus", default=CORPUS_DIR, help="Diretório com as páginas salvas."
+        )
+
+    def handle(self, *args, **options):
+        pages = load_corpus(options["corpus"])
+        if not pages:
+            self.stderr.write("Nenhuma página encontrada no corpus.")
+            return
+
+        mismatches = [
+            url
+            for city, url, html in pages
+            if legacy_parse_event_page(city, url, html) != parse_or_none(city, url, html)
+        ]
+        for url in mismatches:
+            self.stderr.write(f"Resultado diferente do parser anterior: {url}")
+
+        results = {}
+        for label, parse in [("legacy", legacy_parse_event_page), ("single-pass", parse_or_none)]:
+            start = time.perf_counter()
+            for _ in range(options["rounds"]):
+                for city, url, html in pages:
+                    parse(city, url, html)
+            elapsed = time.perf_counter() - start
+            results[label] = len(pages) * options["rounds"] / elapsed
+            self.stdout.write(f"{label:>12}: {results[label]:8.1f} pages/sec")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Speedup: {results['single-pass'] / results['legacy']:.2f}x")
+        )
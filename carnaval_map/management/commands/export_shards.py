@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from carnaval_map.shards import export_shards
+from carnaval_map.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta os shards JSON estáticos dos filtros (cidade, cidade+data, cidade+bairro). "
+        "Executado automaticamente ao final de cada ingestão."
+    )
+
+    def handle(self, *args, **options):
+        url = export_shards()
+        build_snapshot(shards=url)
+        self.stdout.write(self.style.SUCCESS(f"Shards exportados. Manifesto: {url}"))
@@ -1,25 +1,17 @@
-import re
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from carnaval_map.models import Bloco
+
 
 class Command(BaseCommand):
     help = "Corrige o campo 'neighborhood' extraindo corretamente do 'subtitle'."
 
-    def handle(self, *args, **kwargs):
-        blocos = Bloco.objects.exclude(subtitle__isnull=True).exclude(subtitle="")
-
-        updated_count = 0
-
-        for bloco in blocos:
-            # Expressão regular para remover a parte de data e horário e capturar o bairro
-            match = re.search(r"\d{2}/\d{2}/\d{4} - .*? - \d{2}:\d{2}\s*(.*)", bloco.subtitle)
-            if match:
-                neighborhood = match.group(1).strip()  # Captura apenas o bairro
-                
-                # Atualiza apenas se o bairro estiver incorreto ou ausente
-                if bloco.neighborhood != neighborhood:
-                    bloco.neighborhood = neighborhood
-                    bloco.save()
-                    updated_count += 1
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Conta as alterações sem gravá-las."
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"{updated_count} registros corrigidos."))
+    def handle(self, *args, **options):
+        # Atalho para o extrator "neighborhood" do comando backfill
+        call_command(
+            "backfill", "neighborhood", dry_run=options["dry_run"], stdout=self.stdout
+        )
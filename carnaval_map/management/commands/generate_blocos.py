@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from carnaval_map.ingest import finish_ingest
+from carnaval_map.synthetic import SYNTHETIC_URL, clear_dataset, generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Gera blocos sintéticos para testes de carga e benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=10000, help="Quantidade de blocos.")
+        parser.add_argument("--cities", type=int, default=9, help="Quantidade de cidades.")
+        parser.add_argument(
+            "--neighborhoods", type=int, default=40, help="Bairros por cidade."
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Expoente Zipf da concentração por bairro (0 = uniforme).",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Semente aleatória.")
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove os blocos sintéticos existentes antes de gerar.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["clear"]:
+                deleted = clear_dataset()
+                self.stdout.write(f"{deleted} registros sintéticos removidos.")
+            created = 0
+            if options["size"]:
+                created = generate_dataset(
+                    options["size"],
+                    cities=options["cities"],
+                    neighborhoods=options["neighborhoods"],
+                    skew=options["skew"],
+                    seed=options["seed"],
+                )
+
+        if created or options["clear"]:
+            finish_ingest()
+        self.stdout.write(
+            self.style.SUCCESS(f"{created} blocos sintéticos gerados em {SYNTHETIC_URL}.")
+        )
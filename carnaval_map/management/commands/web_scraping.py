@@ -1,137 +1,146 @@
 # %%
+import argparse
+import json
 import time
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
 from datetime import datetime
+from pathlib import Path
 
-import googlemaps
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 from decouple import config
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models import Max, Min
-
-from carnaval_map.models import Bloco, City, RawBloco
-
-
-BASE_URL = "https://www.blocosderua.com/"
-
-API_KEY = config("API_KEY")
-gmaps = googlemaps.Client(key=API_KEY)
-
-# %%
-
-
-def get_cities_urls():
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from carnaval_map import metrics
+from carnaval_map.cities import touched_cities, update_city_coordinates
+from carnaval_map.crawler import Crawler
+from carnaval_map.gazetteer import Gazetteer
+from carnaval_map.geocoding import (
+    CachedGeocoder,
+    GoogleMapsGeocoder,
+    RateLimitedGeocoder,
+    geocoding_address,
+)
+from carnaval_map.http_cache import HttpCache
+from carnaval_map.models import Bloco, City, FrontierUrl, IngestRun, RawBloco
+from carnaval_map.parser import (
+    FINGERPRINT_FIELDS,
+    ParseError,
+    fingerprint_event,
+    parse_event_page,
+)
+from carnaval_map.pipeline import (
+    RawBlocoPipeline,
+    checkpoint_frontier,
+    insert_raw_blocos,
+    parse_page,
+)
+from carnaval_map.serializers import SUMMARY_SOURCE_FIELDS
+from carnaval_map.ingest import finish_ingest
+
+
+API_KEY = config("API_KEY", default=None)
+
+# Limite de parâmetros por consulta "IN" no SQLite
+EXISTING_URLS_BATCH_SIZE = 500
+
+# Estágios que podem ser executados isoladamente com --stage, na ordem
+STAGES = ("discover", "fetch", "parse", "geocode")
+
+# Downloads tentados antes de uma URL da fronteira ser deixada de lado
+MAX_FETCH_ATTEMPTS = 3
+
+
+def get_geocoder(rate=None, burst=None, workers=None):
     """
-    Fetches the URLs of cities from the base website.
+    Returns the Google Maps geocoder behind the configured rate limit. The
+    client is only created on the first lookup, so the module can be
+    imported without an API key.
+
+    Args:
+        rate (float): Requests per second; defaults to GEOCODE_RATE_LIMIT.
+        burst (int): Requests allowed back to back; defaults to GEOCODE_BURST.
+        workers (int): Lookups in flight; defaults to GEOCODE_WORKERS.
 
     Returns:
-        list: A list of city URLs or an empty list if an error occurs.
+        RateLimitedGeocoder: The geocoder.
     """
-    try:
-        response = requests.get(BASE_URL)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        options = soup.find("select", class_="dms-select").find_all("option")
-        return [option["value"] for option in options if option["value"]] + [BASE_URL]
-    except requests.RequestException as e:
-        print(f"Requests Error: {e}")
-        return []
+    return RateLimitedGeocoder(
+        GoogleMapsGeocoder(API_KEY), rate=rate, burst=burst, workers=workers
+    )
 
-    except Exception as e:
-        print(f"Error: {e}")
-        return []
+# %%
 
 
-def get_city_full_page_url(city_url):
+def city_from_url(city_url):
     """
-    Retrieves the full page URL for a given city URL.
+    Returns the city slug of a city URL. The home page lists São Paulo.
 
     Args:
         city_url (str): The URL of the city.
 
     Returns:
-        str: The full page URL or None if an error occurs.
-    """
-    try:
-        response = requests.get(city_url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        btn_links = [
-            link["href"]
-            for link in soup.find_all("a", class_="btn")
-            if city_url in link["href"]
-        ]
-        return btn_links[0] if btn_links else None
-
-    except requests.RequestException as e:
-        print(f"Requests Error: {e}")
-        return None
+        str: The city slug.
+    """
+    city_tag = city_url.split("/")[-2]
+    return city_tag if "www" not in city_tag else "sao-paulo"
 
 
-def get_city_events_links(city_url):
+def existing_urls_query(links):
     """
-    Fetches all event links for a given city URL.
+    Builds the query that finds which of the given event URLs are already stored.
 
     Args:
-        city_url (str): The URL of the city.
+        links (list): Event URLs.
 
     Returns:
-        list: A list of event links or an empty list if no links are found.
+        QuerySet: The stored URLs among the given ones.
     """
-    full_page_url = get_city_full_page_url(city_url)
-    if not full_page_url:
-        return []
+    return RawBloco.objects.filter(event_page_url__in=links).values_list(
+        "event_page_url", flat=True
+    )
 
-    city_events_links = []
-    i = 1
-    print(f"Getting events links from {city_url}")
-    while True:
-        print("Page:", i)
-        target_page = f"{full_page_url}?paged={i}&data=&bairro="
 
-        response = requests.get(target_page)
-        if response.status_code != 200:
-            break
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        event_links = [
-            l["href"]
-            for l in soup.find_all("a", class_="card")
-            if "programacao/" in l["href"]
-        ]
-
-        if not event_links:
-            break
+def get_existing_urls(links):
+    """
+    Returns which of the given event URLs are already stored, querying the
+    unique event_page_url index in batches.
 
-        city_events_links.extend(event_links)
-        i += 1
+    Args:
+        links (list): Event URLs.
 
-    return city_events_links
+    Returns:
+        set: The URLs already present in RawBloco.
+    """
+    existing_urls = set()
+    for start in range(0, len(links), EXISTING_URLS_BATCH_SIZE):
+        batch = links[start : start + EXISTING_URLS_BATCH_SIZE]
+        existing_urls.update(existing_urls_query(batch))
+    return existing_urls
 
 
-def get_events_links():
+def get_events_links(crawler):
     """
     Fetches event links for all cities.
 
+    Args:
+        crawler (Crawler): The crawl engine.
+
     Returns:
         pd.DataFrame: A DataFrame containing city and event URLs, or None if no new events are found.
     """
     print("Getting events from cities urls...")
 
-    cities_urls = get_cities_urls()
+    links_by_city = crawler.run(crawler.crawl_events_links())
 
-    existing_urls = set(RawBloco.objects.values_list("event_page_url", flat=True))
     all_events = []
 
-    for url in cities_urls:
-        city_tag = url.split("/")[-2]
-        city = city_tag if "www" not in city_tag else "sao-paulo"
-
-        event_links = get_city_events_links(url)
+    for url, event_links in links_by_city.items():
+        city = city_from_url(url)
+        existing_urls = get_existing_urls(event_links)
 
         new_links = [link for link in event_links if link not in existing_urls]
 
@@ -145,242 +154,372 @@ def get_events_links():
 
     return None
 
-def fetch_event_page(city, url):
+def discover_links(crawler):
     """
-    Fetches and parses event data from a given URL.
+    Discovery stage: adds the event links not yet stored to the frontier.
+
+    Every listing page is always scanned, so --limit and --since do not apply
+    here; they select what the later stages take from the frontier.
 
     Args:
-        city (str): The city associated with the event.
-        url (str): The URL of the event page.
+        crawler (Crawler): The crawl engine.
 
     Returns:
-        dict: A dictionary containing event data or None if an error occurs.
-    """
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        data = {
-            "city": city,
-            "name": soup.find(
-                "h1", class_=["text-secondary", "h2", "text-center"]
-            ).text,
-            "subtitle": soup.find(
-                "h2",
-                class_=[
-                    "card-text",
-                    "text-white",
-                    "h6",
-                    "text-center",
-                    "text-default",
-                ],
-            ).text,
-            "description": soup.find(
-                "h2",
-                class_=[
-                    "card-text",
-                    "text-white",
-                    "h6",
-                    "text-center",
-                    "text-default",
-                ],
-            )
-            .find_next("p")
-            .text,
-            "ticket_info": soup.find_all("h6")[0].text.strip(),
-            "ticket_url": (
-                soup.find_all("h6")[0].find("a")["href"]
-                if soup.find_all("h6")[0].find("a")
-                else ""
-            ),
-            "address": soup.find_all("h6")[1].text.strip(),
-            "address_gmaps_url": soup.find_all("h6")[1].find("a")["href"],
-            "event_page_url": url,
-        }
-        data["event_date"], data["event_day"], data["event_time"] = data[
-            "subtitle"
-        ].split(" - ")
-
-        data["event_date"] = datetime.strptime(data["event_date"], "%d/%m/%Y").strftime(
-            "%Y-%m-%d"
-        )
-        data["event_time"] = data["event_time"].split(" ")[0]
+        int: The number of URLs added to the frontier.
+    """
+    df = get_events_links(crawler)
+    if df is None:
+        return 0
+
+    before = FrontierUrl.objects.count()
+    FrontierUrl.objects.bulk_create(
+        [FrontierUrl(city=city, url=url) for city, url in zip(df["city"], df["event_url"])],
+        batch_size=EXISTING_URLS_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    added = FrontierUrl.objects.count() - before
+    metrics.incr("items", len(df))
+    metrics.incr("frontier.added", added)
+    print(f"{added} URLs adicionadas à fronteira.")
+    return added
+
+
+def frontier_queryset(statuses, limit=None, since=None):
+    """
+    Selects frontier URLs by status, oldest first.
 
-        match = re.search(r"\d{2}/\d{2}/\d{4} - .*? - \d{2}:\d{2}\s*(.*)", data["subtitle"])
-        
-        if match:
-            data["neighborhood"] = match.group(1).strip()
-        else:
-            data["neighborhood"] = None
+    Args:
+        statuses (list): FrontierUrl statuses.
+        limit (int): Maximum number of URLs.
+        since (datetime): Only URLs discovered from this moment on.
+
+    Returns:
+        QuerySet: The selected FrontierUrl rows.
+    """
+    urls = FrontierUrl.objects.filter(status__in=statuses)
+    if statuses != [FrontierUrl.FETCHED]:
+        urls = urls.filter(attempts__lt=MAX_FETCH_ATTEMPTS)
+    if since is not None:
+        urls = urls.filter(discovered_at__gte=since)
+    urls = urls.order_by("discovered_at", "id")
+    return urls[:limit] if limit else urls
 
-        return data
 
-    except Exception as e:
-        print(f"Erro ao baixar {url}: {e}")
-        return None
+def fetch_frontier(crawler, batch_size=100, queue_size=500, limit=None, since=None):
+    """
+    Fetch stage: downloads and parses the discovered pages (and retries the
+    failed downloads), streaming them to the database in batches and
+    checkpointing each page on the frontier.
 
+    Args:
+        crawler (Crawler): The crawl engine.
+        batch_size (int): Rows written per transaction.
+        queue_size (int): Parsed rows buffered before fetching pauses.
+        limit (int): Maximum number of pages.
+        since (datetime): Only pages discovered from this moment on.
 
-def process_links(df, max_workers=3):
+    Returns:
+        int: The number of RawBlocos written.
     """
-    Processes event links in parallel using ThreadPoolExecutor.
+    statuses = [FrontierUrl.DISCOVERED, FrontierUrl.FAILED]
+    events = list(frontier_queryset(statuses, limit, since).values_list("city", "url"))
+    if not events:
+        print("Nenhuma página pendente na fronteira.")
+        return 0
+
+    print(f"Processing {len(events)} links... (Streaming)")
+    pipeline = RawBlocoPipeline(
+        crawler, batch_size=batch_size, queue_size=queue_size, track_frontier=True
+    )
+    saved = pipeline.run(events)
+
+    print(f"{saved} blocos salvos em {pipeline.write_seconds:.2f}s de escrita.")
+    report_failures(pipeline.failures)
+    return saved
+
+
+def parse_fetched(batch_size=100, limit=None, since=None):
+    """
+    Parse stage: parses again, without downloading, the pages whose parse
+    failed, e.g. after a parser fix.
 
     Args:
-        df (pd.DataFrame): A DataFrame containing city and event URLs.
-        max_workers (int): The maximum number of worker threads.
-    """
-    print("Processing links... (Parallel)")
-    with ThreadPoolExecutor(max_workers) as executor:
-        futures = {
-            executor.submit(fetch_event_page, row["city"], row["event_url"]): row
-            for _, row in df.iterrows()
-        }
-
-    for future in as_completed(futures):
-        row = futures[future]
-        try:
-            data = future.result()
-            if data:
-                bloco = RawBloco(**data)
-                bloco.save()
-                print(
-                    f"{row['city']} - {row['event_url'].split('/')[-2]} salvo no banco."
-                )
-            else:
-                print(f"{row['city']} - {row['event_url'].split('/')[-2]} falhou.")
-        except Exception as e:
-            print(
-                f"Erro ao salvar {row['city']} - {row['event_url'].split('/')[-2]}: {e}"
-            )
+        batch_size (int): Pages parsed per transaction.
+        limit (int): Maximum number of pages.
+        since (datetime): Only pages discovered from this moment on.
 
-    return
+    Returns:
+        int: The number of RawBlocos written.
+    """
+    fetched = frontier_queryset([FrontierUrl.FETCHED], limit, since)
+    pages = list(fetched.values_list("id", flat=True))
+    print(f"Parsing {len(pages)} fetched pages...")
+
+    saved = 0
+    failures = Counter()
+    for start in range(0, len(pages), batch_size):
+        results = [
+            parse_page(page.city, page.url, page.html)
+            for page in FrontierUrl.objects.filter(id__in=pages[start : start + batch_size])
+        ]
+        metrics.incr("items", len(results))
+        failures.update(result.reason for result in results if result.reason is not None)
+
+        raw_blocos = [result.raw_bloco for result in results if result.raw_bloco is not None]
+        with metrics.timer("db.write"), transaction.atomic():
+            inserted = insert_raw_blocos(raw_blocos)
+            checkpoint_frontier(results, downloaded=False)
+        metrics.incr("db.rows", inserted)
+        saved += inserted
 
+    print(f"{saved} blocos salvos no banco.")
+    report_failures(failures)
+    return saved
 
-def get_coordinates(address):
+
+def report_failures(failures):
+    """Prints the failure counts by reason, if any."""
+    if failures:
+        print("Falhas:", ", ".join(f"{reason}={count}" for reason, count in failures.most_common()))
+
+
+def refresh_known_events(crawler, geocoder=None, limit=None, since=None):
     """
-    Retrieves latitude and longitude for a given address using the Google Maps API.
+    Revisits the stored event pages and updates, in place, the events whose
+    content changed.
+
+    Pages answered from the HTTP cache as unchanged are not parsed again.
 
     Args:
-        address (str): The address to geocode.
+        crawler (Crawler): The crawl engine.
+        geocoder (Geocoder): The provider used for changed addresses missing
+            from the geocoding cache; defaults to get_geocoder(). A single
+            instance serves the whole refresh, so its rate limit holds.
+        limit (int): Maximum number of event pages revisited.
+        since (datetime): Only events scraped from this moment on.
 
     Returns:
-        tuple: A tuple containing (latitude, longitude) or None if an error occurs.
-    """
-    try:
-        geocode_result = gmaps.geocode(address)
-        if geocode_result:
-            location = geocode_result[0]["geometry"]["location"]
-            return location["lat"], location["lng"]
-    except Exception as e:
-        print(f"Erro ao buscar {address}: {e}")
-    return None
+        int: The number of updated events.
+    """
+    print("Refreshing known events...")
+    cached_geocoder = CachedGeocoder(geocoder or get_geocoder())
+    known_events = RawBloco.objects.exclude(event_page_url__isnull=True).order_by("id")
+    if since is not None:
+        known_events = known_events.filter(scraped_at__gte=since)
+    known_events = known_events.values(
+        "id", "city", "event_page_url", "content_hash", *FINGERPRINT_FIELDS
+    )
+    known_events = list(known_events[:limit] if limit else known_events)
+    pages = crawler.run(crawler.fetch_many([raw["event_page_url"] for raw in known_events]))
+    metrics.incr("items", len(known_events))
+
+    updated_count = 0
+    failures = Counter()
+    for raw, page in zip(known_events, pages):
+        if page is None:
+            failures["fetch_failed"] += 1
+            continue
+        if not page.changed and raw["content_hash"]:
+            continue
 
+        try:
+            data = parse_event_page(page.text, raw["city"], raw["event_page_url"]).as_dict()
+        except ParseError as e:
+            failures[e.reason] += 1
+            continue
 
-def process_addresses(delay=1):
+        content_hash = fingerprint_event(data)
+        if content_hash == (raw["content_hash"] or fingerprint_event(raw)):
+            if not raw["content_hash"]:
+                RawBloco.objects.filter(pk=raw["id"]).update(content_hash=content_hash)
+            continue
+
+        update_changed_event(raw, data, content_hash, cached_geocoder)
+        updated_count += 1
+        print(f"🔄 {raw['city']} - {raw['event_page_url'].split('/')[-2]} atualizado.")
+
+    print(f"{updated_count} eventos alterados.")
+    report_failures(failures)
+    return updated_count
+
+
+def update_changed_event(raw, data, content_hash, geocoder):
     """
-    Processes raw blocos to extract coordinates and save them to the Bloco model.
+    Writes the new content of an event to its RawBloco and to the linked
+    Bloco. The address is geocoded again only when it changed.
 
     Args:
-        delay (int): Delay between requests to avoid rate limiting.
+        raw (dict): The stored RawBloco values.
+        data (dict): The freshly parsed event.
+        content_hash (str): The fingerprint of data.
+        geocoder (CachedGeocoder): The cached geocoder.
     """
-    print("Processing addresses")
-    raw_blocos = RawBloco.objects.filter(processed=False)
+    fields = {field: data[field] for field in FINGERPRINT_FIELDS}
+    bloco_fields = dict(fields, processed_at=timezone.now())
 
-    if not raw_blocos.exists():
-        print("Nenhum novo bloco para processar.")
-        return
+    bloco = Bloco.objects.filter(raw_data_id=raw["id"])
+    if data["address"] != raw["address"] and bloco.exists():
+        pair = (raw["city"], data["address"])
+        coords, source = geocoder.geocode_many([pair], with_sources=True)[pair]
+        bloco_fields["latitude"], bloco_fields["longitude"] = coords or (None, None)
+        bloco_fields["geocode_source"] = source
 
-    print(f"Processando {raw_blocos.count()} blocos...")
-
-    with transaction.atomic():  # Garante consistência no banco de dados
-        for i, raw_bloco in enumerate(raw_blocos):
-            print(
-                "Processando bloco",
-                i + 1,
-                "de",
-                raw_blocos.count(),
-                "-",
-                raw_bloco.name,
-            )
-            # Obtém as coordenadas a partir do endereço
-            city = raw_bloco.city.replace("-", " ")
-            address = f"Brasil, {city}, {raw_bloco.address}"
-            coords = get_coordinates(address)
+    with transaction.atomic():
+        RawBloco.objects.filter(pk=raw["id"]).update(**fields, content_hash=content_hash)
+        bloco.update(**bloco_fields)
+        for instance in bloco.only(*SUMMARY_SOURCE_FIELDS):
+            instance.save(update_fields=["summary_json"])
+
+
+def bloco_from_raw(raw_bloco, coords, source=None):
+    """
+    Builds the (unsaved) Bloco promoted from a RawBloco.
+
+    Args:
+        raw_bloco (RawBloco): The scraped event.
+        coords (tuple): (latitude, longitude) or None.
+        source (str): Where the coordinates came from (Bloco.PROVIDER,
+            Bloco.GAZETTEER or Bloco.CENTROID).
+
+    Returns:
+        Bloco: The new bloco.
+    """
+    latitude, longitude = coords or (None, None)
+    bloco = Bloco(
+        raw_data=raw_bloco,
+        city=raw_bloco.city,
+        name=raw_bloco.name,
+        subtitle=raw_bloco.subtitle,
+        description=raw_bloco.description,
+        ticket_info=raw_bloco.ticket_info,
+        ticket_url=raw_bloco.ticket_url,
+        address=raw_bloco.address,
+        neighborhood=raw_bloco.neighborhood,
+        address_gmaps_url=raw_bloco.address_gmaps_url,
+        event_page_url=raw_bloco.event_page_url,
+        event_date=raw_bloco.event_date,
+        event_day=raw_bloco.event_day,
+        event_time=raw_bloco.event_time,
+        latitude=latitude,
+        longitude=longitude,
+        geocode_source=source if coords is not None else None,
+    )
+    # bulk_create não chama save(): o resumo é renderizado aqui
+    bloco.render_summary()
+    return bloco
+
+
+def promote_chunk(raw_blocos, geocoder, gazetteer=None):
+    """
+    Geocodes a chunk of RawBlocos and commits their Blocos in a single short
+    transaction, marking the RawBlocos as processed.
 
+    Args:
+        raw_blocos (list): The RawBlocos of the chunk.
+        geocoder (CachedGeocoder): The cached geocoder.
+        gazetteer (Gazetteer): Provides the neighborhood centroid of the
+            addresses that could not be geocoded.
+    """
+    # Geocodificação fora da transação: a escrita no SQLite fica curta
+    coordinates = geocoder.geocode_many(
+        [(raw_bloco.city, raw_bloco.address) for raw_bloco in raw_blocos], with_sources=True
+    )
+
+    blocos = []
+    for raw_bloco in raw_blocos:
+        coords, source = coordinates[(raw_bloco.city, raw_bloco.address)]
+        if coords is None:
+            address = geocoding_address(raw_bloco.city, raw_bloco.address)
+            if gazetteer is not None and raw_bloco.neighborhood:
+                coords = gazetteer.neighborhood_centroid(raw_bloco.city, raw_bloco.neighborhood)
+                source = Bloco.CENTROID
             if coords is None:
                 print(f"❌ Não foi possível obter coordenadas para: {address}")
-                latitude, longitude = None, None
             else:
-                latitude, longitude = coords
-
-            # Criando o registro na tabela Bloco
-            Bloco.objects.create(
-                raw_data=raw_bloco,
-                city=raw_bloco.city,
-                name=raw_bloco.name,
-                subtitle=raw_bloco.subtitle,
-                description=raw_bloco.description,
-                ticket_info=raw_bloco.ticket_info,
-                ticket_url=raw_bloco.ticket_url,
-                address=raw_bloco.address,
-                neighborhood=raw_bloco.neighborhood,
-                address_gmaps_url=raw_bloco.address_gmaps_url,
-                event_page_url=raw_bloco.event_page_url,
-                event_date=raw_bloco.event_date,
-                event_day=raw_bloco.event_day,
-                event_time=raw_bloco.event_time,
-                latitude=latitude,
-                longitude=longitude,
-            )
-
-            # Marca o registro como processado
-            raw_bloco.processed = True
-            raw_bloco.save()
-
-            time.sleep(delay)  # Delay entre requisições para evitar bloqueios
+                print(f"📍 Usando o centro do bairro {raw_bloco.neighborhood} para: {address}")
+        blocos.append(bloco_from_raw(raw_bloco, coords, source))
+        raw_bloco.processed = True
 
-    print("✅ Processamento concluído!")
+    with metrics.timer("db.write"), transaction.atomic():
+        Bloco.objects.bulk_create(blocos)
+        RawBloco.objects.bulk_update(raw_blocos, ["processed"])
+    metrics.incr("items", len(raw_blocos))
+    metrics.incr("db.rows", len(blocos))
+    metrics.incr("geocode.missing", sum(bloco.latitude is None for bloco in blocos))
 
 
-def update_city_coordinates():
+def process_addresses(geocoder=None, chunk_size=100, use_gazetteer=True, limit=None, since=None):
     """
-    Updates the average coordinates for each city based on the Bloco model.
+    Processes raw blocos to extract coordinates and save them to the Bloco model.
+
+    Promotion runs in chunks committed one at a time; since only unprocessed
+    RawBlocos are selected, an interrupted run resumes after the last
+    committed chunk.
+
+    Args:
+        geocoder (Geocoder): The provider used for addresses missing from the
+            geocoding cache; defaults to get_geocoder().
+        chunk_size (int): RawBlocos promoted per transaction.
+        use_gazetteer (bool): Resolve addresses from the already geocoded
+            blocos before calling the provider.
+        limit (int): Maximum number of RawBlocos to promote.
+        since (datetime): Only RawBlocos scraped from this moment on.
     """
+    print("Processing addresses")
+    # Ignora RawBlocos que já têm Bloco, mesmo sem a marcação de processado
+    raw_blocos = RawBloco.objects.filter(processed=False, cleaned_data__isnull=True).order_by(
+        "id"
+    )
+    if since is not None:
+        raw_blocos = raw_blocos.filter(scraped_at__gte=since)
+    total = raw_blocos.count()
+    if limit:
+        total = min(total, limit)
+
+    if not total:
+        print("Nenhum novo bloco para processar.")
+        return
 
-    cities = Bloco.objects.values_list("city", flat=True).distinct()
+    print(f"Processando {total} blocos...")
 
-    for city in cities:
-        print(f"Processando cidade: {city}")
+    # Endereços repetidos e já conhecidos não chegam à API; o restante é
+    # consultado em paralelo dentro do limite de requisições
+    started = time.perf_counter()
+    gazetteer = Gazetteer.build() if use_gazetteer else None
+    cached_geocoder = CachedGeocoder(geocoder or get_geocoder(), gazetteer=gazetteer)
+    done = 0
+    last_id = 0
 
-        min_lat = Bloco.objects.filter(city=city).aggregate(Min("latitude"))[
-            "latitude__min"
-        ]
-        max_lat = Bloco.objects.filter(city=city).aggregate(Max("latitude"))[
-            "latitude__max"
-        ]
-        min_lon = Bloco.objects.filter(city=city).aggregate(Min("longitude"))[
-            "longitude__min"
-        ]
-        max_lon = Bloco.objects.filter(city=city).aggregate(Max("longitude"))[
-            "longitude__max"
-        ]
+    while done < total:
+        chunk = list(raw_blocos.filter(id__gt=last_id)[: min(chunk_size, total - done)])
+        if not chunk:
+            break
 
-        if None in (min_lat, max_lat, min_lon, max_lon):
-            print(f"Pulando {city}, pois não há coordenadas suficientes.")
-            continue
+        promote_chunk(chunk, cached_geocoder, gazetteer)
+        last_id = chunk[-1].id
+        done += len(chunk)
+        print(f"Processados {done} de {total} blocos")
+
+    print(f"Promotion finished in {time.perf_counter() - started:.1f}s")
+    print("Geocoding cache:", cached_geocoder.stats())
+    print("✅ Processamento concluído!")
 
-        avg_lat = (min_lat + max_lat) / 2
-        avg_lon = (min_lon + max_lon) / 2
 
-        city_obj, created = City.objects.update_or_create(
-            name=city,
-            defaults={"avg_latitude": avg_lat, "avg_longitude": avg_lon},
-        )
+def parse_since(value):
+    """
+    Parses the --since option: an ISO date or datetime, in the local timezone
+    when naive.
 
-        if created:
-            print(f"📍 Cidade adicionada: {city} ({avg_lat}, {avg_lon})")
-        else:
-            print(f"🔄 Cidade atualizada: {city} ({avg_lat}, {avg_lon})")
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a date.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise argparse.ArgumentTypeError(f"Data inválida: {value}")
+        moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
 
 
 class Command(BaseCommand):
@@ -388,13 +527,190 @@ class Command(BaseCommand):
     Django management command to fetch and process event data.
     """
 
-    help = "Creates objects in the Locations model from a CSV file"
+    help = (
+        "Scrapes the blocos from blocosderua.com and geocodes them, in stages: "
+        "discover, fetch, parse and geocode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stage",
+            action="append",
+            choices=STAGES,
+            help="Run only this stage; repeat for several. Default: all stages in order.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum items processed by each stage (discover always scans every listing).",
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_since,
+            default=None,
+            help="Only items discovered/scraped from this date or datetime on (ISO 8601); "
+            "not applied to discover.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Maximum concurrent requests per host.",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=10, help="Timeout of each request, in seconds."
+        )
+        parser.add_argument(
+            "--retries", type=int, default=3, help="Extra attempts for a failed request."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Rows written per transaction."
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=500,
+            help="Parsed events buffered before fetching pauses.",
+        )
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="In the fetch stage, also revisit known event pages and update the "
+            "events that changed.",
+        )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Download every page again instead of revalidating the HTTP cache.",
+        )
+        parser.add_argument(
+            "--geocode-rate",
+            type=float,
+            default=None,
+            help="Geocoding requests per second (default: GEOCODE_RATE_LIMIT).",
+        )
+        parser.add_argument(
+            "--geocode-workers",
+            type=int,
+            default=None,
+            help="Geocoding requests in flight (default: GEOCODE_WORKERS).",
+        )
+        parser.add_argument(
+            "--metrics-json",
+            default=None,
+            help="Also write the JSON metrics summary of the run to this file.",
+        )
+        parser.add_argument(
+            "--no-gazetteer",
+            action="store_true",
+            help="Send every new address to the geocoding API.",
+        )
 
     def handle(self, *args, **options):
-        df = get_events_links()
-        if df is not None:
-            process_links(df)
+        started_at = timezone.now()
+        stages = [stage for stage in STAGES if stage in (options["stage"] or STAGES)]
+        print("Stages:", ", ".join(stages))
 
-        process_addresses()
-        update_city_coordinates()
+        run = IngestRun.objects.create(stages=",".join(stages))
+        metrics.begin_run()
+        try:
+            self.run_stages(stages, started_at, options)
+        except BaseException:
+            self.finish_run(run, IngestRun.FAILED, options)
+            raise
+        self.finish_run(run, IngestRun.SUCCESS, options)
         print("Done")
+
+    def run_stages(self, stages, started_at, options):
+        limit, since = options["limit"], options["since"]
+
+        if "discover" in stages or "fetch" in stages:
+            self.crawl(stages, options)
+
+        if "parse" in stages:
+            with metrics.stage("parse"):
+                parse_fetched(options["batch_size"], limit, since)
+
+        if "geocode" in stages:
+            with metrics.stage("geocode"):
+                process_addresses(
+                    get_geocoder(rate=options["geocode_rate"], workers=options["geocode_workers"]),
+                    chunk_size=options["batch_size"],
+                    use_gazetteer=not options["no_gazetteer"],
+                    limit=limit,
+                    since=since,
+                )
+
+        # Cidades e snapshot só mudam se algum Bloco mudou nesta execução
+        cities = touched_cities(started_at)
+        if cities:
+            with metrics.stage("cities"):
+                update_city_coordinates(cities)
+                metrics.incr("items", len(cities))
+            with metrics.stage("publish"):
+                finish_ingest()
+
+    def finish_run(self, run, status, options):
+        """Stores the metrics of the run and prints them as JSON."""
+        summary = metrics.end_run()
+        run.status = status
+        run.finished_at = timezone.now()
+        run.summary = summary
+        run.save()
+
+        report = json.dumps({"run": run.pk, "status": status, **summary}, indent=2)
+        self.stdout.write(report)
+        if options["metrics_json"]:
+            Path(options["metrics_json"]).write_text(report)
+
+        # Compara a vazão com a última execução dos mesmos estágios
+        previous = (
+            IngestRun.objects.filter(status=IngestRun.SUCCESS, stages=run.stages)
+            .exclude(pk=run.pk)
+            .first()
+        )
+        if previous is None:
+            return
+        for name, stage in summary["stages"].items():
+            before = previous.summary.get("stages", {}).get(name, {}).get("items_per_second")
+            if "items_per_second" in stage and before:
+                print(f"{name}: {stage['items_per_second']} itens/s (anterior: {before})")
+
+    def crawl(self, stages, options):
+        cache = None
+        if not options["no_cache"]:
+            cache = HttpCache(settings.HTTP_CACHE_ROOT, settings.HTTP_CACHE_MAX_BYTES)
+
+        with Crawler(
+            per_host_limit=options["concurrency"],
+            timeout=options["timeout"],
+            retries=options["retries"],
+            cache=cache,
+        ) as crawler:
+            if "discover" in stages:
+                with metrics.stage("discover"):
+                    discover_links(crawler)
+            if "fetch" in stages:
+                with metrics.stage("fetch"):
+                    fetch_frontier(
+                        crawler,
+                        options["batch_size"],
+                        options["queue_size"],
+                        options["limit"],
+                        options["since"],
+                    )
+                if options["refresh"]:
+                    with metrics.stage("refresh"):
+                        refresh_known_events(
+                            crawler,
+                            get_geocoder(
+                                rate=options["geocode_rate"], workers=options["geocode_workers"]
+                            ),
+                            limit=options["limit"],
+                            since=options["since"],
+                        )
+
+        if cache is not None:
+            print("HTTP cache:", cache.stats())
+            cache.close()
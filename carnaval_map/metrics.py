@@ -0,0 +1,180 @@
+"""
+Per-stage counters and latency histograms for ingest runs.
+
+An ingest command opens a run with ``begin_run()`` and wraps each stage in
+``stage(name)``. Instrumented code (crawler, pipeline, geocoders) records
+through the module-level ``incr``, ``observe`` and ``timer`` helpers, which
+attribute the values to the stage in progress and do nothing when no run is
+active, so the same code stays silent in tests and other commands.
+"""
+
+import bisect
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Limites superiores dos buckets dos histogramas, em milissegundos
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram: memory does not grow with the samples.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        milliseconds = seconds * 1000
+        self.buckets[bisect.bisect_left(BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound, in ms, of the bucket holding the percentile;
+        the maximum for the open-ended last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(fraction * self.count)
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, round(self.max, 3))
+        return round(self.max, 3)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 3),
+            "mean_ms": round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class StageMetrics:
+    """Counters and histograms of one stage."""
+
+    def __init__(self):
+        self.counters = Counter()
+        self.histograms = {}
+        self.seconds = 0.0
+
+    def summary(self):
+        summary = {
+            "seconds": round(self.seconds, 3),
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {
+                name: histogram.summary() for name, histogram in sorted(self.histograms.items())
+            },
+        }
+        # "items" é o que cada estágio processa: páginas, linhas, endereços...
+        if self.counters["items"] and self.seconds:
+            summary["items_per_second"] = round(self.counters["items"] / self.seconds, 2)
+        return summary
+
+
+class RunMetrics:
+    """
+    Thread-safe metrics of a run, grouped by stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.current = "run"
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _stage(self):
+        return self.stages.setdefault(self.current, StageMetrics())
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._stage().counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histograms = self._stage().histograms
+            histograms.setdefault(name, Histogram()).observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        previous, self.current = self.current, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage().seconds += time.perf_counter() - start
+            self.current = previous
+
+    def summary(self):
+        """
+        Returns the JSON-serializable summary of the run.
+        """
+        with self._lock:
+            return {
+                "seconds": round(time.perf_counter() - self.started, 3),
+                "stages": {name: stage.summary() for name, stage in self.stages.items()},
+            }
+
+
+_run = None
+
+
+def begin_run():
+    """Starts collecting metrics and returns the RunMetrics of the new run."""
+    global _run
+    _run = RunMetrics()
+    return _run
+
+
+def end_run():
+    """Stops collecting metrics and returns the summary of the finished run."""
+    global _run
+    run, _run = _run, None
+    return run.summary() if run is not None else None
+
+
+def incr(name, value=1):
+    """Adds to a counter of the current stage."""
+    if _run is not None:
+        _run.incr(name, value)
+
+
+def observe(name, seconds):
+    """Records a duration in a histogram of the current stage."""
+    if _run is not None:
+        _run.observe(name, seconds)
+
+
+@contextmanager
+def timer(name):
+    """Records the duration of the block in a histogram of the current stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def stage(name):
+    """Attributes the metrics recorded inside the block to a stage."""
+    if _run is None:
+        yield
+        return
+    with _run.stage(name):
+        yield
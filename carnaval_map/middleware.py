@@ -0,0 +1,47 @@
+"""
+Serves the exported filter shards straight from disk, before any view runs.
+"""
+
+from django.conf import settings
+from whitenoise.base import WhiteNoise
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .shards import get_shard_root
+
+
+class ShardMiddleware:
+    """
+    Serves the files under SHARD_URL with whitenoise: immutable caching,
+    precompressed variants and conditional requests.
+
+    WhiteNoiseMiddleware only sees the files present when the process starts,
+    while shards are written by every ingest. The shard directory is scanned
+    again whenever its mtime changes, which costs a single stat per request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._files = (None, {})
+
+    def __call__(self, request):
+        if request.path_info.startswith(settings.SHARD_URL):
+            static_file = self.get_files().get(request.path_info)
+            if static_file is not None:
+                return WhiteNoiseMiddleware.serve(static_file, request)
+        return self.get_response(request)
+
+    def get_files(self):
+        root = get_shard_root()
+        try:
+            mtime = root.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+
+        scanned_mtime, files = self._files
+        if scanned_mtime != mtime:
+            # Nomes derivados do conteúdo: todo shard pode ser cacheado para sempre
+            whitenoise = WhiteNoise(None, immutable_file_test=lambda path, url: True)
+            whitenoise.add_files(root, settings.SHARD_URL)
+            files = whitenoise.files
+            self._files = (mtime, files)
+        return files
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicated_event_urls(apps, schema_editor):
+    """Mantém um RawBloco por event_page_url antes de criar o índice único."""
+    RawBloco = apps.get_model("carnaval_map", "RawBloco")
+
+    duplicated_urls = (
+        RawBloco.objects.exclude(event_page_url__isnull=True)
+        .values("event_page_url")
+        .annotate(total=Count("id"))
+        .filter(total__gt=1)
+        .values_list("event_page_url", flat=True)
+    )
+    for url in duplicated_urls:
+        # Preferimos manter o registro que já foi processado em um Bloco
+        raw_blocos = RawBloco.objects.filter(event_page_url=url).order_by("-processed", "id")
+        keep = raw_blocos.first()
+        raw_blocos.exclude(pk=keep.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0005_rawbloco_neighborhood"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_event_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="rawbloco",
+            name="event_page_url",
+            field=models.URLField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="bloco",
+            index=models.Index(fields=["event_date"], name="bloco_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bloco",
+            index=models.Index(fields=["city", "event_date"], name="bloco_city_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bloco",
+            index=models.Index(
+                fields=["city", "neighborhood", "event_date"], name="bloco_city_nbhd_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bloco",
+            index=models.Index(
+                fields=["neighborhood", "event_date"], name="bloco_nbhd_date_idx"
+            ),
+        ),
+    ]
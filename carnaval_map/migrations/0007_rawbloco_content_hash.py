@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0006_bloco_indexes_rawbloco_unique_url"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rawbloco",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0007_rawbloco_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodeCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=400, unique=True)),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("status", models.CharField(max_length=30)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
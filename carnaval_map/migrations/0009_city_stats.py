@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:29
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min
+
+
+def fill_city_stats(apps, schema_editor):
+    Bloco = apps.get_model("carnaval_map", "Bloco")
+    City = apps.get_model("carnaval_map", "City")
+
+    stats = (
+        Bloco.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .values("city")
+        .order_by("city")
+        .annotate(
+            min_latitude=Min("latitude"),
+            max_latitude=Max("latitude"),
+            min_longitude=Min("longitude"),
+            max_longitude=Max("longitude"),
+            centroid_latitude=Avg("latitude"),
+            centroid_longitude=Avg("longitude"),
+            bloco_count=Count("id"),
+        )
+    )
+    for row in stats:
+        City.objects.filter(name=row.pop("city")).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0008_geocodecache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="city",
+            name="bloco_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="centroid_latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="centroid_longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="max_latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="max_longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="min_latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="min_longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_city_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0009_city_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FrontierUrl",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100)),
+                ("url", models.URLField(unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("discovered", "Descoberta"),
+                            ("fetched", "Baixada"),
+                            ("parsed", "Processada"),
+                            ("failed", "Falhou"),
+                        ],
+                        default="discovered",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "failure_reason",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                ("html", models.TextField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("discovered_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "discovered_at"], name="frontier_status_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0010_frontierurl"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("stages", models.CharField(max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Em execução"),
+                            ("success", "Concluída"),
+                            ("failed", "Falhou"),
+                        ],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("summary", models.JSONField(default=dict)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:44
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+# Cópia congelada de serializers.summary_fragment: a migração não depende do
+# código atual do app
+SUMMARY_FIELDS = (
+    ("n", "name"),
+    ("c", "city"),
+    ("d", "event_date"),
+    ("t", "event_time"),
+    ("b", "neighborhood"),
+    ("la", "latitude"),
+    ("lo", "longitude"),
+)
+SUMMARY_SOURCE_FIELDS = ("id",) + tuple(field for _, field in SUMMARY_FIELDS) + ("ticket_info",)
+
+
+def summary_fragment(values):
+    summary = {key: values[field] for key, field in SUMMARY_FIELDS}
+    summary["g"] = values["ticket_info"] == "Grátis"
+    return json.dumps(summary, cls=DjangoJSONEncoder)
+
+
+def fill_summary_json(apps, schema_editor):
+    Bloco = apps.get_model("carnaval_map", "Bloco")
+
+    pending = []
+    for values in Bloco.objects.values(*SUMMARY_SOURCE_FIELDS).iterator(
+        chunk_size=2000
+    ):
+        pending.append(Bloco(id=values["id"], summary_json=summary_fragment(values)))
+        if len(pending) == 2000:
+            Bloco.objects.bulk_update(pending, ["summary_json"])
+            pending = []
+    Bloco.objects.bulk_update(pending, ["summary_json"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0011_ingestrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bloco",
+            name="summary_json",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(fill_summary_json, migrations.RunPython.noop),
+    ]
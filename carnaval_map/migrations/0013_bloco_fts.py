@@ -0,0 +1,73 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:05
+
+from django.db import migrations
+
+# Índice FTS5 de conteúdo externo: o texto fica só em carnaval_map_bloco e os
+# triggers mantêm o índice em dia em qualquer escrita, inclusive bulk_create,
+# update() e delete em cascata
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE carnaval_map_bloco_fts USING fts5(
+        name, subtitle, description, neighborhood,
+        content='carnaval_map_bloco',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER carnaval_map_bloco_fts_insert AFTER INSERT ON carnaval_map_bloco BEGIN
+        INSERT INTO carnaval_map_bloco_fts(rowid, name, subtitle, description, neighborhood)
+        VALUES (new.id, new.name, new.subtitle, new.description, new.neighborhood);
+    END
+    """,
+    """
+    CREATE TRIGGER carnaval_map_bloco_fts_delete AFTER DELETE ON carnaval_map_bloco BEGIN
+        INSERT INTO carnaval_map_bloco_fts(
+            carnaval_map_bloco_fts, rowid, name, subtitle, description, neighborhood
+        )
+        VALUES ('delete', old.id, old.name, old.subtitle, old.description, old.neighborhood);
+    END
+    """,
+    """
+    CREATE TRIGGER carnaval_map_bloco_fts_update
+    AFTER UPDATE OF name, subtitle, description, neighborhood ON carnaval_map_bloco BEGIN
+        INSERT INTO carnaval_map_bloco_fts(
+            carnaval_map_bloco_fts, rowid, name, subtitle, description, neighborhood
+        )
+        VALUES ('delete', old.id, old.name, old.subtitle, old.description, old.neighborhood);
+        INSERT INTO carnaval_map_bloco_fts(rowid, name, subtitle, description, neighborhood)
+        VALUES (new.id, new.name, new.subtitle, new.description, new.neighborhood);
+    END
+    """,
+    "INSERT INTO carnaval_map_bloco_fts(carnaval_map_bloco_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS carnaval_map_bloco_fts_insert",
+    "DROP TRIGGER IF EXISTS carnaval_map_bloco_fts_delete",
+    "DROP TRIGGER IF EXISTS carnaval_map_bloco_fts_update",
+    "DROP TABLE IF EXISTS carnaval_map_bloco_fts",
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 é específico do SQLite; outros bancos usam a busca por icontains
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0012_bloco_summary_json"),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
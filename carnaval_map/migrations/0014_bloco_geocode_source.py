@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:20
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Cópia congelada de geocoding.normalize_address: a migração não depende do
+# código atual do app
+def normalize_address(city, address):
+    text = unicodedata.normalize("NFKD", address or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    text = re.sub(r"[^\w]+", " ", text).strip()
+    return f"{city}|{text}"
+
+
+def fill_geocode_source(apps, schema_editor):
+    Bloco = apps.get_model("carnaval_map", "Bloco")
+    GeocodeCache = apps.get_model("carnaval_map", "GeocodeCache")
+
+    geocoded = Bloco.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    if not GeocodeCache.objects.exists():
+        # Dados anteriores ao cache e ao gazetteer: todos vieram do provedor
+        geocoded.update(geocode_source="provider")
+        return
+
+    # Só as coordenadas iguais às do provedor em cache são confiáveis; as
+    # demais podem ter vindo do gazetteer ou do centro do bairro
+    cached = {
+        entry["key"]: (entry["latitude"], entry["longitude"])
+        for entry in GeocodeCache.objects.filter(status="OK").values(
+            "key", "latitude", "longitude"
+        )
+    }
+    provider_ids = [
+        values["id"]
+        for values in geocoded.values("id", "city", "address", "latitude", "longitude").iterator(
+            chunk_size=2000
+        )
+        if cached.get(normalize_address(values["city"], values["address"]))
+        == (values["latitude"], values["longitude"])
+    ]
+    for start in range(0, len(provider_ids), 500):
+        Bloco.objects.filter(id__in=provider_ids[start : start + 500]).update(
+            geocode_source="provider"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carnaval_map", "0013_bloco_fts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bloco",
+            name="geocode_source",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("provider", "Provedor"),
+                    ("gazetteer", "Gazetteer"),
+                    ("centroid", "Centroide do bairro"),
+                ],
+                max_length=20,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(fill_geocode_source, migrations.RunPython.noop),
+    ]
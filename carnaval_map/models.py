@@ -1,5 +1,7 @@
 from django.db import models
 
+from .serializers import SUMMARY_SOURCE_FIELDS, summary_fragment
+
 
 class RawBloco(models.Model):
     """Armazena os dados brutos coletados via web scraping."""
@@ -13,7 +15,7 @@ class RawBloco(models.Model):
     address = models.CharField(max_length=255)  # Endereço textual
     neighborhood = models.CharField(max_length=100, blank=True, null=True)
     address_gmaps_url = models.URLField(blank=True, null=True)
-    event_page_url = models.URLField(blank=True, null=True)
+    event_page_url = models.URLField(blank=True, null=True, unique=True)
     event_date = models.DateField(blank=True, null=True)
     event_day = models.CharField(max_length=20, blank=True, null=True)
     event_time = models.CharField(max_length=20, blank=True, null=True)
@@ -22,13 +24,58 @@ class RawBloco(models.Model):
     scraped_at = models.DateTimeField(auto_now_add=True)  # Momento da coleta
     processed = models.BooleanField(default=False)  # Indica se já foi processado
 
+    # Impressão digital do conteúdo da página, usada para detectar alterações
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+
     def __str__(self):
         return f"[RAW] {self.name} - {self.city}"
 
 
+class FrontierUrl(models.Model):
+    """Páginas de eventos descobertas e o estágio do pipeline em que cada uma está."""
+
+    DISCOVERED = "discovered"  # Descoberta, ainda não baixada
+    FETCHED = "fetched"  # Baixada, mas o parse falhou; o HTML fica guardado
+    PARSED = "parsed"  # RawBloco gravado
+    FAILED = "failed"  # Download falhou
+    STATUS_CHOICES = [
+        (DISCOVERED, "Descoberta"),
+        (FETCHED, "Baixada"),
+        (PARSED, "Processada"),
+        (FAILED, "Falhou"),
+    ]
+
+    city = models.CharField(max_length=100)
+    url = models.URLField(unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=DISCOVERED)
+    failure_reason = models.CharField(max_length=50, blank=True, null=True)
+    html = models.TextField(blank=True, null=True)  # Só enquanto o parse não der certo
+    attempts = models.PositiveIntegerField(default=0)  # Downloads tentados
+    discovered_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "discovered_at"], name="frontier_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.url} [{self.status}]"
+
+
 class Bloco(models.Model):
     """Armazena os dados limpos e transformados dos blocos de carnaval."""
 
+    # Origem das coordenadas: só as do provedor alimentam o gazetteer
+    PROVIDER = "provider"  # Geocodificadas pelo provedor (ou pelo cache dele)
+    GAZETTEER = "gazetteer"  # Copiadas de outro bloco pelo gazetteer
+    CENTROID = "centroid"  # Mediana do bairro, quando nada foi encontrado
+    GEOCODE_SOURCE_CHOICES = [
+        (PROVIDER, "Provedor"),
+        (GAZETTEER, "Gazetteer"),
+        (CENTROID, "Centroide do bairro"),
+    ]
+
     raw_data = models.OneToOneField(
         RawBloco, on_delete=models.CASCADE, related_name="cleaned_data"
     )
@@ -52,19 +99,102 @@ class Bloco(models.Model):
     # Coordenadas (serão preenchidas posteriormente)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    geocode_source = models.CharField(
+        max_length=20, choices=GEOCODE_SOURCE_CHOICES, blank=True, null=True
+    )
 
     processed_at = models.DateTimeField(auto_now=True)  # Momento da última atualização
 
+    # JSON público do resumo (sem o id), renderizado na gravação e
+    # concatenado pelo endpoint de filtros
+    summary_json = models.TextField(blank=True, default="")
+
+    class Meta:
+        # Índices alinhados aos filtros do mapa (cidade, data, bairro), todos
+        # terminando em event_date para servir também à ordenação
+        indexes = [
+            models.Index(fields=["event_date"], name="bloco_date_idx"),
+            models.Index(fields=["city", "event_date"], name="bloco_city_date_idx"),
+            models.Index(
+                fields=["city", "neighborhood", "event_date"], name="bloco_city_nbhd_date_idx"
+            ),
+            models.Index(fields=["neighborhood", "event_date"], name="bloco_nbhd_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.city}"
 
+    def render_summary(self):
+        """Renderiza summary_json a partir dos valores atuais dos campos."""
+        values = {
+            field: self._meta.get_field(field).to_python(getattr(self, field))
+            for field in SUMMARY_SOURCE_FIELDS
+            if field != "id"
+        }
+        self.summary_json = summary_fragment(values)
+        return self.summary_json
+
+    def save(self, *args, **kwargs):
+        self.render_summary()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "summary_json"}
+        super().save(*args, **kwargs)
+
 
 class City(models.Model):
     """Armazena informações sobre a cidade e suas coordenadas médias."""
     
     name = models.CharField(max_length=100, unique=True)
-    avg_latitude = models.FloatField(blank=True, null=True)
+    avg_latitude = models.FloatField(blank=True, null=True)  # Centro da bounding box
     avg_longitude = models.FloatField(blank=True, null=True)
 
+    # Estatísticas dos blocos geocodificados da cidade
+    min_latitude = models.FloatField(blank=True, null=True)
+    max_latitude = models.FloatField(blank=True, null=True)
+    min_longitude = models.FloatField(blank=True, null=True)
+    max_longitude = models.FloatField(blank=True, null=True)
+    centroid_latitude = models.FloatField(blank=True, null=True)  # Média dos pontos
+    centroid_longitude = models.FloatField(blank=True, null=True)
+    bloco_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.avg_latitude}, {self.avg_longitude})"
+
+
+class GeocodeCache(models.Model):
+    """Resultados de geocodificação, reaproveitados entre blocos com o mesmo endereço."""
+
+    key = models.CharField(max_length=400, unique=True)  # cidade + endereço normalizados
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    status = models.CharField(max_length=30)  # Status retornado pelo provedor
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} [{self.status}]"
+
+
+class IngestRun(models.Model):
+    """Histórico das execuções do web_scraping, com as métricas de cada estágio."""
+
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (RUNNING, "Em execução"),
+        (SUCCESS, "Concluída"),
+        (FAILED, "Falhou"),
+    ]
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    stages = models.CharField(max_length=100)  # Estágios executados, separados por vírgula
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    summary = models.JSONField(default=dict)  # Contadores e histogramas por estágio
+
+    class Meta:
+        ordering = ["-started_at"]
+
     def __str__(self):
-        return f"{self.name} ({self.avg_latitude}, {self.avg_longitude})"
\ No newline at end of file
+        return f"{self.started_at:%Y-%m-%d %H:%M} [{self.status}] {self.stages}"
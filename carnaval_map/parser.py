@@ -0,0 +1,163 @@
+"""
+Single-pass parser for blocosderua.com event pages.
+
+Only the tags that carry event data (h1, h2, p and h6) are built into the
+tree, and the fields are picked in one walk over them in document order.
+The extracted values match the previous ``fetch_event_page`` output exactly.
+"""
+
+import hashlib
+import re
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+EVENT_TAGS = ("h1", "h2", "p", "h6")
+EVENT_STRAINER = SoupStrainer(EVENT_TAGS)
+
+TITLE_CLASSES = {"text-secondary", "h2", "text-center"}
+SUBTITLE_CLASSES = {"card-text", "text-white", "h6", "text-center", "text-default"}
+
+NEIGHBORHOOD_RE = re.compile(r"\d{2}/\d{2}/\d{4} - .*? - \d{2}:\d{2}\s*(.*)")
+
+# Campos que definem o conteúdo de um evento para a detecção de alterações
+FINGERPRINT_FIELDS = (
+    "name", "subtitle", "description", "ticket_info", "ticket_url", "address",
+    "neighborhood", "address_gmaps_url", "event_date", "event_day", "event_time",
+)
+
+
+@dataclass(frozen=True)
+class EventRecord:
+    """Fields extracted from an event page, ready to build a RawBloco."""
+
+    city: str
+    name: str
+    subtitle: str
+    description: str
+    ticket_info: str
+    ticket_url: str
+    address: str
+    address_gmaps_url: str
+    event_page_url: str
+    event_date: str
+    event_day: str
+    event_time: str
+    neighborhood: str | None
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class ParseError(Exception):
+    """
+    An event page could not be parsed.
+
+    Attributes:
+        reason (str): Machine-readable cause, e.g. "missing_subtitle".
+        url (str): The page URL.
+    """
+
+    def __init__(self, reason, url, detail=""):
+        self.reason = reason
+        self.url = url
+        self.detail = detail
+        super().__init__(f"{reason}: {url}{f' ({detail})' if detail else ''}")
+
+
+def _has_class(tag, classes):
+    return not classes.isdisjoint(tag.get("class") or ())
+
+
+def parse_event_page(html, city, url):
+    """
+    Extracts the event fields of an event page.
+
+    Args:
+        html (str): The event page HTML.
+        city (str): The city associated with the event.
+        url (str): The URL of the event page.
+
+    Returns:
+        EventRecord: The extracted event.
+
+    Raises:
+        ParseError: If a required element is missing or malformed.
+    """
+    soup = BeautifulSoup(html, "html.parser", parse_only=EVENT_STRAINER)
+
+    title = subtitle = description = None
+    h6_tags = []
+    for tag in soup.find_all(EVENT_TAGS):
+        if tag.name == "h6":
+            h6_tags.append(tag)
+        elif tag.name == "h1":
+            if title is None and _has_class(tag, TITLE_CLASSES):
+                title = tag
+        elif tag.name == "h2":
+            if subtitle is None and _has_class(tag, SUBTITLE_CLASSES):
+                subtitle = tag
+        elif subtitle is not None and description is None:
+            description = tag
+
+    if title is None:
+        raise ParseError("missing_title", url)
+    if subtitle is None:
+        raise ParseError("missing_subtitle", url)
+    if description is None:
+        raise ParseError("missing_description", url)
+    if len(h6_tags) < 2:
+        raise ParseError("missing_ticket_or_address", url, f"{len(h6_tags)} h6 found")
+
+    ticket_tag, address_tag = h6_tags[0], h6_tags[1]
+    ticket_link = ticket_tag.find("a")
+    address_link = address_tag.find("a")
+    if address_link is None or not address_link.get("href"):
+        raise ParseError("missing_address_link", url)
+
+    subtitle_text = subtitle.text
+    parts = subtitle_text.split(" - ")
+    if len(parts) != 3:
+        raise ParseError("bad_subtitle", url, subtitle_text)
+    event_date, event_day, event_time = parts
+
+    try:
+        event_date = datetime.strptime(event_date, "%d/%m/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ParseError("bad_date", url, event_date)
+
+    match = NEIGHBORHOOD_RE.search(subtitle_text)
+
+    return EventRecord(
+        city=city,
+        name=title.text,
+        subtitle=subtitle_text,
+        description=description.text,
+        ticket_info=ticket_tag.text.strip(),
+        ticket_url=ticket_link.get("href", "") if ticket_link else "",
+        address=address_tag.text.strip(),
+        address_gmaps_url=address_link["href"],
+        event_page_url=url,
+        event_date=event_date,
+        event_day=event_day,
+        event_time=event_time.split(" ")[0],
+        neighborhood=match.group(1).strip() if match else None,
+    )
+
+
+def fingerprint_event(data):
+    """
+    Computes the content fingerprint of an event.
+
+    Works both for freshly parsed pages and for stored RawBloco values, so a
+    row saved before fingerprints existed can be compared too.
+
+    Args:
+        data (dict): The event fields.
+
+    Returns:
+        str: The SHA-256 hex digest of the FINGERPRINT_FIELDS.
+    """
+    content = "\x1f".join(str(data.get(field) or "") for field in FINGERPRINT_FIELDS)
+    return hashlib.sha256(content.encode()).hexdigest()
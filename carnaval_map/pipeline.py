@@ -0,0 +1,254 @@
+"""
+Streaming fetch → parse → write pipeline for new event pages.
+
+The crawl runs in a producer thread: each fetched page is parsed right away
+and the RawBloco is pushed into a bounded queue, so memory stays flat no
+matter how many pages there are. A single writer (the calling thread, which
+owns the database connection) drains the queue with ``bulk_create`` in
+small batches, each in its own short transaction.
+
+With ``track_frontier`` the outcome of every page is also checkpointed on
+its FrontierUrl row in the same transaction: parsed pages are marked as
+parsed, pages that failed to parse keep their HTML for a later offline
+parse, and failed downloads are counted for a later retry.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import FrontierUrl, RawBloco
+from .parser import ParseError, fingerprint_event, parse_event_page
+
+_DONE = object()
+
+
+class PageResult(NamedTuple):
+    """Outcome of one event page, as queued for the writer."""
+
+    url: str
+    raw_bloco: RawBloco | None
+    reason: str | None = None
+    html: str | None = None
+
+
+class RawBlocoPipeline:
+    """
+    Fetches, parses and stores event pages with bounded memory.
+    """
+
+    def __init__(
+        self, crawler, batch_size=100, queue_size=500, flush_interval=2.0, track_frontier=False
+    ):
+        """
+        Args:
+            crawler (Crawler): The crawl engine.
+            batch_size (int): Rows written per bulk_create/transaction.
+            queue_size (int): Parsed rows waiting to be written before the
+                fetch workers block.
+            flush_interval (float): Seconds after which a partial batch is
+                written anyway.
+            track_frontier (bool): Checkpoint each page on its FrontierUrl.
+        """
+        self.crawler = crawler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.track_frontier = track_frontier
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.failures = Counter()
+        self.saved = 0
+        self.write_seconds = 0.0
+
+    def run(self, events):
+        """
+        Runs the pipeline to completion.
+
+        Args:
+            events (list): (city, event_url) pairs.
+
+        Returns:
+            int: The number of RawBloco rows written.
+        """
+        errors = []
+
+        def produce():
+            try:
+                self.crawler.run(self._produce(events))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.queue.put(_DONE)
+
+        producer = threading.Thread(target=produce, name="raw-bloco-producer", daemon=True)
+        producer.start()
+        self._consume()
+        producer.join()
+
+        if errors:
+            raise errors[0]
+        return self.saved
+
+    async def _produce(self, events):
+        await asyncio.gather(*(self._fetch_and_parse(city, url) for city, url in events))
+
+    async def _fetch_and_parse(self, city, url):
+        label = f"{city} - {url.split('/')[-2]}"
+        html = await self.crawler.fetch_text(url)
+        metrics.incr("items")
+        if html is None:
+            self.failures["fetch_failed"] += 1
+            metrics.incr("fetch_failed")
+            print(f"{label} falhou: fetch_failed")
+            result = PageResult(url, None, "fetch_failed")
+        else:
+            result = parse_page(city, url, html)
+            if result.reason is not None:
+                self.failures[result.reason] += 1
+                print(f"{label} falhou: {result.reason}")
+
+        if result.raw_bloco is None and not self.track_frontier:
+            return
+        # put() bloqueia quando a fila está cheia: roda fora do event loop
+        await asyncio.to_thread(self.queue.put, result)
+
+    def _consume(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item is _DONE:
+                break
+            if item is not None:
+                batch.append(item)
+
+            flush_due = time.monotonic() - last_flush >= self.flush_interval
+            if len(batch) >= self.batch_size or (batch and flush_due):
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        raw_blocos = [result.raw_bloco for result in batch if result.raw_bloco is not None]
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                inserted = insert_raw_blocos(raw_blocos)
+                if self.track_frontier:
+                    checkpoint_frontier(batch)
+        except Exception as e:
+            self.failures["save_failed"] += len(raw_blocos)
+            metrics.incr("save_failed", len(raw_blocos))
+            print(f"Erro ao salvar lote de {len(raw_blocos)} blocos: {e}")
+            return
+        finally:
+            elapsed = time.perf_counter() - start
+            self.write_seconds += elapsed
+            metrics.observe("db.write", elapsed)
+
+        metrics.incr("db.rows", inserted)
+
+        self.saved += inserted
+        print(f"{self.saved} blocos salvos no banco.")
+
+
+def insert_raw_blocos(raw_blocos):
+    """
+    Inserts RawBlocos, skipping the URLs already stored (unique index).
+
+    ``bulk_create(ignore_conflicts=True)`` does not report which rows were
+    skipped, so the stored URLs are looked up first; call it inside the
+    transaction of the write.
+
+    Args:
+        raw_blocos (list): Unsaved RawBloco objects.
+
+    Returns:
+        int: The number of rows actually inserted.
+    """
+    urls = {raw.event_page_url for raw in raw_blocos if raw.event_page_url}
+    existing = set(
+        RawBloco.objects.filter(event_page_url__in=urls).values_list("event_page_url", flat=True)
+    )
+
+    inserted = 0
+    for raw in raw_blocos:
+        url = raw.event_page_url
+        if url is None or url not in existing:
+            inserted += 1
+            if url is not None:
+                existing.add(url)  # Repetida no próprio lote: só a primeira entra
+
+    RawBloco.objects.bulk_create(raw_blocos, ignore_conflicts=True)
+    return inserted
+
+
+def parse_page(city, url, html):
+    """
+    Parses an event page into the PageResult queued for the writer.
+
+    Args:
+        city (str): The city slug.
+        url (str): The page URL.
+        html (str): The page body.
+
+    Returns:
+        PageResult: The RawBloco, or the failure reason and the HTML.
+    """
+    with metrics.timer("parse"):
+        try:
+            data = parse_event_page(html, city, url).as_dict()
+        except ParseError as e:
+            metrics.incr(f"parse_failed.{e.reason}")
+            return PageResult(url, None, e.reason, html)
+
+    metrics.incr("parsed")
+    return PageResult(url, RawBloco(**data, content_hash=fingerprint_event(data)))
+
+
+def checkpoint_frontier(results, downloaded=True):
+    """
+    Records the outcome of a batch of pages on their FrontierUrl rows.
+
+    Args:
+        results (list): PageResult objects.
+        downloaded (bool): Whether the pages were downloaded, which counts
+            as an attempt, or parsed again from the stored HTML.
+    """
+    parsed = [result.url for result in results if result.raw_bloco is not None]
+    fetch_failed = [result.url for result in results if result.reason == "fetch_failed"]
+    attempted = {"updated_at": timezone.now()}
+    if downloaded:
+        attempted["attempts"] = F("attempts") + 1
+
+    FrontierUrl.objects.filter(url__in=parsed).update(
+        status=FrontierUrl.PARSED, failure_reason=None, html=None, **attempted
+    )
+    FrontierUrl.objects.filter(url__in=fetch_failed).update(
+        status=FrontierUrl.FAILED, failure_reason="fetch_failed", **attempted
+    )
+
+    # Parse falhou: guarda o HTML para reprocessar sem baixar de novo
+    for result in results:
+        if result.html is not None:
+            FrontierUrl.objects.filter(url=result.url).update(
+                status=FrontierUrl.FETCHED,
+                failure_reason=result.reason,
+                html=result.html,
+                **attempted,
+            )
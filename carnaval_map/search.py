@@ -0,0 +1,190 @@
+"""
+Full-text search over the blocos, backed by the SQLite FTS5 index created in
+migration 0013.
+
+The index covers name, subtitle, description and neighborhood and is kept in
+sync by triggers on the bloco table. Django rebuilds that table on SQLite
+whenever a migration adds or alters one of its fields, dropping the
+triggers, so they are recreated after every ``migrate``. Its unicode61 tokenizer folds case and
+diacritics, so "cordao" finds "Cordão"; every search term is a prefix, so
+"bola pre" finds "Cordão da Bola Preta" while the user is still typing.
+Other databases fall back to ``icontains`` filters.
+"""
+
+import logging
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .models import Bloco
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "carnaval_map_bloco_fts"
+
+# Mesmos triggers da migração 0013, recriados se uma reconstrução da tabela os apagar
+FTS_TRIGGERS = {
+    "carnaval_map_bloco_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS carnaval_map_bloco_fts_insert
+        AFTER INSERT ON carnaval_map_bloco BEGIN
+            INSERT INTO carnaval_map_bloco_fts(rowid, name, subtitle, description, neighborhood)
+            VALUES (new.id, new.name, new.subtitle, new.description, new.neighborhood);
+        END
+    """,
+    "carnaval_map_bloco_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS carnaval_map_bloco_fts_delete
+        AFTER DELETE ON carnaval_map_bloco BEGIN
+            INSERT INTO carnaval_map_bloco_fts(
+                carnaval_map_bloco_fts, rowid, name, subtitle, description, neighborhood
+            )
+            VALUES ('delete', old.id, old.name, old.subtitle, old.description, old.neighborhood);
+        END
+    """,
+    "carnaval_map_bloco_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS carnaval_map_bloco_fts_update
+        AFTER UPDATE OF name, subtitle, description, neighborhood ON carnaval_map_bloco BEGIN
+            INSERT INTO carnaval_map_bloco_fts(
+                carnaval_map_bloco_fts, rowid, name, subtitle, description, neighborhood
+            )
+            VALUES ('delete', old.id, old.name, old.subtitle, old.description, old.neighborhood);
+            INSERT INTO carnaval_map_bloco_fts(rowid, name, subtitle, description, neighborhood)
+            VALUES (new.id, new.name, new.subtitle, new.description, new.neighborhood);
+        END
+    """,
+}
+MAX_TERMS = 8
+
+# Pesos do bm25 por coluna: name, subtitle, description, neighborhood
+COLUMN_WEIGHTS = (10.0, 2.0, 1.0, 4.0)
+
+TERM_RE = re.compile(r"\w+")
+
+
+def search_terms(text):
+    """
+    Splits the user input into search terms, dropping punctuation and the
+    FTS5 query syntax.
+
+    Args:
+        text (str): The raw query.
+
+    Returns:
+        list: At most MAX_TERMS words.
+    """
+    return TERM_RE.findall(text or "")[:MAX_TERMS]
+
+
+def match_expression(terms):
+    """
+    Builds the FTS5 MATCH expression requiring every term as a prefix.
+
+    Args:
+        terms (list): The search terms.
+
+    Returns:
+        str: E.g. '"bola"* "preta"*'.
+    """
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_bloco_ids(text, city="", date=None, neighborhood="", limit=50):
+    """
+    Searches the blocos, best matches first.
+
+    Args:
+        text (str): The query typed by the user.
+        city (str): Restricts the results to a city.
+        date (date): Restricts the results to an event date.
+        neighborhood (str): Restricts the results to a neighborhood.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: The ids of the matching blocos.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+
+    if connection.vendor != "sqlite":
+        return fallback_search_ids(terms, city, date, neighborhood, limit)
+
+    sql = [
+        f"SELECT bloco.id FROM {FTS_TABLE}",
+        f"JOIN {Bloco._meta.db_table} AS bloco ON bloco.id = {FTS_TABLE}.rowid",
+        f"WHERE {FTS_TABLE} MATCH %s",
+    ]
+    params = [match_expression(terms)]
+    if city:
+        sql.append("AND bloco.city = %s")
+        params.append(city)
+    if date:
+        sql.append("AND bloco.event_date = %s")
+        params.append(date.isoformat())
+    if neighborhood:
+        sql.append("AND bloco.neighborhood = %s")
+        params.append(neighborhood)
+
+    weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+    sql.append(f"ORDER BY bm25({FTS_TABLE}, {weights}), bloco.event_date, bloco.id LIMIT %s")
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(" ".join(sql), params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback_search_ids(terms, city, date, neighborhood, limit):
+    """Same contract as ``search_bloco_ids``, with icontains on the name."""
+    query = Bloco.objects.order_by("event_date", "id")
+    if city:
+        query = query.filter(city=city)
+    if date:
+        query = query.filter(event_date=date)
+    if neighborhood:
+        query = query.filter(neighborhood=neighborhood)
+    for term in terms:
+        query = query.filter(name__icontains=term)
+    return list(query.values_list("id", flat=True)[:limit])
+
+
+def ensure_fts_triggers(using=DEFAULT_DB_ALIAS):
+    """
+    Recreates the FTS sync triggers that are missing and rebuilds the index,
+    since writes made without the triggers never reached it.
+
+    Does nothing on other databases or before migration 0013 is applied.
+
+    Args:
+        using (str): The database alias.
+
+    Returns:
+        list: The names of the recreated triggers.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return []
+
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE name = %s OR type = 'trigger'",
+            [FTS_TABLE],
+        )
+        existing = cursor.fetchall()
+        if ("table", FTS_TABLE) not in existing:
+            return []
+
+        missing = [name for name in FTS_TRIGGERS if ("trigger", name) not in existing]
+        if not missing:
+            return []
+
+        for name in missing:
+            cursor.execute(FTS_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    logger.warning("Search triggers recreated: %s", ", ".join(missing))
+    return missing
+
+
+def restore_fts_triggers(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate handler: see ``ensure_fts_triggers``."""
+    ensure_fts_triggers(using)
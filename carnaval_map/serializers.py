@@ -0,0 +1,96 @@
+"""Public JSON representations of a Bloco."""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+FREE_TICKET_INFO = "Grátis"
+
+# Projeção compacta usada pelo mapa e pela lista: (chave curta, campo do modelo)
+SUMMARY_FIELDS = (
+    ("id", "id"),
+    ("n", "name"),
+    ("c", "city"),
+    ("d", "event_date"),
+    ("t", "event_time"),
+    ("b", "neighborhood"),
+    ("la", "latitude"),
+    ("lo", "longitude"),
+)
+
+# Campos que precisam ser lidos do banco para montar o resumo
+SUMMARY_SOURCE_FIELDS = tuple(field for _, field in SUMMARY_FIELDS) + ("ticket_info",)
+
+# Campos completos, enviados apenas sob demanda pelo endpoint de detalhe
+DETAIL_FIELDS = (
+    "id", "name", "city", "subtitle", "event_date", "event_day", "event_time",
+    "description", "ticket_info", "ticket_url", "latitude", "longitude",
+    "neighborhood", "event_page_url", "address_gmaps_url", "address",
+)
+
+
+def summarize(values):
+    """
+    Builds the compact summary of a bloco.
+
+    Args:
+        values (dict): The bloco values, with at least SUMMARY_SOURCE_FIELDS.
+
+    Returns:
+        dict: The summary, with short keys and the "g" (free) flag.
+    """
+    summary = {key: values[field] for key, field in SUMMARY_FIELDS}
+    summary["g"] = values["ticket_info"] == FREE_TICKET_INFO
+    return summary
+
+
+def summary_fragment(values):
+    """
+    Renders the JSON of the summary without the "id" key, as stored in
+    ``Bloco.summary_json``. Leaving the id out lets the fragment be rendered
+    before the row is inserted; ``bloco_json`` puts it back.
+
+    Args:
+        values (dict): The bloco values, with at least SUMMARY_SOURCE_FIELDS
+            except "id".
+
+    Returns:
+        str: The JSON object, encoded exactly as JsonResponse would.
+    """
+    summary = summarize(dict(values, id=None))
+    del summary["id"]
+    return json.dumps(summary, cls=DjangoJSONEncoder)
+
+
+def bloco_json(pk, fragment):
+    """
+    Returns the JSON of a bloco summary from its id and stored fragment.
+
+    Args:
+        pk (int): The bloco id.
+        fragment (str): The output of ``summary_fragment``.
+
+    Returns:
+        str: The same text as ``json.dumps(summarize(values), cls=DjangoJSONEncoder)``.
+    """
+    return f'{{"id": {pk}, {fragment[1:]}'
+
+
+def filter_response_json(blocos, dates, neighborhoods):
+    """
+    Assembles the body of the filter response from pre-rendered blocos.
+
+    Args:
+        blocos (list): The JSON of each bloco summary, in order.
+        dates (list): (date, label) pairs.
+        neighborhoods (list): The neighborhood names.
+
+    Returns:
+        str: The same text as JsonResponse({"blocos": ..., "dates": ...,
+        "neighborhoods": ...}).
+    """
+    return (
+        f'{{"blocos": [{", ".join(blocos)}], '
+        f'"dates": {json.dumps(dates, cls=DjangoJSONEncoder)}, '
+        f'"neighborhoods": {json.dumps(neighborhoods, cls=DjangoJSONEncoder)}}}'
+    )
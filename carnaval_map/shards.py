@@ -0,0 +1,134 @@
+"""
+Static JSON shards of the filter responses, exported once per ingest.
+
+Every shard holds exactly the body that ``/filter-blocos/`` returns for one
+filter combination: a city, a city and a date, or a city and a
+neighborhood. File names are content hashes, so shards are immutable and
+can be cached forever by browsers and CDNs; a shard manifest, also
+content-hashed, maps each combination to its URL. The index page receives
+the manifest URL through the snapshot manifest and only falls back to the
+dynamic endpoint for combinations without a shard.
+"""
+
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+
+from .facets import get_facet_index
+from .serializers import filter_response_json
+from .snapshot import ENCODINGS, get_snapshot_root, read_manifest, write_atomic
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele servimos apenas gzip
+    brotli = None
+
+
+def get_shard_root():
+    return get_snapshot_root() / "shards"
+
+
+def shard_url(name):
+    return f"{settings.SHARD_URL}{name}"
+
+
+def write_shard(body):
+    """
+    Writes a content-hashed shard and its compressed variants, unless a
+    shard with the same content already exists.
+
+    Args:
+        body (bytes): The shard content.
+
+    Returns:
+        str: The file name of the shard.
+    """
+    name = f"{hashlib.sha256(body).hexdigest()[:16]}.json"
+    path = get_shard_root() / name
+    if path.exists():
+        return name
+
+    # Variantes comprimidas só quando compensam, como faz o whitenoise
+    variants = [("gzip", gzip.compress(body, compresslevel=9))]
+    if brotli is not None:
+        variants.append(("br", brotli.compress(body)))
+    for encoding, compressed in variants:
+        if len(compressed) < len(body) * 0.95:
+            write_atomic(path.with_name(name + dict(ENCODINGS)[encoding]), compressed)
+    write_atomic(path, body)
+    return name
+
+
+def manifest_files(manifest):
+    """Returns the names of the shards listed in a shard manifest."""
+    urls = []
+    for city in manifest["cities"].values():
+        urls += [city["url"], *city["dates"].values(), *city["neighborhoods"].values()]
+    return {url.rsplit("/", 1)[-1] for url in urls}
+
+
+def previous_manifest():
+    """
+    Loads the shard manifest currently referenced by the snapshot.
+
+    Returns:
+        tuple: (file name, manifest) or (None, None) when there is none.
+    """
+    url = (read_manifest() or {}).get("shards")
+    if not url:
+        return None, None
+    name = url.rsplit("/", 1)[-1]
+    try:
+        return name, json.loads((get_shard_root() / name).read_bytes())
+    except (OSError, ValueError):
+        return None, None
+
+
+def export_shards():
+    """
+    Writes the shards of the current data version and their manifest, then
+    removes the files not referenced by the new or the previous manifest.
+
+    Returns:
+        str: The URL of the new shard manifest.
+    """
+    root = get_shard_root()
+    root.mkdir(parents=True, exist_ok=True)
+    index = get_facet_index()
+
+    def export(city, date=None, neighborhood=""):
+        body = filter_response_json(*index.filter_response(city, date, neighborhood))
+        return shard_url(write_shard(body.encode()))
+
+    cities = {}
+    for city in sorted(index.postings["city"]):
+        facets = index.city_facets[city]
+        cities[city] = {
+            "url": export(city),
+            "dates": {
+                value.isoformat(): export(city, date=value)
+                for value, _ in facets["dates"]
+                if value
+            },
+            "neighborhoods": {
+                value: export(city, neighborhood=value)
+                for value, _ in facets["neighborhoods"]
+                if value
+            },
+        }
+
+    manifest = {"version": index.version, "cities": cities}
+    manifest_name = write_shard(json.dumps(manifest).encode())
+
+    # Mantém os shards anteriores para clientes que ainda usam o manifesto antigo
+    keep = {manifest_name, *manifest_files(manifest)}
+    previous_name, previous = previous_manifest()
+    if previous is not None:
+        keep |= {previous_name, *manifest_files(previous)}
+    for path in root.glob("*.json*"):
+        if path.name.split(".")[0] + ".json" not in keep:
+            path.unlink(missing_ok=True)
+
+    return shard_url(manifest_name)
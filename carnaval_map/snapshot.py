@@ -0,0 +1,138 @@
+"""
+Snapshot of the published blocos, written to disk once per ingest and served
+as an immutable, versioned JSON file.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Bloco
+from .serializers import SUMMARY_SOURCE_FIELDS, summarize
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele servimos apenas gzip
+    brotli = None
+
+
+MANIFEST_NAME = "manifest.json"
+
+# Encodings pré-comprimidos, na ordem de preferência: (Content-Encoding, extensão)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+_manifest_cache = {"mtime": None, "manifest": None}
+
+
+def get_snapshot_root():
+    return Path(settings.SNAPSHOT_ROOT)
+
+
+def snapshot_path(version, encoding=None):
+    """
+    Returns the path of a snapshot file.
+
+    Args:
+        version (str): The snapshot version.
+        encoding (str): "br", "gzip" or None for the uncompressed body.
+
+    Returns:
+        Path: The path of the snapshot file.
+    """
+    suffix = dict(ENCODINGS).get(encoding, "")
+    return get_snapshot_root() / f"blocos-{version}.json{suffix}"
+
+
+def write_atomic(path, content):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(shards=None):
+    """
+    Serializes the summary of every Bloco into a versioned snapshot and its
+    compressed variants, then points the manifest at it.
+
+    The version is derived from the snapshot content, so rebuilding without
+    changes keeps the same URL (and the browser cache) valid.
+
+    Args:
+        shards (str): URL of the shard manifest exported for the same data.
+
+    Returns:
+        dict: The new manifest.
+    """
+    blocos = list(Bloco.objects.values(*SUMMARY_SOURCE_FIELDS).order_by("event_date", "id"))
+    summaries = [summarize(bloco) for bloco in blocos]
+    body = json.dumps(summaries, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    version = hashlib.sha256(body).hexdigest()[:16]
+
+    root = get_snapshot_root()
+    root.mkdir(parents=True, exist_ok=True)
+
+    write_atomic(snapshot_path(version), body)
+    write_atomic(snapshot_path(version, "gzip"), gzip.compress(body, compresslevel=9))
+    if brotli is not None:
+        write_atomic(snapshot_path(version, "br"), brotli.compress(body))
+
+    # Reconstruir sem mudanças não pode descartar a versão anterior
+    previous = read_manifest() or {}
+    if previous.get("version") == version:
+        previous_version = previous.get("previous")
+    else:
+        previous_version = previous.get("version")
+
+    manifest = {
+        "version": version,
+        "count": len(blocos),
+        "cities": sorted({bloco["city"] for bloco in blocos}),
+        "dates": sorted(
+            {bloco["event_date"].isoformat() for bloco in blocos if bloco["event_date"]}
+        ),
+    }
+    if previous_version:
+        manifest["previous"] = previous_version
+    if shards:
+        manifest["shards"] = shards
+    write_atomic(root / MANIFEST_NAME, json.dumps(manifest).encode())
+
+    # Mantém a versão anterior para clientes que ainda carregam o HTML antigo
+    keep = {version, previous_version}
+    for path in root.glob("blocos-*.json*"):
+        if path.name.split(".")[0].removeprefix("blocos-") not in keep:
+            path.unlink(missing_ok=True)
+
+    return manifest
+
+
+def read_manifest():
+    """
+    Reads the current manifest, reusing the parsed copy while the file is
+    unchanged.
+
+    Returns:
+        dict: The manifest or None if no snapshot was built yet.
+    """
+    path = get_snapshot_root() / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if _manifest_cache["mtime"] != mtime:
+        with open(path, "rb") as f:
+            _manifest_cache["manifest"] = json.load(f)
+        _manifest_cache["mtime"] = mtime
+    return _manifest_cache["manifest"]
+
+
+def get_manifest():
+    """Returns the current manifest, building the first snapshot if needed."""
+    return read_manifest() or build_snapshot()
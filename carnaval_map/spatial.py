@@ -0,0 +1,78 @@
+"""Uniform lat/lng grid used to answer bounding-box queries without a scan."""
+
+import math
+
+
+class GridIndex:
+    """
+    Buckets point positions into square cells of ``cell_size`` degrees.
+
+    A bounding-box query visits only the cells it overlaps; points are checked
+    individually just in the cells crossed by the box border.
+    """
+
+    def __init__(self, points, cell_size=0.01):
+        """
+        Args:
+            points (iterable): (position, latitude, longitude) tuples. Points
+                without coordinates are skipped.
+            cell_size (float): The cell side, in degrees.
+        """
+        self.cell_size = cell_size
+        cells = {}
+        self.coords = {}
+        for position, latitude, longitude in points:
+            if latitude is None or longitude is None:
+                continue
+            self.coords[position] = (latitude, longitude)
+            cells.setdefault(self._cell(latitude, longitude), []).append(position)
+        self.cells = {cell: tuple(positions) for cell, positions in cells.items()}
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    def query(self, south, west, north, east):
+        """
+        Returns the positions of the points inside a bounding box.
+
+        Args:
+            south (float): Minimum latitude.
+            west (float): Minimum longitude.
+            north (float): Maximum latitude.
+            east (float): Maximum longitude.
+
+        Returns:
+            set: The positions inside the box (borders included).
+        """
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+
+        # Caixas muito grandes: percorrer só as células ocupadas é mais barato
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            candidates = [
+                cell
+                for cell in self.cells
+                if min_row <= cell[0] <= max_row and min_col <= cell[1] <= max_col
+            ]
+        else:
+            candidates = [
+                (row, col)
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in self.cells
+            ]
+
+        result = set()
+        for row, col in candidates:
+            positions = self.cells[(row, col)]
+            if min_row < row < max_row and min_col < col < max_col:
+                result.update(positions)
+                continue
+            for position in positions:
+                latitude, longitude = self.coords[position]
+                if south <= latitude <= north and west <= longitude <= east:
+                    result.add(position)
+        return result
@@ -4,6 +4,8 @@ document.addEventListener("DOMContentLoaded", () => {
 	const TILE_LAYER_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png";
 	const TILE_LAYER_ATTRIBUTION = '&copy; <a href="http://www.openstreetmap.org/copyright">OpenStreetMap</a>';
 	const DISPLAYED_BLOCOS_COUNT = 5;
+	const SEARCH_DELAY_MS = 250;
+	const SEARCH_MIN_LENGTH = 2;
 
 	const ICON_CONFIG = {
 		freeUpcoming: { markerColor: "green", icon: "star" },
@@ -23,6 +25,38 @@ document.addEventListener("DOMContentLoaded", () => {
 	let markers = [];
 	let allBlocos = [];
 	let displayedCount = DISPLAYED_BLOCOS_COUNT;
+	let viewportRequestId = 0;
+	let shardManifest = null;
+	let searchTimeout = null;
+	let searchRequestId = 0;
+	const blocoDetails = new Map();
+
+	function expandSummary(summary) {
+		return {
+			id: summary.id,
+			name: summary.n,
+			city: summary.c,
+			event_date: summary.d,
+			event_time: summary.t,
+			neighborhood: summary.b,
+			latitude: summary.la,
+			longitude: summary.lo,
+			free: summary.g
+		};
+	}
+
+	function fetchBlocoDetail(id) {
+		if (!blocoDetails.has(id)) {
+			const request = fetch(`/blocos/${id}/`).then((response) => {
+				if (!response.ok) throw new Error(`HTTP ${response.status}`);
+				return response.json();
+			});
+			// Falhas não ficam no cache para permitir nova tentativa
+			request.catch(() => blocoDetails.delete(id));
+			blocoDetails.set(id, request);
+		}
+		return blocoDetails.get(id);
+	}
 
 	function initializeMap(center, zoom) {
 		map = L.map("map").setView(center, zoom);
@@ -31,6 +65,7 @@ document.addEventListener("DOMContentLoaded", () => {
 			attribution: TILE_LAYER_ATTRIBUTION
 		}).addTo(map);
 
+		map.on("moveend", updateMarkers);
 		addLegend();
 	}
 
@@ -91,11 +126,56 @@ document.addEventListener("DOMContentLoaded", () => {
 	}
 
 	function updateMarkers() {
+		const bounds = map.getBounds();
+		const showPastEvents = document.getElementById("past-events").checked;
+		const params = new URLSearchParams({
+			zoom: map.getZoom(),
+			bbox: [bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()].join(","),
+			city: document.getElementById("city").value,
+			neighborhood: document.getElementById("neighborhood").value,
+			date: document.getElementById("date").value
+		});
+		if (!showPastEvents) {
+			// Data local, como em filterBlocos: toISOString daria a data em UTC
+			const today = new Date();
+			const month = String(today.getMonth() + 1).padStart(2, "0");
+			const day = String(today.getDate()).padStart(2, "0");
+			params.set("since", `${today.getFullYear()}-${month}-${day}`);
+		}
+		const requestId = ++viewportRequestId;
+
+		fetch(`/clusters/?${params}`)
+			.then((response) => response.json())
+			.then((data) => {
+				// Ignora respostas de viewports que já ficaram para trás
+				if (requestId === viewportRequestId) {
+					renderMarkers(data.blocos.map(expandSummary));
+					renderClusters(data.clusters);
+				}
+			})
+			.catch((error) => console.error("Erro na requisição:", error));
+	}
+
+	function renderClusters(clusters) {
+		clusters.forEach((cluster) => {
+			const size = cluster.count < 10 ? "small" : cluster.count < 100 ? "medium" : "large";
+			const icon = L.divIcon({
+				html: `<div><span>${cluster.count}</span></div>`,
+				className: `marker-cluster marker-cluster-${size}`,
+				iconSize: L.point(40, 40)
+			});
+
+			const marker = L.marker([cluster.latitude, cluster.longitude], { icon }).addTo(map);
+			marker.on("click", () => map.setView([cluster.latitude, cluster.longitude], map.getZoom() + 2));
+			markers.push(marker);
+		});
+	}
+
+	function renderMarkers(blocos) {
 		clearMarkers();
-		const filteredBlocos = filterBlocos();
 
-		filteredBlocos.forEach((bloco) => {
-			const isFree = bloco.ticket_info === "Grátis";
+		blocos.forEach((bloco) => {
+			const isFree = bloco.free;
 			const today = new Date();
 			const blocoDate = new Date(bloco.event_date);
 			const isFuture = blocoDate >= today;
@@ -114,6 +194,15 @@ document.addEventListener("DOMContentLoaded", () => {
 	}
 
 	function bindPopupToMarker(marker, bloco) {
+		marker.bindPopup(`<div class="marker-popup"><h3>${bloco.name}</h3><p>Carregando...</p></div>`);
+		marker.on("popupopen", () => {
+			fetchBlocoDetail(bloco.id)
+				.then((detail) => marker.setPopupContent(createPopupContent(detail)))
+				.catch((error) => console.error("Erro ao carregar o bloco:", error));
+		});
+	}
+
+	function createPopupContent(bloco) {
 		const eventDate = new Date(bloco.event_date);
 		const formattedDate = eventDate.toLocaleDateString("pt-BR", { day: "2-digit", month: "2-digit" });
 
@@ -123,7 +212,7 @@ document.addEventListener("DOMContentLoaded", () => {
 		const whatsappText = `${formattedDate} - ${bloco.event_time} Vai acontecer o bloco ${bloco.name} em ${bloco.neighborhood || bloco.city}. ${bloco.event_page_url}`;
 		const shareWhatsappContent = `📱 <a href="https://wa.me/?text=${whatsappText}" target="_blank">Compartilhar no WhatsApp</a>`;
 
-		marker.bindPopup(`
+		return `
             <div class="marker-popup">
                 <h3>${bloco.name}</h3>
                 <p>${ticketContent}</p>
@@ -132,7 +221,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 <p class="mt-2">${bloco.description.slice(0, 300) + (bloco.description.length > 300 ? "..." : "")}</p>
                 <p class="mt-2">${seeMoreContent} ${mapLinkContent} ${shareWhatsappContent}</p>
             </div>
-        `);
+        `;
 	}
 
 	function renderBlocos() {
@@ -192,11 +281,7 @@ document.addEventListener("DOMContentLoaded", () => {
 		const blocoCard = document.createElement("div");
 		blocoCard.classList.add("bloco-card");
 
-		const ticketContent = bloco.ticket_url ? `💲 <a href="${bloco.ticket_url}" target="_blank">${bloco.ticket_info}</a>` : `<strong>💲 ${bloco.ticket_info}</strong>`;
-		const seeMoreContent = `🔍 <a href="${bloco.event_page_url || "#"}" target="_blank">Ver mais...</a>`;
-		const mapLinkContent = `🗺️ <a href="${bloco.address_gmaps_url || "#"}" target="_blank">Veja como chegar</a>`;
-		const whatsappText = `${dateKey} - ${bloco.event_time} Vai acontecer o bloco ${bloco.name} em ${bloco.neighborhood || bloco.city}. ${bloco.event_page_url}`;
-		const shareWhatsappContent = `📱 <a href="https://wa.me/?text=${whatsappText}" target="_blank">Compartilhar no WhatsApp</a>`;
+		const ticketContent = `<strong>💲 ${bloco.free ? "Grátis" : "Pago"}</strong>`;
 
 		blocoCard.innerHTML = `
             <div class="bloco-card-container">
@@ -205,16 +290,43 @@ document.addEventListener("DOMContentLoaded", () => {
                 </div>
                 <div class="bloco-card-details">
                     <h3>${bloco.name}</h3>
-                    <p><strong>📍 ${bloco.neighborhood || bloco.city} - ${bloco.address || ""}</strong></p>
+                    <p><strong>📍 ${bloco.neighborhood || bloco.city}</strong></p>
                     <p>${ticketContent}</p>
-                    ${seeMoreContent} ${mapLinkContent} ${shareWhatsappContent}
+                    <p class="bloco-card-more">➕ Ver detalhes</p>
                 </div>
             </div>
         `;
 
+		// Endereço e links chegam pelo endpoint de detalhe, só quando o card é aberto
+		blocoCard.addEventListener("click", () => {
+			if (blocoCard.dataset.expanded) return;
+			blocoCard.dataset.expanded = "true";
+			fetchBlocoDetail(bloco.id)
+				.then((detail) => fillBlocoCard(blocoCard, detail, dateKey))
+				.catch((error) => {
+					delete blocoCard.dataset.expanded;
+					console.error("Erro ao carregar o bloco:", error);
+				});
+		});
+
 		return blocoCard;
 	}
 
+	function fillBlocoCard(blocoCard, bloco, dateKey) {
+		const ticketContent = bloco.ticket_url ? `💲 <a href="${bloco.ticket_url}" target="_blank">${bloco.ticket_info}</a>` : `<strong>💲 ${bloco.ticket_info}</strong>`;
+		const seeMoreContent = `🔍 <a href="${bloco.event_page_url || "#"}" target="_blank">Ver mais...</a>`;
+		const mapLinkContent = `🗺️ <a href="${bloco.address_gmaps_url || "#"}" target="_blank">Veja como chegar</a>`;
+		const whatsappText = `${dateKey} - ${bloco.event_time} Vai acontecer o bloco ${bloco.name} em ${bloco.neighborhood || bloco.city}. ${bloco.event_page_url}`;
+		const shareWhatsappContent = `📱 <a href="https://wa.me/?text=${whatsappText}" target="_blank">Compartilhar no WhatsApp</a>`;
+
+		blocoCard.querySelector(".bloco-card-details").innerHTML = `
+            <h3>${bloco.name}</h3>
+            <p><strong>📍 ${bloco.neighborhood || bloco.city} - ${bloco.address || ""}</strong></p>
+            <p>${ticketContent}</p>
+            ${seeMoreContent} ${mapLinkContent} ${shareWhatsappContent}
+        `;
+	}
+
 	function addLoadMoreButton(container, totalBlocos, displayedBlocos) {
 		if (displayedBlocos < totalBlocos) {
 			const loadMoreButton = document.createElement("button");
@@ -259,6 +371,21 @@ document.addEventListener("DOMContentLoaded", () => {
 		});
 	}
 
+	// Shard estático da combinação de filtros, se exportado; senão o endpoint dinâmico
+	function filterUrl(city, date, neighborhood) {
+		const shards = shardManifest && shardManifest.cities[city];
+		if (shards && !date && !neighborhood) return shards.url;
+		if (shards && date && !neighborhood && shards.dates[date]) return shards.dates[date];
+		if (shards && neighborhood && !date && shards.neighborhoods[neighborhood]) {
+			return shards.neighborhoods[neighborhood];
+		}
+
+		let url = `/filter-blocos/?city=${city}`;
+		if (neighborhood) url += `&neighborhood=${neighborhood}`;
+		if (date) url += `&date=${date}`;
+		return url;
+	}
+
 	function handleCityChange(event) {
 		const selectedCity = event.target.value;
 
@@ -266,13 +393,20 @@ document.addEventListener("DOMContentLoaded", () => {
 
 		const cityData = cities_coords.find((city) => city.name === selectedCity);
 
-		if (cityData) {
+		if (cityData && cityData.min_latitude !== null) {
+			// Enquadra os blocos da cidade, centrando no centroide dos pontos
+			const bounds = L.latLngBounds(
+				[cityData.min_latitude, cityData.min_longitude],
+				[cityData.max_latitude, cityData.max_longitude]
+			);
+			map.setView([cityData.centroid_latitude, cityData.centroid_longitude], Math.max(map.getBoundsZoom(bounds), 9));
+		} else if (cityData) {
 			map.setView([cityData.avg_latitude, cityData.avg_longitude], 9);
 		} else {
 			map.setView(MAP_CENTER, 10);
 		}
 
-		fetch(`/filter-blocos/?city=${selectedCity}`)
+		fetch(filterUrl(selectedCity))
 			.then((response) => response.json())
 			.then((data) => {
 				if (data.blocos) {
@@ -287,7 +421,7 @@ document.addEventListener("DOMContentLoaded", () => {
 		const selectedNeighborhood = event.target.value;
 		const selectedCity = citySelect.value;
 
-		fetch(`/filter-blocos/?city=${selectedCity}&neighborhood=${selectedNeighborhood}`)
+		fetch(filterUrl(selectedCity, "", selectedNeighborhood))
 			.then((response) => response.json())
 			.then((data) => {
 				if (data.blocos) {
@@ -302,11 +436,7 @@ document.addEventListener("DOMContentLoaded", () => {
 		const selectedCity = citySelect.value;
 		const selectedNeighborhood = neighborhoodSelect.value;
 
-		let url = `/filter-blocos/?city=${selectedCity}`;
-		if (selectedNeighborhood) url += `&neighborhood=${selectedNeighborhood}`;
-		if (selectedDate) url += `&date=${selectedDate}`;
-
-		fetch(url)
+		fetch(filterUrl(selectedCity, selectedDate, selectedNeighborhood))
 			.then((response) => response.json())
 			.then((data) => {
 				if (data.blocos) {
@@ -316,8 +446,36 @@ document.addEventListener("DOMContentLoaded", () => {
 			.catch((error) => console.error("Erro na requisição:", error));
 	}
 
-	function loadBlocos(blocos) {
-		allBlocos = blocos;
+	// Busca textual combinada com os filtros; sem texto volta ao resultado dos filtros
+	function handleSearchInput() {
+		clearTimeout(searchTimeout);
+		searchTimeout = setTimeout(() => {
+			const query = searchInput.value.trim();
+			const city = citySelect.value;
+			const date = dateSelect.value;
+			const neighborhood = neighborhoodSelect.value;
+			const requestId = ++searchRequestId;
+
+			let url = filterUrl(city, date, neighborhood);
+			if (query.length >= SEARCH_MIN_LENGTH) {
+				const params = new URLSearchParams({ q: query, city, date, neighborhood });
+				url = `/search-blocos/?${params}`;
+			}
+
+			fetch(url)
+				.then((response) => response.json())
+				.then((data) => {
+					// Ignora respostas de buscas já substituídas por outra
+					if (requestId === searchRequestId && data.blocos) {
+						loadBlocos(data.blocos);
+					}
+				})
+				.catch((error) => console.error("Erro na busca:", error));
+		}, SEARCH_DELAY_MS);
+	}
+
+	function loadBlocos(summaries) {
+		allBlocos = summaries.map(expandSummary);
 		renderBlocos();
 	}
 
@@ -325,8 +483,19 @@ document.addEventListener("DOMContentLoaded", () => {
 
 	document.getElementById("past-events").addEventListener("change", renderBlocos);
 
-	const blocos = JSON.parse(document.getElementById("blocos-json").textContent);
-	loadBlocos(blocos);
+	const snapshotUrl = JSON.parse(document.getElementById("snapshot-url").textContent);
+	fetch(snapshotUrl)
+		.then((response) => response.json())
+		.then((blocos) => loadBlocos(blocos))
+		.catch((error) => console.error("Erro ao carregar os blocos:", error));
+
+	const shardsUrl = JSON.parse(document.getElementById("shards-url").textContent);
+	if (shardsUrl) {
+		fetch(shardsUrl)
+			.then((response) => response.json())
+			.then((manifest) => (shardManifest = manifest))
+			.catch((error) => console.error("Erro ao carregar os shards:", error));
+	}
 
 	const citySelect = document.getElementById("city");
 	citySelect.addEventListener("change", handleCityChange);
@@ -336,4 +505,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
 	const dateSelect = document.getElementById("date");
 	dateSelect.addEventListener("change", handleDateChange);
+
+	const searchInput = document.getElementById("search");
+	searchInput.addEventListener("input", handleSearchInput);
 });
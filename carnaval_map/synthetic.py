@@ -0,0 +1,179 @@
+"""
+Synthetic, realistic-looking blocos for load tests and benchmarks.
+
+Datasets are reproducible from a seed. Blocos are spread over cities
+(the real ones first, then "cidade-N"), and within each city over
+neighborhoods following a Zipf-like law: with ``skew`` 0 every
+neighborhood gets the same share, while larger values concentrate the
+blocos in a few central neighborhoods, as in Rio or São Paulo. Dates
+cluster on the carnival weekend, and times, ticket info and description
+lengths follow the shape of the scraped data.
+
+Every generated RawBloco has an event_page_url under SYNTHETIC_URL, so a
+dataset can be removed without touching scraped data.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+from .cities import update_city_coordinates
+from .models import Bloco, City, RawBloco
+from .serializers import FREE_TICKET_INFO
+
+SYNTHETIC_URL = "https://synthetic.invalid/programacao/"
+
+# Cidades reais com os centros aproximados; as demais são sintéticas
+CITY_CENTERS = [
+    ("rio-de-janeiro", -22.91, -43.25),
+    ("sao-paulo", -23.55, -46.64),
+    ("salvador", -12.98, -38.49),
+    ("belo-horizonte", -19.92, -43.94),
+    ("recife-olinda", -8.04, -34.88),
+    ("florianopolis", -27.53, -48.54),
+    ("porto-alegre", -30.03, -51.21),
+    ("brasilia", -15.85, -48.00),
+    ("fortaleza", -3.79, -38.51),
+]
+
+WEEKDAYS = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo")
+HOURS = ["07", "08", "09", "10", "11", "12", "13", "14", "15", "16", "17", "18", "19", "20"]
+HOUR_WEIGHTS = [1, 2, 3, 5, 6, 8, 10, 9, 7, 6, 4, 3, 3, 2]
+NAME_WORDS = (
+    "Bloco", "Cordão", "Banda", "Folia", "Escravos", "Amigos", "Filhos", "Unidos",
+    "Sambistas", "Foliões", "Boêmios", "Piratas", "Bicho", "Maracatu", "Frevo",
+)
+STREET_TYPES = ("Rua", "Av.", "Praça", "Largo", "Travessa")
+LOREM = (
+    "O bloco sai às ruas com bateria, fantasias e marchinhas clássicas. "
+    "Traga sua alegria, água e protetor solar. Concentração com antecedência. "
+)
+
+# Carnaval de referência: sábado de carnaval
+CARNIVAL_SATURDAY = date(2025, 3, 1)
+
+
+def city_names(count):
+    """Returns `count` city slugs: the real ones first, then synthetic ones."""
+    names = [name for name, _, _ in CITY_CENTERS[:count]]
+    names += [f"cidade-{i}" for i in range(len(names), count)]
+    return names
+
+
+def zipf_weights(count, skew):
+    """Returns normalized weights proportional to 1 / rank**skew."""
+    weights = 1 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def generate_dataset(size, cities=9, neighborhoods=40, skew=1.0, seed=42, batch_size=2000):
+    """
+    Creates `size` synthetic RawBlocos and Blocos and the matching City rows.
+
+    Args:
+        size (int): Number of blocos.
+        cities (int): Number of cities.
+        neighborhoods (int): Neighborhoods per city.
+        skew (float): Zipf exponent of the neighborhood (and city) shares.
+        seed (int): Random seed; the same arguments produce the same data.
+        batch_size (int): Rows per bulk_create.
+
+    Returns:
+        int: The number of blocos created.
+    """
+    rng = np.random.default_rng(seed)
+    names = city_names(cities)
+    centers = {name: (lat, lon) for name, lat, lon in CITY_CENTERS}
+    for i, name in enumerate(names):
+        centers.setdefault(name, (-5 - (i % 25), -35 - (i * 0.7) % 20))
+
+    # Centros dos bairros espalhados em volta do centro da cidade
+    neighborhood_centers = {
+        name: np.column_stack(
+            [
+                centers[name][0] + rng.normal(0, 0.06, neighborhoods),
+                centers[name][1] + rng.normal(0, 0.06, neighborhoods),
+            ]
+        )
+        for name in names
+    }
+
+    city_index = rng.choice(cities, size=size, p=zipf_weights(cities, skew / 2))
+    neighborhood_index = rng.choice(neighborhoods, size=size, p=zipf_weights(neighborhoods, skew))
+    # Concentração no fim de semana de carnaval, com pré e pós-carnaval
+    day_offsets = np.clip(np.rint(rng.normal(0, 6, size)), -21, 14).astype(int)
+    hours = rng.choice(HOURS, size=size, p=np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS))
+    half_hours = rng.random(size) < 0.15
+    free = rng.random(size) < 0.8
+    jitter = rng.normal(0, 0.004, (size, 2))
+    words = rng.choice(NAME_WORDS, size=(size, 2))
+    description_repeats = rng.integers(1, 6, size)
+    street_numbers = rng.integers(1, 3000, size)
+
+    created = 0
+    for start in range(0, size, batch_size):
+        raw_blocos = []
+        blocos = []
+        for i in range(start, min(start + batch_size, size)):
+            city = names[city_index[i]]
+            neighborhood = f"Bairro {neighborhood_index[i] + 1}"
+            latitude, longitude = neighborhood_centers[city][neighborhood_index[i]] + jitter[i]
+            event_date = CARNIVAL_SATURDAY + timedelta(days=int(day_offsets[i]))
+            event_day = WEEKDAYS[event_date.weekday()]
+            event_time = f"{hours[i]}:{'30' if half_hours[i] else '00'}"
+            street = f"{STREET_TYPES[i % len(STREET_TYPES)]} {words[i][1]} {i % 97}"
+            fields = {
+                "city": city,
+                "name": f"{words[i][0]} {words[i][1]} {i}",
+                "subtitle": f"{event_date:%d/%m/%Y} - {event_day} - {event_time}  {neighborhood}",
+                "description": LOREM * int(description_repeats[i]),
+                "ticket_info": FREE_TICKET_INFO if free[i] else "R$ 30,00",
+                "ticket_url": None if free[i] else f"https://ingressos.invalid/{i}/",
+                "address": f"{street}, {street_numbers[i]}",
+                "neighborhood": neighborhood,
+                "address_gmaps_url": f"https://maps.google.com/?q={street}",
+                "event_page_url": f"{SYNTHETIC_URL}{seed}-{i}/",
+                "event_date": event_date,
+                "event_day": event_day,
+                "event_time": event_time,
+            }
+            raw_bloco = RawBloco(**fields, processed=True)
+            raw_blocos.append(raw_bloco)
+            bloco = Bloco(
+                raw_data=raw_bloco,
+                latitude=float(latitude),
+                longitude=float(longitude),
+                geocode_source=Bloco.PROVIDER,
+                **fields,
+            )
+            bloco.render_summary()
+            blocos.append(bloco)
+
+        RawBloco.objects.bulk_create(raw_blocos)
+        Bloco.objects.bulk_create(blocos)
+        created += len(blocos)
+
+    update_city_coordinates(names)
+    return created
+
+
+def clear_dataset():
+    """
+    Removes every synthetic bloco. The cities they touched are recomputed
+    from the remaining blocos, or removed when none is left.
+
+    Returns:
+        int: The number of RawBlocos removed (their Blocos go with them).
+    """
+    synthetic = RawBloco.objects.filter(event_page_url__startswith=SYNTHETIC_URL)
+    cities = set(synthetic.values_list("city", flat=True).distinct())
+    deleted, _ = synthetic.delete()
+
+    City.objects.filter(name__in=cities).exclude(
+        name__in=Bloco.objects.values("city")
+    ).delete()
+    # As estatísticas das cidades reais voltam a refletir só os blocos reais
+    update_city_coordinates(
+        list(City.objects.filter(name__in=cities).values_list("name", flat=True))
+    )
+    return deleted
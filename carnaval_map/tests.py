@@ -1,3 +1,1979 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.db import connection, models
+from django.db.models import Count, Sum
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from carnaval_map import metrics
+from carnaval_map.backfill import normalize_time, run_backfill
+from carnaval_map.caching import get_or_compute
+from carnaval_map.benchmarks import build_cases, compare_results, run_suite
+from carnaval_map.clusters import (
+    MAX_LATITUDE,
+    MAX_ZOOM,
+    MIN_ZOOM,
+    ClusterTree,
+    project,
+    unproject,
+)
+from carnaval_map.crawler import Crawler
+from carnaval_map.facets import deep_getsizeof, get_facet_index
+from carnaval_map.gazetteer import Gazetteer, street_key
+from carnaval_map.ingest import finish_ingest
+from carnaval_map.geocoding import (
+    CachedGeocoder,
+    FakeGeocoder,
+    RateLimitedGeocoder,
+    TokenBucket,
+    normalize_address,
+)
+from carnaval_map.http_cache import HttpCache
+from carnaval_map.management.commands.benchmark_parser import (
+    legacy_parse_event_page,
+    load_corpus,
+)
+from carnaval_map.management.commands.web_scraping import (
+    bloco_from_raw,
+    existing_urls_query,
+    discover_links,
+    fetch_frontier,
+    frontier_queryset,
+    parse_fetched,
+    process_addresses,
+    promote_chunk,
+    refresh_known_events,
+    touched_cities,
+    update_city_coordinates,
+)
+from carnaval_map.models import Bloco, City, FrontierUrl, GeocodeCache, IngestRun, RawBloco
+from carnaval_map.parser import EventRecord, ParseError, fingerprint_event, parse_event_page
+from carnaval_map.pipeline import RawBlocoPipeline, insert_raw_blocos
+from carnaval_map.search import FTS_TRIGGERS, ensure_fts_triggers, search_bloco_ids
+from carnaval_map.synthetic import SYNTHETIC_URL, clear_dataset, generate_dataset
+from carnaval_map.serializers import (
+    DETAIL_FIELDS,
+    SUMMARY_FIELDS,
+    SUMMARY_SOURCE_FIELDS,
+    summarize,
+)
+from carnaval_map.snapshot import build_snapshot, snapshot_path
+from carnaval_map.spatial import GridIndex
+from carnaval_map.versioning import bump_data_version
+from carnaval_map.views import FilterBlocosView, ViewportBlocosView
+
+
+class FixtureServer:
+    """
+    Local stand-in for blocosderua.com, serving fixture pages keyed by path
+    (query string included). Each value is a body or a list of (status, body)
+    answers consumed in order. Successful answers carry an ETag and honor
+    If-None-Match.
+    """
+
+    def __init__(self, pages, delay=0):
+        self.pages = pages
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append(self.path)
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    status, body = server.answer(self.path)
+                time.sleep(server.delay)
+                with server.lock:
+                    server.active -= 1
+
+                etag = f'"{hashlib.md5(body.encode()).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/"
+
+    def answer(self, path):
+        page = self.pages.get(path)
+        if page is None:
+            return 404, ""
+        if isinstance(page, list):
+            return page.pop(0) if len(page) > 1 else page[0]
+        return 200, page.replace("{url}", self.url)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def listing_page(*slugs):
+    cards = "".join(
+        f'<a class="card" href="{{url}}programacao/{slug}/">{slug}</a>' for slug in slugs
+    )
+    return f"<html><body>{cards}<a class='card' href='{{url}}sobre/'>Sobre</a></body></html>"
+
+
+def event_page(name="Bloco da Preta", date="01/03/2025", day="Sábado", time="16:00",
+               neighborhood="Tijuca", address="Praça Saens Peña", ticket="Grátis"):
+    return f"""
+    <html><body>
+    <h1 class="text-secondary h2 text-center">{name}</h1>
+    <h2 class="card-text text-white h6 text-center text-default">{date} - {day} - {time}  {neighborhood}</h2>
+    <p>Descrição do {name}.</p>
+    <h6>{ticket}</h6>
+    <h6><a href="https://maps.google.com/?q={address}">{address}</a></h6>
+    </body></html>
+    """
+
+
+class DataVersionTestCase(TestCase):
+    """
+    Points SNAPSHOT_ROOT and the data version file at a temporary directory,
+    available as ``self.root``.
+    """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = Path(tmp_dir.name)
+        settings_override = override_settings(
+            SNAPSHOT_ROOT=self.root, DATA_VERSION_FILE=self.root / "version"
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CrawlerTests(SimpleTestCase):
+    PAGES = {
+        "/": (
+            '<select class="dms-select"><option value="">Cidades</option>'
+            '<option value="{url}rio-de-janeiro/">Rio</option></select>'
+            '<a class="btn" href="{url}programacao/">Ver todos</a>'
+        ),
+        "/rio-de-janeiro/": '<a class="btn" href="{url}rio-de-janeiro/programacao/">Ver todos</a>',
+        "/programacao/?paged=1&data=&bairro=": listing_page("sp-1", "sp-2"),
+        "/programacao/?paged=2&data=&bairro=": listing_page("sp-3"),
+        "/rio-de-janeiro/programacao/?paged=1&data=&bairro=": listing_page("rj-1"),
+        "/rio-de-janeiro/programacao/?paged=2&data=&bairro=": listing_page("rj-2"),
+        "/rio-de-janeiro/programacao/?paged=3&data=&bairro=": listing_page("rj-3"),
+        "/rio-de-janeiro/programacao/?paged=4&data=&bairro=": listing_page("rj-4"),
+    }
+
+    def test_crawl_events_links_discovers_cities_and_paginates(self):
+        with FixtureServer(dict(self.PAGES)) as server:
+            with Crawler(base_url=server.url, per_host_limit=3, backoff=0) as crawler:
+                links = crawler.run(crawler.crawl_events_links())
+
+        self.assertEqual(
+            links[f"{server.url}rio-de-janeiro/"],
+            [f"{server.url}programacao/rj-{i}/" for i in range(1, 5)],
+        )
+        self.assertEqual(
+            links[server.url], [f"{server.url}programacao/sp-{i}/" for i in range(1, 4)]
+        )
+
+    def test_fetch_retries_with_backoff(self):
+        pages = {"/flaky/": [(503, ""), (502, ""), (200, "ok")]}
+        with FixtureServer(pages) as server:
+            with Crawler(base_url=server.url, retries=2, backoff=0.01) as crawler:
+                bodies = crawler.run(crawler.fetch_pages([f"{server.url}flaky/"]))
+
+        self.assertEqual(bodies, ["ok"])
+        self.assertEqual(len(server.requests), 3)
+
+    def test_fetch_gives_up_after_retries(self):
+        pages = {"/down/": [(503, "")]}
+        with FixtureServer(pages) as server:
+            with Crawler(base_url=server.url, retries=1, backoff=0) as crawler:
+                bodies = crawler.run(crawler.fetch_pages([f"{server.url}down/"]))
+
+        self.assertEqual(bodies, [None])
+        self.assertEqual(len(server.requests), 2)
+
+    def test_per_host_limit(self):
+        pages = {f"/programacao/bloco-{i}/": f"bloco {i}" for i in range(12)}
+        with FixtureServer(pages, delay=0.05) as server:
+            with Crawler(base_url=server.url, per_host_limit=3) as crawler:
+                urls = [f"{server.url}programacao/bloco-{i}/" for i in range(12)]
+                bodies = crawler.run(crawler.fetch_pages(urls))
+
+        self.assertEqual(bodies, [f"bloco {i}" for i in range(12)])
+        self.assertLessEqual(server.max_active, 3)
+        self.assertGreater(server.max_active, 1)
+
+
+class BlocoDetailTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+
+        raw = RawBloco.objects.create(city="rio-de-janeiro", name="Boitatá", description="")
+        self.bloco = Bloco.objects.create(
+            raw_data=raw,
+            city="rio-de-janeiro",
+            name="Cordão do Boitatá",
+            description="Desde 1996.",
+            address="Praça XV",
+            ticket_info="Grátis",
+            neighborhood="Centro",
+            event_date="2025-03-01",
+            event_time="07:00",
+            latitude=-22.9,
+            longitude=-43.17,
+        )
+        bump_data_version()
+
+    def test_summary_uses_short_keys(self):
+        values = Bloco.objects.values(*SUMMARY_SOURCE_FIELDS).get()
+        self.assertEqual(
+            summarize(values),
+            {
+                "id": self.bloco.id,
+                "n": "Cordão do Boitatá",
+                "c": "rio-de-janeiro",
+                "d": date(2025, 3, 1),
+                "t": "07:00",
+                "b": "Centro",
+                "la": -22.9,
+                "lo": -43.17,
+                "g": True,
+            },
+        )
+        self.assertEqual(set(summarize(values)), {key for key, _ in SUMMARY_FIELDS} | {"g"})
+
+        # Descrição, endereço e links ficam só no detalhe
+        bloco = json.loads(self.client.get("/filter-blocos/").content)["blocos"][0]
+        self.assertEqual(bloco["n"], "Cordão do Boitatá")
+        self.assertEqual(set(bloco), {key for key, _ in SUMMARY_FIELDS} | {"g"})
+
+    def test_detail(self):
+        response = self.client.get(f"/blocos/{self.bloco.id}/")
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        self.assertEqual(set(content), set(DETAIL_FIELDS))
+        self.assertEqual(content["description"], "Desde 1996.")
+        self.assertEqual(content["address"], "Praça XV")
+
+        self.assertEqual(self.client.get(f"/blocos/{self.bloco.id + 1}/").status_code, 404)
+
+    def test_detail_caching(self):
+        url = f"/blocos/{self.bloco.id}/"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=3600", response["Cache-Control"])
+        self.assertNotEqual(etag, self.client.get(f"/blocos/{self.bloco.id + 1}/").get("ETag"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        time.sleep(0.001)
+        bump_data_version()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on the querysets used by the views and the scraper
+    and fails if any of them falls back to a full table scan or a temporary
+    sort.
+    """
+
+    FILTERS = [
+        {"city": "", "date": "", "neighborhood": ""},
+        {"city": "rio-de-janeiro", "date": "", "neighborhood": ""},
+        {"city": "", "date": "2025-03-01", "neighborhood": ""},
+        {"city": "", "date": "", "neighborhood": "Tijuca"},
+        {"city": "rio-de-janeiro", "date": "2025-03-01", "neighborhood": ""},
+        {"city": "rio-de-janeiro", "date": "", "neighborhood": "Tijuca"},
+        {"city": "", "date": "2025-03-01", "neighborhood": "Tijuca"},
+        {"city": "rio-de-janeiro", "date": "2025-03-01", "neighborhood": "Tijuca"},
+    ]
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if f"SCAN {table}" in line and "INDEX" not in line:
+                self.fail(f"Full scan on {table}:\n{plan}\n{queryset.query}")
+            if "USE TEMP B-TREE" in line:
+                self.fail(f"Temporary sort:\n{plan}\n{queryset.query}")
+
+    def test_filter_blocos_uses_indexes(self):
+        view = FilterBlocosView()
+        for filters in self.FILTERS:
+            with self.subTest(**filters):
+                query = view.filter_blocos(**filters)
+                self.assertUsesIndex(query, "carnaval_map_bloco")
+
+    def test_filter_facets_use_indexes(self):
+        view = FilterBlocosView()
+        for filters in self.FILTERS[1:]:
+            with self.subTest(**filters):
+                query = view.filter_blocos(**filters).order_by()
+                self.assertUsesIndex(
+                    query.values_list("event_date", flat=True).distinct(), "carnaval_map_bloco"
+                )
+
+    def test_existing_urls_uses_unique_index(self):
+        links = [f"https://www.blocosderua.com/programacao/bloco-{i}/" for i in range(10)]
+        self.assertUsesIndex(existing_urls_query(links), "carnaval_map_rawbloco")
+
+
+class SnapshotTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+
+        for name in ["Cordão do Boitatá", "Bloco da Preta"]:
+            raw = RawBloco.objects.create(city="rio-de-janeiro", name=name, description="")
+            Bloco.objects.create(
+                raw_data=raw,
+                city="rio-de-janeiro",
+                name=name,
+                description="",
+                address="Rua",
+                event_date="2025-03-01",
+            )
+        self.version = build_snapshot()["version"]
+        # Variante brotli de mentira: o brotli é opcional e pode não estar instalado
+        snapshot_path(self.version, "br").write_bytes(b"br")
+        self.url = f"/blocos/snapshot/{self.version}.json"
+
+    def get(self, accept_encoding, **headers):
+        return self.client.get(self.url, headers={"Accept-Encoding": accept_encoding, **headers})
+
+    def test_encoding_follows_accept_encoding(self):
+        cases = [
+            ("gzip, deflate, br", "br"),
+            ("gzip", "gzip"),
+            ("GZIP;q=0.5", "gzip"),
+            ("", None),
+            ("identity", None),
+            ("br;q=0, gzip", "gzip"),
+            ("br;q=0, gzip;q=0", None),
+            ("gzip;q=0.0", None),
+            ("gzip;q=abc", None),
+            ("*", "br"),
+            ("*, br;q=0", "gzip"),
+        ]
+        for accept_encoding, encoding in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers.get("Content-Encoding"), encoding)
+
+        body = self.get("").getvalue()
+        self.assertEqual(gzip.decompress(self.get("gzip").getvalue()), body)
+        self.assertEqual(
+            [bloco["n"] for bloco in json.loads(body)], ["Cordão do Boitatá", "Bloco da Preta"]
+        )
+
+    def test_strong_etag_and_immutable_caching(self):
+        etags = set()
+        for accept_encoding in ["", "gzip", "br"]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding)
+                etag = response["ETag"]
+                self.assertFalse(etag.startswith("W/"))
+                self.assertIn(self.version, etag)
+                self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+                self.assertIn("Accept-Encoding", response["Vary"])
+                etags.add(etag)
+
+                response = self.get(accept_encoding, **{"If-None-Match": etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+                self.assertEqual(response["ETag"], etag)
+                self.assertIn("immutable", response["Cache-Control"])
+                self.assertIn("Accept-Encoding", response["Vary"])
+        # Cada variante tem sua própria ETag
+        self.assertEqual(len(etags), 3)
+        self.assertEqual(self.get("gzip", **{"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_unknown_version(self):
+        response = self.client.get("/blocos/snapshot/0123456789abcdef.json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_keeps_current_and_previous_snapshots(self):
+        first = self.version
+        Bloco.objects.filter(name="Bloco da Preta").delete()
+        second = build_snapshot()["version"]
+        self.assertEqual(build_snapshot()["version"], second)  # Sem mudanças, mesma versão
+        self.assertEqual(self.get("").status_code, 200)
+
+        Bloco.objects.all().delete()
+        third = build_snapshot()["version"]
+        self.assertEqual(len({first, second, third}), 3)
+        self.assertEqual(self.client.get(f"/blocos/snapshot/{first}.json").status_code, 404)
+        self.assertFalse(list(self.root.glob(f"blocos-{first}.json*")))
+        for version in [second, third]:
+            with self.subTest(version=version):
+                response = self.client.get(f"/blocos/snapshot/{version}.json")
+                self.assertEqual(response.status_code, 200)
+
+
+class ConditionalFilterTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        generate_dataset(30, cities=2, neighborhoods=3)
+        bump_data_version()
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for enabled in (True, False):
+            with self.subTest(index=enabled), override_settings(FACET_INDEX_ENABLED=enabled):
+                response = self.client.get("/filter-blocos/", {"city": "sao-paulo"})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("no-cache", response["Cache-Control"])
+                etag = response["ETag"]
+
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        "/filter-blocos/", {"city": "sao-paulo"}, headers={"If-None-Match": etag}
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_etag_changes_with_data_version_and_filters(self):
+        etag = self.client.get("/filter-blocos/", {"city": "sao-paulo"})["ETag"]
+        other = self.client.get("/filter-blocos/", {"city": "rio-de-janeiro"})["ETag"]
+        self.assertNotEqual(etag, other)
+
+        time.sleep(0.001)
+        bump_data_version()
+        response = self.client.get(
+            "/filter-blocos/", {"city": "sao-paulo"}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class FacetIndexTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+
+        generate_dataset(300, cities=3, neighborhoods=6, seed=11)
+        bump_data_version()
+
+    def test_index_matches_sql(self):
+        index = get_facet_index()
+        view = FilterBlocosView()
+        ids = [row["id"] for row in index.values]
+        dates = sorted(Bloco.objects.values_list("event_date", flat=True).distinct())
+
+        filters = [("", None, ""), ("x", None, ""), ("", None, "Bairro 0")]
+        for city in ["rio-de-janeiro", "sao-paulo", "salvador"]:
+            filters += [(city, None, ""), (city, None, "Bairro 2"), (city, dates[0], "")]
+            filters += [(city, dates[-1], "Bairro 1"), ("", dates[1], "Bairro 3")]
+
+        for city, event_date, neighborhood in filters:
+            with self.subTest(city=city, date=event_date, neighborhood=neighborhood):
+                query = view.filter_blocos(city, event_date, neighborhood)
+                positions = index.filter(city, event_date, neighborhood)
+                self.assertEqual(
+                    [ids[position] for position in positions],
+                    list(query.values_list("id", flat=True)),
+                )
+
+                facets = index.facets(positions, city, event_date, neighborhood)
+                self.assertEqual(
+                    facets["dates"],
+                    list(
+                        query.order_by("event_date")
+                        .values_list("event_date")
+                        .annotate(count=Count("id"))
+                    ),
+                )
+                self.assertEqual(
+                    facets["neighborhoods"],
+                    list(
+                        query.order_by("neighborhood")
+                        .values_list("neighborhood")
+                        .annotate(count=Count("id"))
+                    ),
+                )
+
+    def test_rebuilt_only_when_the_version_changes(self):
+        index = get_facet_index()
+        self.assertIs(get_facet_index(), index)
+
+        Bloco.objects.filter(city="salvador").delete()
+        self.assertIs(get_facet_index(), index)  # Ainda não publicado
+
+        time.sleep(0.001)
+        version = bump_data_version()
+        with self.assertLogs("carnaval_map.facets", "INFO") as logs:
+            rebuilt = get_facet_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.version, version)
+        self.assertNotIn("salvador", rebuilt.postings["city"])
+        self.assertIn("salvador", index.postings["city"])
+        self.assertIn(f"{len(rebuilt.rows)} blocos", logs.output[0])
+
+    def test_memory_report(self):
+        index = get_facet_index()
+        # Conta tudo o que o índice referencia, não só a lista de fragmentos
+        parts = [index.fragments, index.rows, index.postings, index.grid, index.cluster_trees]
+        for part in parts:
+            self.assertGreater(index.memory_bytes, deep_getsizeof(part))
+
+        Bloco.objects.filter(city="rio-de-janeiro").delete()
+        time.sleep(0.001)
+        bump_data_version()
+        self.assertLess(get_facet_index().memory_bytes, index.memory_bytes)
+
+
+class MapDataTestCase(DataVersionTestCase):
+    """Blocos of two nearby cities, plus one far away and one without coordinates."""
+
+    ROWS = [
+        ("rio-de-janeiro", "2025-03-01", "Centro", -22.9000, -43.1700),
+        ("rio-de-janeiro", "2025-03-01", "Centro", -22.9001, -43.1701),
+        ("rio-de-janeiro", "2025-03-02", "Lapa", -22.9130, -43.1800),
+        ("rio-de-janeiro", "2025-03-03", "Tijuca", -22.9250, -43.2300),
+        ("rio-de-janeiro", "2025-03-03", "Centro", None, None),
+        ("niteroi", "2025-03-01", "Icaraí", -22.9050, -43.1100),
+        ("salvador", "2025-03-02", "Pelourinho", -12.9700, -38.5100),
+    ]
+
+    def setUp(self):
+        super().setUp()
+
+        for i, (city, event_date, neighborhood, latitude, longitude) in enumerate(self.ROWS):
+            raw = RawBloco.objects.create(city=city, name=f"Bloco {i}", description="")
+            Bloco.objects.create(
+                raw_data=raw,
+                city=city,
+                name=f"Bloco {i}",
+                description="",
+                address="Rua",
+                neighborhood=neighborhood,
+                event_date=event_date,
+                latitude=latitude,
+                longitude=longitude,
+            )
+        bump_data_version()
+
+
+class ViewportTests(MapDataTestCase):
+    def viewport(self, **params):
+        response = self.client.get("/viewport-blocos/", params)
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        self.assertEqual(content["count"], len(content["blocos"]))
+        return sorted(bloco["n"] for bloco in content["blocos"])
+
+    def test_grid_matches_a_full_scan(self):
+        # Pontos exatamente sobre as bordas das células, dos dois lados do zero
+        steps = [(lat, lng) for lat in range(-6, 7) for lng in range(-6, 7)]
+        points = [
+            (i, round(lat * 0.005, 3), round(lng * 0.005, 3))
+            for i, (lat, lng) in enumerate(steps)
+        ]
+        grid = GridIndex(points + [(999, None, 1.0)], cell_size=0.01)
+        boxes = [
+            (-0.01, -0.01, 0.01, 0.01),
+            (0.0, 0.0, 0.0, 0.0),
+            (-0.025, -0.005, 0.015, 0.02),
+            (0.005, -0.03, 0.005, 0.03),
+            (-0.0051, -0.0049, 0.0049, 0.0051),
+            (-10, -10, 10, 10),  # Mais células que as ocupadas
+        ]
+        for box in boxes:
+            south, west, north, east = box
+            with self.subTest(box=box):
+                self.assertEqual(
+                    grid.query(*box),
+                    {
+                        i
+                        for i, lat, lng in points
+                        if south <= lat <= north and west <= lng <= east
+                    },
+                )
+
+    def test_viewport_across_cities_and_filters(self):
+        bbox = "-22.92,-43.18,-22.90,-43.10"
+        # Bordas incluídas: o Bloco 0 está na borda norte e o Bloco 2 na oeste
+        self.assertEqual(self.viewport(bbox=bbox), ["Bloco 0", "Bloco 1", "Bloco 2", "Bloco 5"])
+        self.assertEqual(
+            self.viewport(bbox=bbox, city="rio-de-janeiro"), ["Bloco 0", "Bloco 1", "Bloco 2"]
+        )
+        self.assertEqual(
+            self.viewport(bbox=bbox, date="2025-03-01"), ["Bloco 0", "Bloco 1", "Bloco 5"]
+        )
+        self.assertEqual(
+            self.viewport(
+                bbox=bbox, city="rio-de-janeiro", date="2025-03-01", neighborhood="Centro"
+            ),
+            ["Bloco 0", "Bloco 1"],
+        )
+        self.assertEqual(self.viewport(bbox=bbox, city="salvador"), [])
+        self.assertEqual(self.viewport(bbox="-13,-39,-12,-38"), ["Bloco 6"])
+
+    def test_blocos_without_coordinates_are_never_returned(self):
+        names = self.viewport(bbox="-90,-180,90,180")
+        self.assertEqual(len(names), 6)
+        self.assertNotIn("Bloco 4", names)
+        self.assertEqual(self.viewport(bbox="-90,-180,90,180", date="2025-03-03"), ["Bloco 3"])
+
+    def test_invalid_bbox(self):
+        for bbox in [
+            "",
+            "1,2,3",
+            "a,b,c,d",
+            "nan,nan,nan,nan",
+            "-23,-inf,-22,-43",
+            "-23,-44,inf,-43",
+            "-22,-43,-23,-44",
+        ]:
+            with self.subTest(bbox=bbox):
+                response = self.client.get("/viewport-blocos/", {"bbox": bbox})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", json.loads(response.content))
+        response = self.client.get("/viewport-blocos/", {"bbox": "-23,-44,-22,-43", "date": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_bbox_is_clamped(self):
+        self.assertEqual(
+            ViewportBlocosView.parse_bbox("-1000,-1e300,1000,200"), (-90.0, -180.0, 90.0, 180.0)
+        )
+        self.assertEqual(len(self.viewport(bbox="-1000,-1000,1000,1000")), 6)
+
+
+class ClusterTests(MapDataTestCase):
+    def clusters(self, **params):
+        response = self.client.get("/clusters/", params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_points_merge_as_zoom_decreases(self):
+        tree = ClusterTree(
+            (i, latitude, longitude)
+            for i, (_, _, _, latitude, longitude) in enumerate(self.ROWS)
+        )
+        # Um nó por bloco com coordenadas acima do zoom máximo
+        single = tree.get_nodes(MAX_ZOOM + 1)
+        self.assertEqual(sorted(node[3] for node in single), [0, 1, 2, 3, 5, 6])
+        self.assertTrue(all(node[2] == 1 for node in single))
+        self.assertEqual(tree.get_nodes(MAX_ZOOM + 5), single)
+
+        counts = [len(tree.get_nodes(zoom)) for zoom in range(MAX_ZOOM + 1, MIN_ZOOM - 1, -1)]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 2):
+            self.assertEqual(sum(node[2] for node in tree.get_nodes(zoom)), 6)
+
+        # Os dois blocos do Centro, a 15 m um do outro, só se separam no zoom máximo
+        self.assertIn(2, [node[2] for node in tree.get_nodes(MAX_ZOOM - 1)])
+        self.assertEqual(len(tree.get_nodes(MAX_ZOOM)), 6)
+        self.assertEqual([node[2] for node in tree.get_nodes(MIN_ZOOM)], [6])
+
+        # No zoom 5 restam a região do Rio (centroide ponderado) e Salvador
+        cluster = next(node for node in tree.get_nodes(5) if node[2] == 5)
+        self.assertIsNone(cluster[3])
+        latitude, longitude = unproject(*cluster[:2])
+        self.assertAlmostEqual(latitude, -22.9087, places=2)
+        self.assertAlmostEqual(longitude, -43.1720, places=2)
+
+    def test_endpoint_filters(self):
+        content = self.clusters(zoom=MAX_ZOOM + 1)
+        self.assertEqual(content["clusters"], [])
+        self.assertEqual(len(content["blocos"]), 6)
+
+        content = self.clusters(zoom=MIN_ZOOM, city="rio-de-janeiro")
+        self.assertEqual([cluster["count"] for cluster in content["clusters"]], [4])
+        self.assertEqual(content["blocos"], [])
+
+        content = self.clusters(zoom=MAX_ZOOM + 1, bbox="-22.92,-43.18,-22.90,-43.10")
+        self.assertEqual(
+            sorted(bloco["n"] for bloco in content["blocos"]),
+            ["Bloco 0", "Bloco 1", "Bloco 2", "Bloco 5"],
+        )
+
+        content = self.clusters(zoom=MAX_ZOOM + 1, since="2025-03-02")
+        self.assertEqual(
+            sorted(bloco["n"] for bloco in content["blocos"]), ["Bloco 2", "Bloco 3", "Bloco 6"]
+        )
+        content = self.clusters(zoom=MIN_ZOOM, city="rio-de-janeiro", since="2025-03-03")
+        self.assertEqual([bloco["n"] for bloco in content["blocos"]], ["Bloco 3"])
+        content = self.clusters(zoom=MAX_ZOOM + 1, date="2025-03-01", since="2025-03-02")
+        self.assertEqual(content, {"clusters": [], "blocos": []})
+        content = self.clusters(zoom=MAX_ZOOM + 1, date="2025-03-03", since="2025-03-02")
+        self.assertEqual([bloco["n"] for bloco in content["blocos"]], ["Bloco 3"])
+
+    def test_since_slices_are_reused(self):
+        index = get_facet_index()
+        tree = index.cluster_tree(since=date(2025, 3, 1))
+        self.assertIs(index.cluster_tree(since=date(2025, 3, 1)), tree)
+        # Datas sem blocos caem na próxima data existente
+        self.assertIs(index.cluster_tree(since=date(2025, 2, 20)), tree)
+        self.assertIsNot(index.cluster_tree(since=date(2025, 3, 2)), tree)
+
+    def test_invalid_parameters(self):
+        for params in [
+            {},
+            {"zoom": "x"},
+            {"zoom": "3", "bbox": "nan,nan,nan,nan"},
+            {"zoom": "3", "bbox": "-23,-inf,-22,-43"},
+            {"zoom": "3", "bbox": "1,2,3"},
+            {"zoom": "3", "date": "01/03/2025"},
+            {"zoom": "3", "since": "ontem"},
+        ]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get("/clusters/", params).status_code, 400)
+
+    def test_client_input_does_not_grow_the_index(self):
+        index = get_facet_index()
+        trees = dict(index.cluster_trees)
+        self.assertIn(("rio-de-janeiro", None), trees)
+        self.assertIn(("rio-de-janeiro", date(2025, 3, 2)), trees)
+
+        for i in range(20):
+            self.clusters(zoom=3, city=f"x{i}")
+            self.clusters(zoom=3, city="rio-de-janeiro", neighborhood=f"x{i}")
+            self.clusters(zoom=3, since=f"2025-02-{i + 1:02d}")
+            self.clusters(zoom=3, city="salvador", since=f"2026-01-{i + 1:02d}")
+        self.assertEqual(index.cluster_trees, trees)
+        # Uma árvore "a partir de" por cidade e data existente, no máximo
+        self.assertLessEqual(
+            set(index.upcoming_trees),
+            {
+                (city, value)
+                for city, dates in index.dates_by_city.items()
+                for value in [*dates, None]
+            },
+        )
+        self.assertEqual(self.clusters(zoom=3, city="x0"), {"clusters": [], "blocos": []})
+
+    def test_poles_are_clamped_to_the_projection_limit(self):
+        self.assertEqual(project(90, 0), project(MAX_LATITUDE, 0))
+        self.assertEqual(project(-90, 180), (1.0, 1.0))
+
+        content = self.clusters(zoom=3, bbox="-90,-180,90,180")
+        self.assertEqual(
+            sum(cluster["count"] for cluster in content["clusters"]) + len(content["blocos"]), 6
+        )
+
+
+class FilterResponseTests(DataVersionTestCase):
+    """
+    The filter endpoint concatenates stored fragments; its body must stay
+    byte-identical to the JsonResponse of the summaries.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        rows = [
+            ("rio-de-janeiro", "Cordão do Boitatá", "2025-03-01", "Centro", -22.9, -43.17),
+            ("rio-de-janeiro", "Bloco \"Aspas\" 🎉", "2025-03-01", "Tijuca", -22.92, -43.23),
+            ("rio-de-janeiro", "Sem coordenadas", "2025-03-03", "Centro", None, None),
+            ("salvador", "Olodum", "2025-03-02", "Pelourinho", -12.97, -38.51),
+        ]
+        for i, (city, name, event_date, neighborhood, latitude, longitude) in enumerate(rows):
+            raw = RawBloco.objects.create(
+                city=city,
+                name=name,
+                description="",
+                address="Rua",
+                ticket_info="Grátis" if i % 2 else "R$ 10",
+                neighborhood=neighborhood,
+                event_date=event_date,
+                event_time="16:00",
+            )
+            # Metade pelo save(), metade pelo bulk_create da promoção
+            bloco = bloco_from_raw(raw, (latitude, longitude) if latitude else None)
+            if i % 2:
+                bloco.save()
+            else:
+                Bloco.objects.bulk_create([bloco])
+        # Linha gravada antes da coluna existir: o fragmento é gerado na hora
+        Bloco.objects.filter(name="Olodum").update(summary_json="")
+
+    def expected(self, city="", date="", neighborhood=""):
+        view = FilterBlocosView()
+        query = view.filter_blocos(city, date, neighborhood)
+        blocos = [summarize(values) for values in query.values(*SUMMARY_SOURCE_FIELDS)]
+        dates = view.get_dates(query)
+        neighborhoods = view.get_neighborhoods(query)
+        return JsonResponse(
+            {"blocos": blocos, "dates": dates, "neighborhoods": neighborhoods}
+        ).content
+
+    def test_response_matches_json_response(self):
+        filters = [
+            {},
+            {"city": "rio-de-janeiro"},
+            {"city": "rio-de-janeiro", "date": "2025-03-01"},
+            {"city": "rio-de-janeiro", "neighborhood": "Tijuca"},
+            {"city": "salvador", "date": "2025-03-09"},
+        ]
+        for enabled in (True, False):
+            with override_settings(FACET_INDEX_ENABLED=enabled):
+                for params in filters:
+                    with self.subTest(index=enabled, **params):
+                        response = self.client.get("/filter-blocos/", params)
+                        self.assertEqual(response["Content-Type"], "application/json")
+                        self.assertEqual(response.content, self.expected(**params))
+
+    def test_fragment_follows_updates(self):
+        bloco = Bloco.objects.get(name="Cordão do Boitatá")
+        self.assertEqual(bloco.summary_json, bloco.render_summary())
+
+        bloco.neighborhood = "Lapa"
+        bloco.save(update_fields=["neighborhood"])
+        bloco.refresh_from_db()
+        self.assertIn('"b": "Lapa"', bloco.summary_json)
+
+
+class ShardExportTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+        generate_dataset(120, cities=2, neighborhoods=4, seed=3)
+
+    def get_manifest(self):
+        url = self.client.get("/").context["shards_url"]
+        return url, json.loads(self.client.get(url).getvalue())
+
+    def test_shards_match_filter_responses(self):
+        call_command("export_shards", stdout=io.StringIO())
+        url, manifest = self.get_manifest()
+
+        self.assertEqual(set(manifest["cities"]), {"rio-de-janeiro", "sao-paulo"})
+        city = manifest["cities"]["rio-de-janeiro"]
+        date = next(iter(city["dates"]))
+        cases = [
+            ({"city": "rio-de-janeiro"}, city["url"]),
+            ({"city": "rio-de-janeiro", "date": date}, city["dates"][date]),
+            (
+                {"city": "rio-de-janeiro", "neighborhood": "Bairro 2"},
+                city["neighborhoods"]["Bairro 2"],
+            ),
+        ]
+        for params, shard in cases:
+            with self.subTest(**params):
+                response = self.client.get(shard)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("immutable", response["Cache-Control"])
+                self.assertEqual(
+                    response.getvalue(), self.client.get("/filter-blocos/", params).content
+                )
+
+    def test_ingest_keeps_only_current_and_previous_shards(self):
+        finish_ingest()
+        first_url, first = self.get_manifest()
+
+        Bloco.objects.filter(city="sao-paulo").delete()
+        finish_ingest()
+        second_url, second = self.get_manifest()
+        self.assertNotEqual(first_url, second_url)
+        self.assertEqual(list(second["cities"]), ["rio-de-janeiro"])
+        # Clientes com o HTML anterior ainda encontram os shards antigos
+        self.assertEqual(self.client.get(first["cities"]["sao-paulo"]["url"]).status_code, 200)
+
+        RawBloco.objects.filter(city="rio-de-janeiro").first().delete()
+        finish_ingest()
+        self.assertEqual(self.client.get(first_url).status_code, 404)
+        self.assertEqual(self.client.get(second_url).status_code, 200)
+
+
+class VersionedCacheTests(DataVersionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_entries_follow_data_version(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        # Sem versão publicada nada é cacheado
+        self.assertEqual(get_or_compute("key", compute), 1)
+        self.assertEqual(get_or_compute("key", compute), 2)
+
+        bump_data_version()
+        self.assertEqual(get_or_compute("key", compute), 3)
+        self.assertEqual(get_or_compute("key", compute), 3)
+
+        time.sleep(0.001)
+        bump_data_version()
+        self.assertEqual(get_or_compute("key", compute), 4)
+
+    def test_concurrent_misses_compute_once(self):
+        bump_data_version()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute("cold", compute)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["value"] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_other_process(self):
+        version = bump_data_version()
+        # Outro processo já está calculando a chave
+        cache.add("cold:lock", True, version=version)
+        threading.Timer(0.1, cache.set, ["cold", "theirs"], {"version": version}).start()
+
+        self.assertEqual(get_or_compute("cold", lambda: "ours"), "theirs")
+
+    def test_timeout_keeps_the_lock_of_the_other_process(self):
+        version = bump_data_version()
+        cache.add("cold:lock", True, version=version)
+
+        with mock.patch("carnaval_map.caching.LOCK_TIMEOUT", 0.05):
+            self.assertEqual(get_or_compute("cold", lambda: "ours"), "ours")
+        self.assertTrue(cache.get("cold:lock", version=version))
+
+    def test_views_hit_the_database_once_per_version(self):
+        generate_dataset(50, cities=2, neighborhoods=3)
+        finish_ingest()
+
+        with override_settings(FACET_INDEX_ENABLED=False):
+            for path in ["/", "/filter-blocos/?city=sao-paulo"]:
+                with self.subTest(path=path):
+                    first = self.client.get(path)
+                    with self.assertNumQueries(0):
+                        second = self.client.get(path)
+                    self.assertEqual(first.content, second.content)
+
+            Bloco.objects.filter(city="sao-paulo").delete()
+            finish_ingest()
+            content = json.loads(self.client.get("/filter-blocos/?city=sao-paulo").content)
+            self.assertEqual(content["blocos"], [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        rows = [
+            ("rio-de-janeiro", "Cordão da Bola Preta", "2025-03-01", "Centro", "Desde 1918."),
+            ("rio-de-janeiro", "Bloco da Preta", "2025-03-02", "Centro", "Samba no pé."),
+            ("rio-de-janeiro", "Simpatia é Quase Amor", "2025-03-01", "Ipanema", "Ao som da Preta."),
+            ("sao-paulo", "Bloco Preta no Centro", "2025-03-01", "Sé", "Samba."),
+        ]
+        for city, name, event_date, neighborhood, description in rows:
+            raw = RawBloco.objects.create(city=city, name=name, description=description)
+            Bloco.objects.create(
+                raw_data=raw,
+                city=city,
+                name=name,
+                description=description,
+                address="Rua",
+                neighborhood=neighborhood,
+                event_date=event_date,
+            )
+
+    def search(self, **params):
+        response = self.client.get("/search-blocos/", params)
+        self.assertEqual(response.status_code, 200)
+        return [bloco["n"] for bloco in json.loads(response.content)["blocos"]]
+
+    def test_accent_insensitive_prefix_search(self):
+        self.assertEqual(self.search(q="cordao bol"), ["Cordão da Bola Preta"])
+        self.assertEqual(self.search(q="SIMPATIA e"), ["Simpatia é Quase Amor"])
+        self.assertEqual(self.search(q="ipanem"), ["Simpatia é Quase Amor"])
+        # Sintaxe do FTS5 digitada pelo usuário é tratada como texto
+        self.assertEqual(self.search(q='preta"* OR'), [])
+        self.assertEqual(self.search(q='preta"*'), self.search(q="preta"))
+        self.assertEqual(self.search(q=" ,; "), [])
+
+    def test_name_matches_rank_first_and_filters_combine(self):
+        results = self.search(q="preta")
+        self.assertEqual(
+            set(results[:3]), {"Cordão da Bola Preta", "Bloco da Preta", "Bloco Preta no Centro"}
+        )
+        self.assertEqual(results[3], "Simpatia é Quase Amor")
+
+        self.assertEqual(
+            self.search(q="preta", city="rio-de-janeiro", date="2025-03-02"), ["Bloco da Preta"]
+        )
+        self.assertEqual(self.search(q="preta", neighborhood="Sé"), ["Bloco Preta no Centro"])
+        self.assertEqual(len(self.search(q="preta", limit="2")), 2)
+
+    def test_index_follows_writes(self):
+        bloco = Bloco.objects.get(name="Bloco da Preta")
+        bloco.name = "Bloco da Branca"
+        bloco.save()
+        self.assertEqual(self.search(q="branca"), ["Bloco da Branca"])
+        self.assertEqual(self.search(q="preta", date="2025-03-02"), [])
+
+        RawBloco.objects.filter(name="Cordão da Bola Preta").delete()
+        self.assertEqual(self.search(q="cordao"), [])
+
+    def test_invalid_parameters(self):
+        for params in [{"q": "preta", "date": "01/03"}, {"q": "preta", "limit": "x"}]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get("/search-blocos/", params).status_code, 400)
+
+
+class SearchTriggerTests(TransactionTestCase):
+    """The FTS triggers must survive Django rebuilding the bloco table."""
+
+    def trigger_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_triggers_exist_after_migrate(self):
+        self.assertLessEqual(set(FTS_TRIGGERS), self.trigger_names())
+        self.assertEqual(ensure_fts_triggers(), [])
+
+    def test_triggers_are_recreated_after_a_table_rebuild(self):
+        raw = RawBloco.objects.create(city="rio-de-janeiro", name="Boitatá", description="")
+        Bloco.objects.create(
+            raw_data=raw,
+            city="rio-de-janeiro",
+            name="Cordão do Boitatá",
+            description="",
+            address="",
+        )
+
+        # Como uma migração que adiciona um campo: o SQLite recria a tabela
+        field = models.IntegerField(default=0)
+        field.set_attributes_from_name("rebuild_probe")
+        with connection.schema_editor() as editor:
+            editor.add_field(Bloco, field)
+        self.addCleanup(ensure_fts_triggers)
+        self.addCleanup(self.remove_field, field)
+        self.assertFalse(set(FTS_TRIGGERS) & self.trigger_names())
+
+        call_command("migrate", verbosity=0)
+        self.assertLessEqual(set(FTS_TRIGGERS), self.trigger_names())
+
+        bloco = Bloco.objects.get()
+        bloco.name = "Bloco da Preta"
+        bloco.save()
+        self.assertEqual(search_bloco_ids("preta"), [bloco.id])
+        self.assertEqual(search_bloco_ids("boitata"), [])
+
+    def remove_field(self, field):
+        with connection.schema_editor() as editor:
+            editor.remove_field(Bloco, field)
+
+
+class HttpCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def crawl(self, server, cache):
+        with Crawler(base_url=server.url, backoff=0, cache=cache) as crawler:
+            return crawler.run(crawler.crawl_events_links())
+
+    def test_recrawl_revalidates_and_reuses_parsed_links(self):
+        with FixtureServer(dict(CrawlerTests.PAGES)) as server:
+            first = self.crawl(server, HttpCache(self.tmp_dir.name))
+
+            cache = HttpCache(self.tmp_dir.name)
+            with mock.patch("carnaval_map.crawler.parse_event_links") as parse:
+                second = self.crawl(server, cache)
+
+        self.assertEqual(first, second)
+        parse.assert_not_called()
+        self.assertEqual(cache.misses, 0)
+        self.assertGreater(cache.hits, 0)
+
+    def test_changed_page_is_parsed_again(self):
+        pages = dict(CrawlerTests.PAGES)
+        with FixtureServer(pages) as server:
+            self.crawl(server, HttpCache(self.tmp_dir.name))
+            pages["/programacao/?paged=2&data=&bairro="] = listing_page("sp-3", "sp-4")
+
+            cache = HttpCache(self.tmp_dir.name)
+            links = self.crawl(server, cache)
+
+        self.assertIn(f"{server.url}programacao/sp-4/", links[server.url])
+        self.assertEqual(cache.misses, 1)
+
+    def test_lru_eviction_under_size_cap(self):
+        pages = {f"/p{i}/": "x" * 100 for i in range(5)}
+        cache = HttpCache(self.tmp_dir.name, max_bytes=250)
+        with FixtureServer(pages) as server:
+            with Crawler(base_url=server.url, cache=cache) as crawler:
+                for i in range(5):
+                    crawler.run(crawler.fetch_pages([f"{server.url}p{i}/"]))
+
+        self.assertEqual(cache.evictions, 3)
+        self.assertEqual(cache.conditional_headers(f"{server.url}p0/"), {})
+        self.assertIn("If-None-Match", cache.conditional_headers(f"{server.url}p4/"))
+
+    def test_running_total_follows_replaced_and_evicted_bodies(self):
+        pages = {f"/p{i}/": "x" * 100 for i in range(3)}
+        cache = HttpCache(self.tmp_dir.name, max_bytes=200)
+        with FixtureServer(pages) as server:
+            with Crawler(base_url=server.url, cache=cache) as crawler:
+                crawler.run(crawler.fetch_pages([f"{server.url}p0/"]))
+                crawler.run(crawler.fetch_pages([f"{server.url}p1/"]))
+                pages["/p1/"] = "y" * 50  # Corpo substituído por um menor
+                crawler.run(crawler.fetch_pages([f"{server.url}p1/"]))
+                self.assertEqual(cache._total, 150)
+                crawler.run(crawler.fetch_pages([f"{server.url}p2/"]))
+
+        total = cache._db.execute("SELECT SUM(size) FROM entries").fetchone()[0]
+        self.assertEqual(cache._total, total)
+        self.assertEqual(total, 150)
+        self.assertEqual(cache.evictions, 1)
+        # Um novo processo parte do total gravado no índice
+        self.assertEqual(HttpCache(self.tmp_dir.name)._total, 150)
+
+    def test_cache_io_runs_off_the_event_loop(self):
+        threads = Counter()
+        cache = HttpCache(self.tmp_dir.name)
+        for name in ["conditional_headers", "handle_response", "set_derived"]:
+            method = getattr(cache, name)
+
+            def record(*args, method=method, name=name):
+                threads[name, threading.current_thread() is threading.main_thread()] += 1
+                return method(*args)
+
+            setattr(cache, name, record)
+
+        with FixtureServer(dict(CrawlerTests.PAGES)) as server:
+            self.crawl(server, cache)
+
+        self.assertEqual({on_main for _, on_main in threads}, {False})
+        self.assertEqual(
+            {name for name, _ in threads},
+            {"conditional_headers", "handle_response", "set_derived"},
+        )
+
+
+class RefreshKnownEventsTests(TestCase):
+    def setUp(self):
+        self.pages = {"/programacao/bloco-da-preta/": event_page(time="15:00")}
+        self.server = FixtureServer(self.pages)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+        url = f"{self.server.url}programacao/bloco-da-preta/"
+        data = parse_event_page(event_page(time="15:00"), "rio-de-janeiro", url).as_dict()
+        self.raw = RawBloco.objects.create(
+            **data, content_hash=fingerprint_event(data), processed=True
+        )
+        self.bloco = Bloco.objects.create(
+            raw_data=self.raw,
+            **{key: value for key, value in data.items() if key != "ticket_url"},
+            latitude=-22.92,
+            longitude=-43.23,
+        )
+
+    def refresh(self, geocoder=None):
+        self.geocoder = geocoder or FakeGeocoder()
+        with mock.patch(
+            "carnaval_map.management.commands.web_scraping.get_geocoder",
+            return_value=self.geocoder,
+        ):
+            with Crawler(base_url=self.server.url, backoff=0) as crawler:
+                return refresh_known_events(crawler)
+
+    def test_unchanged_event_is_left_alone(self):
+        self.assertEqual(self.refresh(), 0)
+        self.assertEqual(self.geocoder.calls, [])
+
+    def test_changed_time_updates_bloco_without_geocoding(self):
+        self.pages["/programacao/bloco-da-preta/"] = event_page(time="17:00")
+
+        self.assertEqual(self.refresh(), 1)
+        self.bloco.refresh_from_db()
+        self.assertEqual(self.bloco.event_time, "17:00")
+        self.assertEqual((self.bloco.latitude, self.bloco.longitude), (-22.92, -43.23))
+        self.assertEqual(self.geocoder.calls, [])
+
+    def test_refresh_shares_one_geocoder(self):
+        url = f"{self.server.url}programacao/cordao/"
+        data = parse_event_page(event_page(name="Cordão"), "rio-de-janeiro", url).as_dict()
+        raw = RawBloco.objects.create(**data, content_hash=fingerprint_event(data))
+        Bloco.objects.create(
+            raw_data=raw, **{key: value for key, value in data.items() if key != "ticket_url"}
+        )
+        self.pages["/programacao/bloco-da-preta/"] = event_page(address="Praça XV")
+        self.pages["/programacao/cordao/"] = event_page(name="Cordão", address="Lapa")
+
+        geocoder = FakeGeocoder()
+        with mock.patch(
+            "carnaval_map.management.commands.web_scraping.get_geocoder", return_value=geocoder
+        ) as get_geocoder:
+            with Crawler(base_url=self.server.url, backoff=0) as crawler:
+                self.assertEqual(refresh_known_events(crawler), 2)
+        get_geocoder.assert_called_once_with()
+        self.assertEqual(len(geocoder.calls), 2)
+
+    def test_limit_and_since_select_the_events(self):
+        url = f"{self.server.url}programacao/cordao/"
+        data = parse_event_page(event_page(name="Cordão"), "rio-de-janeiro", url).as_dict()
+        RawBloco.objects.create(**data, content_hash=fingerprint_event(data))
+        self.pages["/programacao/bloco-da-preta/"] = event_page(time="17:00")
+        self.pages["/programacao/cordao/"] = event_page(name="Cordão", time="18:00")
+
+        with Crawler(base_url=self.server.url, backoff=0) as crawler:
+            self.assertEqual(
+                refresh_known_events(crawler, FakeGeocoder(), since=timezone.now()), 0
+            )
+            self.assertEqual(refresh_known_events(crawler, FakeGeocoder(), limit=1), 1)
+        self.assertEqual(self.server.requests, ["/programacao/bloco-da-preta/"])
+
+    def test_changed_address_is_geocoded_again(self):
+        self.pages["/programacao/bloco-da-preta/"] = event_page(address="Praça XV")
+        address = "Brasil, rio de janeiro, Praça XV"
+
+        self.assertEqual(self.refresh(FakeGeocoder({address: (-22.90, -43.17)})), 1)
+        self.bloco.refresh_from_db()
+        self.assertEqual(self.bloco.address, "Praça XV")
+        self.assertEqual((self.bloco.latitude, self.bloco.longitude), (-22.90, -43.17))
+        self.assertEqual(self.geocoder.calls, [address])
+
+
+class EventParserTests(SimpleTestCase):
+    def test_matches_legacy_parser_on_corpus(self):
+        corpus = [page for page in load_corpus() if page[0] != "invalid"]
+        self.assertGreater(len(corpus), 0)
+        for city, url, html in corpus:
+            with self.subTest(url=url):
+                record = parse_event_page(html, city, url)
+                self.assertIsInstance(record, EventRecord)
+                self.assertEqual(record.as_dict(), legacy_parse_event_page(city, url, html))
+
+    def test_invalid_pages_report_reason(self):
+        reasons = {}
+        for city, url, html in load_corpus():
+            if city == "invalid":
+                with self.assertRaises(ParseError) as context:
+                    parse_event_page(html, city, url)
+                reasons[url.split("/")[-2]] = context.exception.reason
+
+        self.assertEqual(
+            reasons,
+            {
+                "missing-address": "missing_ticket_or_address",
+                "missing-subtitle": "missing_subtitle",
+            },
+        )
+
+    def test_bad_date(self):
+        with self.assertRaises(ParseError) as context:
+            parse_event_page(event_page(date="31/02/2025"), "rio-de-janeiro", "url")
+        self.assertEqual(context.exception.reason, "bad_date")
+
+    def test_extracts_fields(self):
+        record = parse_event_page(event_page(), "rio-de-janeiro", "url")
+        self.assertEqual(record.event_date, "2025-03-01")
+        self.assertEqual(record.event_day, "Sábado")
+        self.assertEqual(record.event_time, "16:00")
+        self.assertEqual(record.neighborhood, "Tijuca")
+        self.assertEqual(record.address, "Praça Saens Peña")
+        self.assertEqual(record.ticket_url, "")
+
+
+class RawBlocoPipelineTests(TestCase):
+    def test_streams_pages_to_database_in_batches(self):
+        pages = {f"/programacao/bloco-{i}/": event_page(name=f"Bloco {i}") for i in range(5)}
+        pages["/programacao/quebrado/"] = "<html><body><h1>Sem dados</h1></body></html>"
+
+        with FixtureServer(pages) as server:
+            events = [("rio-de-janeiro", f"{server.url}programacao/bloco-{i}/") for i in range(5)]
+            events += [
+                ("rio-de-janeiro", f"{server.url}programacao/quebrado/"),
+                ("rio-de-janeiro", f"{server.url}programacao/inexistente/"),
+            ]
+            with Crawler(base_url=server.url, retries=0) as crawler:
+                pipeline = RawBlocoPipeline(crawler, batch_size=2, queue_size=2)
+                saved = pipeline.run(events)
+
+        self.assertEqual(saved, 5)
+        self.assertEqual(
+            sorted(RawBloco.objects.values_list("name", flat=True)),
+            [f"Bloco {i}" for i in range(5)],
+        )
+        self.assertFalse(RawBloco.objects.filter(content_hash__isnull=True).exists())
+        self.assertEqual(pipeline.failures, {"missing_title": 1, "fetch_failed": 1})
+
+    def test_already_stored_urls_are_ignored(self):
+        with FixtureServer({"/programacao/bloco/": event_page()}) as server:
+            url = f"{server.url}programacao/bloco/"
+            with Crawler(base_url=server.url) as crawler:
+                self.assertEqual(RawBlocoPipeline(crawler).run([("rio-de-janeiro", url)]), 1)
+                metrics.begin_run()
+                with metrics.stage("fetch"):
+                    saved = RawBlocoPipeline(crawler).run([("rio-de-janeiro", url)] * 2)
+                summary = metrics.end_run()
+
+        self.assertEqual(saved, 0)
+        self.assertEqual(summary["stages"]["fetch"]["counters"].get("db.rows", 0), 0)
+        self.assertEqual(RawBloco.objects.filter(event_page_url=url).count(), 1)
+
+    def test_insert_counts_only_new_rows(self):
+        raw_blocos = [
+            RawBloco(city="rio-de-janeiro", name=name, description="", event_page_url=url)
+            for name, url in [
+                ("Antigo", "https://e.com/1/"),
+                ("Novo", "https://e.com/2/"),
+                ("Novo de novo", "https://e.com/2/"),
+                ("Sem URL", None),
+            ]
+        ]
+        RawBloco.objects.create(
+            city="rio-de-janeiro", name="Antigo", description="", event_page_url="https://e.com/1/"
+        )
+
+        self.assertEqual(insert_raw_blocos(raw_blocos), 2)
+        self.assertEqual(RawBloco.objects.count(), 3)
+
+
+class StagedScrapingTests(TestCase):
+    def test_discover_adds_new_links_to_frontier(self):
+        with FixtureServer(dict(CrawlerTests.PAGES)) as server:
+            RawBloco.objects.create(
+                city="rio-de-janeiro",
+                name="Bloco",
+                description="",
+                address="Rua",
+                event_page_url=f"{server.url}programacao/rj-1/",
+            )
+            with Crawler(base_url=server.url, backoff=0) as crawler:
+                self.assertEqual(discover_links(crawler), 6)
+                self.assertEqual(discover_links(crawler), 0)
+
+        self.assertFalse(FrontierUrl.objects.exclude(status=FrontierUrl.DISCOVERED).exists())
+        self.assertEqual(FrontierUrl.objects.filter(city="rio-de-janeiro").count(), 3)
+
+    def test_fetch_checkpoints_each_page(self):
+        pages = {
+            "/programacao/bloco/": event_page(),
+            "/programacao/quebrado/": "<html><body><h1>Sem dados</h1></body></html>",
+        }
+        with FixtureServer(pages) as server:
+            for slug in ("bloco", "quebrado", "inexistente"):
+                FrontierUrl.objects.create(
+                    city="rio-de-janeiro", url=f"{server.url}programacao/{slug}/"
+                )
+            with Crawler(base_url=server.url, retries=0) as crawler:
+                self.assertEqual(fetch_frontier(crawler, batch_size=2), 1)
+                # Nada pendente além da falha de download, que é tentada de novo
+                self.assertEqual(fetch_frontier(crawler), 0)
+
+        statuses = dict(FrontierUrl.objects.values_list("url", "status"))
+        self.assertEqual(
+            sorted(statuses.values()),
+            [FrontierUrl.FAILED, FrontierUrl.FETCHED, FrontierUrl.PARSED],
+        )
+        failed = FrontierUrl.objects.get(status=FrontierUrl.FAILED)
+        self.assertEqual((failed.failure_reason, failed.attempts), ("fetch_failed", 2))
+
+        fetched = FrontierUrl.objects.get(status=FrontierUrl.FETCHED)
+        self.assertEqual(fetched.failure_reason, "missing_title")
+        self.assertIn("Sem dados", fetched.html)
+
+        # Parse offline depois de uma correção: nenhum download
+        FrontierUrl.objects.filter(pk=fetched.pk).update(html=event_page(name="Bloco Novo"))
+        self.assertEqual(parse_fetched(), 1)
+        fetched.refresh_from_db()
+        self.assertEqual((fetched.status, fetched.html), (FrontierUrl.PARSED, None))
+        self.assertTrue(RawBloco.objects.filter(name="Bloco Novo").exists())
+
+    def test_limit_and_since(self):
+        for i in range(3):
+            FrontierUrl.objects.create(city="salvador", url=f"https://example.com/{i}/")
+        FrontierUrl.objects.filter(url="https://example.com/0/").update(
+            discovered_at=timezone.now() - timedelta(days=2)
+        )
+        pending = [FrontierUrl.DISCOVERED]
+
+        self.assertEqual(len(frontier_queryset(pending, limit=2)), 2)
+        since = timezone.now() - timedelta(days=1)
+        self.assertEqual(
+            [url.url for url in frontier_queryset(pending, since=since)],
+            ["https://example.com/1/", "https://example.com/2/"],
+        )
+
+    def test_geocode_stage_runs_alone(self):
+        for i in range(3):
+            RawBloco.objects.create(
+                city="salvador",
+                name=f"Bloco {i}",
+                description="",
+                address="Farol da Barra",
+                event_page_url=f"https://example.com/{i}/",
+            )
+        provider = FakeGeocoder({"Brasil, salvador, Farol da Barra": (-13.01, -38.53)})
+
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            SNAPSHOT_ROOT=Path(root), DATA_VERSION_FILE=Path(root) / "version"
+        ), mock.patch(
+            "carnaval_map.management.commands.web_scraping.get_geocoder", return_value=provider
+        ):
+            call_command(
+                "web_scraping", "--stage", "geocode", "--limit", "2", stdout=io.StringIO()
+            )
+            self.assertTrue((Path(root) / "version").exists())
+
+        self.assertEqual(Bloco.objects.count(), 2)
+        self.assertEqual(City.objects.get(name="salvador").bloco_count, 2)
+        self.assertEqual(FrontierUrl.objects.count(), 0)
+
+        run = IngestRun.objects.get()
+        self.assertEqual((run.status, run.stages), (IngestRun.SUCCESS, "geocode"))
+        geocode = run.summary["stages"]["geocode"]
+        self.assertEqual(geocode["counters"]["items"], 2)
+        self.assertEqual(geocode["counters"]["geocode.api_calls"], 1)
+        self.assertEqual(set(run.summary["stages"]), {"geocode", "cities", "publish"})
+
+
+class MetricsTests(TestCase):
+    def tearDown(self):
+        metrics.end_run()
+
+    def test_histogram_percentiles_use_bucket_bounds(self):
+        histogram = metrics.Histogram()
+        for milliseconds in [3] * 90 + [40] * 9 + [700]:
+            histogram.observe(milliseconds / 1000)
+
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual((summary["p50_ms"], summary["p90_ms"], summary["p99_ms"]), (5, 5, 50))
+        self.assertEqual(summary["max_ms"], 700)
+
+    def test_helpers_are_noops_without_a_run(self):
+        metrics.incr("items")
+        with metrics.stage("fetch"), metrics.timer("parse"):
+            pass
+        self.assertIsNone(metrics.end_run())
+
+    def test_fetch_stage_records_http_parse_and_write_metrics(self):
+        pages = {
+            "/programacao/bloco/": event_page(),
+            "/programacao/quebrado/": "<html><body><h1>Sem dados</h1></body></html>",
+        }
+        with FixtureServer(pages) as server:
+            for slug in ("bloco", "quebrado", "inexistente"):
+                FrontierUrl.objects.create(
+                    city="rio-de-janeiro", url=f"{server.url}programacao/{slug}/"
+                )
+            metrics.begin_run()
+            with metrics.stage("fetch"), Crawler(base_url=server.url, retries=0) as crawler:
+                fetch_frontier(crawler)
+            summary = metrics.end_run()
+
+        fetch = summary["stages"]["fetch"]
+        self.assertEqual(fetch["counters"]["items"], 3)
+        self.assertEqual(fetch["counters"]["http.requests"], 3)
+        self.assertEqual(fetch["counters"]["http.status.200"], 2)
+        self.assertEqual(fetch["counters"]["http.status.404"], 1)
+        self.assertGreater(fetch["counters"]["http.bytes"], 0)
+        self.assertEqual(fetch["counters"]["parse_failed.missing_title"], 1)
+        self.assertEqual(fetch["counters"]["db.rows"], 1)
+        self.assertEqual(fetch["histograms"]["http.latency"]["count"], 3)
+        self.assertEqual(fetch["histograms"]["parse"]["count"], 2)
+        self.assertIn("items_per_second", fetch)
+
+
+class ProcessAddressesTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            RawBloco.objects.create(
+                city="rio-de-janeiro",
+                name=f"Bloco {i}",
+                description="",
+                address=f"Rua {i}",
+                event_page_url=f"https://example.com/programacao/bloco-{i}/",
+            )
+        self.geocoder = FakeGeocoder({"Brasil, rio de janeiro, Rua 0": (-22.9, -43.2)})
+
+    def test_promotes_in_chunks(self):
+        with CaptureQueriesContext(connection) as context:
+            process_addresses(self.geocoder, chunk_size=2)
+
+        bloco_inserts = [
+            query for query in context if query["sql"].startswith('INSERT INTO "carnaval_map_bloco"')
+        ]
+        self.assertEqual(len(bloco_inserts), 3)
+        self.assertEqual(Bloco.objects.count(), 5)
+        self.assertFalse(RawBloco.objects.filter(processed=False).exists())
+        bloco = Bloco.objects.get(name="Bloco 0")
+        self.assertEqual((bloco.latitude, bloco.longitude), (-22.9, -43.2))
+        self.assertEqual(bloco.raw_data.address, "Rua 0")
+
+    def test_interrupted_run_resumes_after_last_committed_chunk(self):
+        lookup_many = self.geocoder.lookup_many
+        calls = []
+
+        def crash_on_second_chunk(addresses):
+            calls.append(addresses)
+            if len(calls) == 2:
+                raise RuntimeError("quota")
+            return lookup_many(addresses)
+
+        with mock.patch.object(self.geocoder, "lookup_many", crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                process_addresses(self.geocoder, chunk_size=2)
+
+        self.assertEqual(
+            sorted(Bloco.objects.values_list("name", flat=True)), ["Bloco 0", "Bloco 1"]
+        )
+
+        process_addresses(self.geocoder, chunk_size=2)
+        self.assertEqual(Bloco.objects.count(), 5)
+        self.assertEqual(
+            sorted(self.geocoder.calls), [f"Brasil, rio de janeiro, Rua {i}" for i in range(5)]
+        )
+
+
+class CityStatsTests(TestCase):
+    def add_bloco(self, city, latitude, longitude):
+        raw = RawBloco.objects.create(
+            city=city,
+            name="Bloco",
+            description="",
+            address="Rua",
+            event_page_url=f"https://example.com/{city}/{RawBloco.objects.count()}/",
+        )
+        return Bloco.objects.create(
+            raw_data=raw,
+            city=city,
+            name="Bloco",
+            description="",
+            address="Rua",
+            latitude=latitude,
+            longitude=longitude,
+        )
+
+    def setUp(self):
+        self.add_bloco("rio-de-janeiro", -22.0, -43.0)
+        self.add_bloco("rio-de-janeiro", -22.0, -43.0)
+        self.add_bloco("rio-de-janeiro", -23.0, -44.0)
+        self.add_bloco("rio-de-janeiro", None, None)
+        self.add_bloco("salvador", -13.0, -38.5)
+
+    def test_stats_come_from_one_grouped_query(self):
+        with CaptureQueriesContext(connection) as context:
+            update_city_coordinates()
+
+        bloco_queries = [query for query in context if "carnaval_map_bloco" in query["sql"]]
+        self.assertEqual(len(bloco_queries), 1)
+
+        rio = City.objects.get(name="rio-de-janeiro")
+        self.assertEqual(rio.bloco_count, 3)
+        self.assertEqual((rio.min_latitude, rio.max_latitude), (-23.0, -22.0))
+        self.assertEqual((rio.min_longitude, rio.max_longitude), (-44.0, -43.0))
+        self.assertEqual((rio.avg_latitude, rio.avg_longitude), (-22.5, -43.5))
+        self.assertAlmostEqual(rio.centroid_latitude, -22.0 - 1 / 3)
+        self.assertAlmostEqual(rio.centroid_longitude, -43.0 - 1 / 3)
+
+    def test_only_touched_cities_are_updated(self):
+        update_city_coordinates()
+        since = timezone.now()
+        self.add_bloco("salvador", -12.0, -38.5)
+
+        City.objects.filter(name="rio-de-janeiro").update(bloco_count=99)
+
+        self.assertEqual(touched_cities(since), ["salvador"])
+        update_city_coordinates(touched_cities(since))
+
+        self.assertEqual(City.objects.get(name="salvador").bloco_count, 2)
+        self.assertEqual(City.objects.get(name="rio-de-janeiro").bloco_count, 99)
+
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        raw = RawBloco.objects.create(
+            city="rio-de-janeiro", name="Bloco", description="", address="Rua"
+        )
+        self.bloco = Bloco.objects.create(
+            raw_data=raw,
+            city="rio-de-janeiro",
+            name="Bloco",
+            description="",
+            address="Rua",
+            subtitle="01/03/2025 - Sábado - 16:30  Tijuca",
+            neighborhood=None,
+            event_date="2025-03-01",
+            event_day="Sábado",
+            event_time="16h30",
+        )
+
+    def test_normalize_time(self):
+        self.assertEqual(normalize_time("9:00"), "09:00")
+        self.assertEqual(normalize_time("16h"), "16:00")
+        self.assertEqual(normalize_time("16h30"), "16:30")
+        self.assertIsNone(normalize_time("a definir"))
+
+    def test_dry_run_does_not_write(self):
+        result = run_backfill(dry_run=True)
+
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(
+            result.changes, {"neighborhood": 1, "event_time": 1, "summary_json": 1}
+        )
+        self.bloco.refresh_from_db()
+        self.assertIsNone(self.bloco.neighborhood)
+
+    def test_writes_only_changed_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            result = run_backfill(chunk_size=10)
+
+        updates = [query["sql"] for query in context if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"event_time"', updates[0])
+        self.assertNotIn('"event_day"', updates[0])
+        self.assertNotIn('"name"', updates[0])
+        self.assertEqual(result.scanned, 1)
+
+        self.bloco.refresh_from_db()
+        self.assertEqual((self.bloco.neighborhood, self.bloco.event_time), ("Tijuca", "16:30"))
+        self.assertIn('"b": "Tijuca"', self.bloco.summary_json)
+        self.assertEqual(run_backfill().updated, 0)
+
+    def test_summary_follows_selected_extractors(self):
+        run_backfill(["neighborhood"])
+
+        self.bloco.refresh_from_db()
+        self.assertEqual(self.bloco.summary_json, self.bloco.render_summary())
+        self.assertIn('"b": "Tijuca"', self.bloco.summary_json)
+
+
+class GazetteerTests(TestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer(
+            pd.DataFrame(
+                [
+                    ("rio-de-janeiro", "Rua Garcia d'Avila, 173", "Ipanema", -22.98, -43.20),
+                    ("rio-de-janeiro", "Av. Vieira Souto, 100", "Ipanema", -22.99, -43.21),
+                    ("rio-de-janeiro", "Praça Saens Peña", "Tijuca", -22.92, -43.23),
+                    ("salvador", "Farol da Barra", "Barra", -13.01, -38.53),
+                ],
+                columns=["city", "address", "neighborhood", "latitude", "longitude"],
+            )
+        )
+
+    def test_street_key(self):
+        self.assertEqual(street_key("R. Harmonia 67"), "rua harmonia")
+        self.assertEqual(street_key("Pça. Mariquinha Sciascia, s/n"), "praca mariquinha sciascia")
+        self.assertEqual(street_key("Rua 2"), "")
+
+    def test_resolves_exact_street_and_fuzzy_matches(self):
+        addresses = [
+            ("rio-de-janeiro", "praça saens pena"),
+            ("rio-de-janeiro", "Avenida Vieira Souto, 500"),
+            ("rio-de-janeiro", "R. Garcia Dávila"),
+            ("rio-de-janeiro", "Rua Desconhecida, 10"),
+            ("salvador", "Praça Saens Peña"),
+        ]
+        resolved = self.gazetteer.resolve_many(addresses)
+
+        self.assertEqual(resolved[addresses[0]], ((-22.92, -43.23), "address"))
+        self.assertEqual(resolved[addresses[1]], ((-22.99, -43.21), "street"))
+        self.assertEqual(resolved[addresses[2]], ((-22.98, -43.20), "fuzzy"))
+        self.assertEqual(len(resolved), 3)
+
+    def test_gazetteer_is_consulted_before_the_api(self):
+        provider = FakeGeocoder()
+        geocoder = CachedGeocoder(provider, gazetteer=self.gazetteer)
+        results = geocoder.geocode_many(
+            [("rio-de-janeiro", "Praça Saens Peña, s/n"), ("rio-de-janeiro", "Rua Nova")]
+        )
+
+        self.assertEqual(results[("rio-de-janeiro", "Praça Saens Peña, s/n")], (-22.92, -43.23))
+        self.assertEqual(provider.calls, ["Brasil, rio de janeiro, Rua Nova"])
+        self.assertEqual(geocoder.stats()["gazetteer_hits"], 1)
+
+    def test_failed_geocode_falls_back_to_neighborhood_centroid(self):
+        self.assertEqual(
+            self.gazetteer.neighborhood_centroid("rio-de-janeiro", "ipanema"), (-22.985, -43.205)
+        )
+        raw = RawBloco.objects.create(
+            city="rio-de-janeiro",
+            name="Bloco",
+            description="",
+            address="Rua Nova",
+            neighborhood="Ipanema",
+        )
+        promote_chunk([raw], CachedGeocoder(FakeGeocoder()), self.gazetteer)
+
+        bloco = Bloco.objects.get(raw_data=raw)
+        self.assertAlmostEqual(bloco.latitude, -22.985)
+        self.assertAlmostEqual(bloco.longitude, -43.205)
+        self.assertEqual(bloco.geocode_source, Bloco.CENTROID)
+
+    def test_guessed_coordinates_do_not_feed_the_gazetteer(self):
+        provider = FakeGeocoder({"Brasil, rio de janeiro, Rua Conhecida, 1": (-22.9, -43.2)})
+        raws = [
+            RawBloco.objects.create(
+                city="rio-de-janeiro",
+                name=f"Bloco {i}",
+                description="",
+                address=address,
+                neighborhood="Ipanema",
+                event_page_url=f"https://example.com/programacao/bloco-{i}/",
+            )
+            for i, address in enumerate(["Rua Conhecida, 1", "Rua Nova"])
+        ]
+        promote_chunk(raws, CachedGeocoder(provider), self.gazetteer)
+        self.assertEqual(
+            dict(Bloco.objects.values_list("address", "geocode_source")),
+            {"Rua Conhecida, 1": Bloco.PROVIDER, "Rua Nova": Bloco.CENTROID},
+        )
+
+        gazetteer = Gazetteer.build()
+        self.assertEqual(len(gazetteer), 1)
+        resolved = gazetteer.resolve_many(
+            [("rio-de-janeiro", "Rua Nova"), ("rio-de-janeiro", "Rua Conhecida, 1")]
+        )
+        self.assertEqual(list(resolved), [("rio-de-janeiro", "Rua Conhecida, 1")])
+
+        # O chute não vira acerto exato para um novo bloco no mesmo endereço
+        geocoder = CachedGeocoder(provider, gazetteer=gazetteer)
+        results = geocoder.geocode_many([("rio-de-janeiro", "Rua Nova")], with_sources=True)
+        self.assertEqual(results[("rio-de-janeiro", "Rua Nova")], (None, None))
+        self.assertEqual(geocoder.stats()["gazetteer_hits"], 0)
+
+
+class CachedGeocoderTests(TestCase):
+    def setUp(self):
+        self.provider = FakeGeocoder({"Brasil, rio de janeiro, Praça Saens Peña": (-22.9, -43.2)})
+        self.geocoder = CachedGeocoder(self.provider)
+
+    def test_normalize_address_ignores_accents_case_and_punctuation(self):
+        self.assertEqual(
+            normalize_address("rio-de-janeiro", "Praça  Saens Peña, s/n"),
+            normalize_address("rio-de-janeiro", "praca saens pena s n"),
+        )
+
+    def test_batch_is_deduplicated_and_cached(self):
+        addresses = [
+            ("rio-de-janeiro", "Praça Saens Peña"),
+            ("rio-de-janeiro", "praca saens pena"),
+            ("rio-de-janeiro", "Lugar Nenhum"),
+        ]
+        results = self.geocoder.geocode_many(addresses)
+
+        self.assertEqual(results[addresses[0]], (-22.9, -43.2))
+        self.assertEqual(results[addresses[1]], (-22.9, -43.2))
+        self.assertIsNone(results[addresses[2]])
+        self.assertEqual(len(self.provider.calls), 2)
+
+        geocoder = CachedGeocoder(self.provider)
+        geocoder.geocode_many(addresses)
+        self.assertEqual(len(self.provider.calls), 2)
+        self.assertEqual(geocoder.stats()["hits"], 1)
+        self.assertEqual(geocoder.stats()["negative_hits"], 1)
+        self.assertEqual(geocoder.stats()["hit_rate"], 1.0)
+
+    def test_negative_entries_expire_before_positive_ones(self):
+        addresses = [("rio-de-janeiro", "Praça Saens Peña"), ("rio-de-janeiro", "Lugar Nenhum")]
+        self.geocoder.geocode_many(addresses)
+        GeocodeCache.objects.update(updated_at=timezone.now() - timedelta(days=30))
+
+        self.geocoder.geocode_many(addresses)
+        self.assertEqual(len(self.provider.calls), 3)
+        self.assertEqual(self.provider.calls[-1], "Brasil, rio de janeiro, Lugar Nenhum")
+
+    def test_errors_are_not_cached(self):
+        provider = RateLimitedGeocoder(FakeGeocoder(over_query_limit=2), retries=1, backoff=0)
+        geocoder = CachedGeocoder(provider)
+        self.assertIsNone(geocoder.geocode("rio-de-janeiro", "Praça XV"))
+        self.assertFalse(GeocodeCache.objects.exists())
+
+
+class RateLimitedGeocoderTests(SimpleTestCase):
+    def test_token_bucket_allows_burst_then_paces_requests(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=5, burst=3, clock=lambda: now[0], sleep=sleep)
+        waits = [bucket.acquire() for _ in range(8)]
+
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(now[0], 1.0)
+        for wait in waits[3:]:
+            self.assertAlmostEqual(wait, 0.2)
+
+    def test_retries_over_query_limit(self):
+        provider = FakeGeocoder({"Praça XV": (-22.90, -43.17)}, over_query_limit=2)
+        geocoder = RateLimitedGeocoder(provider, rate=1000, burst=10, workers=2, backoff=0)
+
+        self.assertEqual(geocoder.lookup("Praça XV"), ("OK", (-22.90, -43.17)))
+        self.assertEqual(len(provider.calls), 3)
+        self.assertEqual(geocoder.throttled, 2)
+
+    def test_lookups_run_concurrently(self):
+        provider = FakeGeocoder(latency=0.05)
+        geocoder = RateLimitedGeocoder(provider, rate=1000, burst=20, workers=10)
+        addresses = [f"Rua {number}" for number in range(20)]
+
+        started = time.perf_counter()
+        results = geocoder.lookup_many(addresses)
+
+        self.assertLess(time.perf_counter() - started, 20 * 0.05 / 2)
+        self.assertEqual(set(results), set(addresses))
+        self.assertGreater(provider.max_active, 1)
+        self.assertLessEqual(provider.max_active, 10)
+
+    def test_throughput_follows_rate_limit(self):
+        geocoder = RateLimitedGeocoder(FakeGeocoder(), rate=50, burst=1, workers=10)
+
+        started = time.perf_counter()
+        geocoder.lookup_many([f"Rua {number}" for number in range(11)])
+
+        self.assertGreaterEqual(time.perf_counter() - started, 10 / 50 * 0.9)
+
+
+@override_settings(FACET_INDEX_ENABLED=True)
+class SyntheticBenchmarkTests(DataVersionTestCase):
+    def test_generated_dataset_is_reproducible_and_skewed(self):
+        RawBloco.objects.create(
+            city="salvador", name="Real", description="", event_page_url="https://e.com/1/"
+        )
+
+        self.assertEqual(generate_dataset(600, cities=3, neighborhoods=10, skew=1.5, seed=7), 600)
+        first = list(Bloco.objects.order_by("id").values_list("name", "neighborhood"))
+
+        neighborhoods = Counter(name for _, name in first)
+        self.assertGreater(neighborhoods["Bairro 1"], 3 * neighborhoods["Bairro 10"])
+        self.assertEqual(
+            set(City.objects.values_list("name", flat=True)),
+            {"rio-de-janeiro", "sao-paulo", "salvador"},
+        )
+        self.assertEqual(City.objects.aggregate(total=Sum("bloco_count"))["total"], 600)
+
+        self.assertEqual(clear_dataset(), 1200)
+        self.assertEqual(list(RawBloco.objects.values_list("name", flat=True)), ["Real"])
+        self.assertFalse(City.objects.exists())
+
+        generate_dataset(600, cities=3, neighborhoods=10, skew=1.5, seed=7)
+        self.assertEqual(
+            list(Bloco.objects.order_by("id").values_list("name", "neighborhood")), first
+        )
+        self.assertEqual(
+            RawBloco.objects.filter(event_page_url__startswith=SYNTHETIC_URL).count(), 600
+        )
+
+    def test_clear_restores_the_stats_of_real_cities(self):
+        raw = RawBloco.objects.create(
+            city="salvador", name="Real", description="", event_page_url="https://e.com/1/"
+        )
+        Bloco.objects.create(
+            raw_data=raw,
+            city="salvador",
+            name="Real",
+            description="",
+            address="Farol da Barra",
+            latitude=-13.01,
+            longitude=-38.53,
+            geocode_source=Bloco.PROVIDER,
+        )
+        update_city_coordinates(["salvador"])
+        fields = ["name", "avg_latitude", "centroid_longitude", "max_latitude", "bloco_count"]
+        real = list(City.objects.values(*fields))
+
+        generate_dataset(300, cities=3, neighborhoods=5)
+        self.assertGreater(City.objects.get(name="salvador").bloco_count, 1)
+
+        clear_dataset()
+        self.assertEqual(list(City.objects.values(*fields)), real)
+
+    def test_suite_measures_every_case(self):
+        generate_dataset(200, cities=2, neighborhoods=5)
+        results = run_suite(rounds=3)
+
+        self.assertIn("index", results)
+        self.assertIn("filter_city_date_neighborhood", results)
+        for result in results.values():
+            self.assertEqual(result["status"], 200)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["bytes"], 0)
+
+        # Sem filtros, a resposta traz todos os blocos
+        self.assertGreater(results["filter"]["bytes"], results["filter_city"]["bytes"])
+
+    def test_suite_bypasses_the_application_cache(self):
+        generate_dataset(200, cities=2, neighborhoods=5)
+        finish_ingest()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        no_filters = {"city": "", "date": "", "neighborhood": ""}
+        results = run_suite(rounds=3, cases=build_cases(no_filters))
+        with override_settings(FACET_INDEX_ENABLED=False):
+            sql = run_suite(rounds=3)
+
+        # Medições a frio executam a view; as "warm" vêm do cache
+        self.assertGreater(results["index"]["queries"], 0)
+        self.assertEqual(results["index"]["warm_queries"], 0)
+        for name, result in sql.items():
+            with self.subTest(case=name):
+                self.assertGreater(result["queries"], 0)
+                self.assertEqual(result["warm_queries"], 0)
+
+    def test_command_saves_and_compares_results(self):
+        output = self.root / "results.json"
+        args = ["--in-place", "--sizes", "50,100", "--cities", "2", "--rounds", "2"]
+
+        call_command("benchmark_endpoints", *args, "--output", output, stdout=io.StringIO())
+        results = json.loads(output.read_text())
+        self.assertEqual([run["size"] for run in results["runs"]], [50, 100])
+        self.assertFalse(Bloco.objects.exists())
+
+        slower = json.loads(output.read_text())
+        for case in slower["runs"][0]["cases"].values():
+            case["p50_ms"] *= 2
+            case["queries"] += 1
+        comparison = compare_results(results, slower)
+        self.assertEqual(len(comparison), 14)
+        self.assertTrue(all(row["regression"] for row in comparison if row["size"] == 50))
+        self.assertFalse(any(row["regression"] for row in comparison if row["size"] == 100))
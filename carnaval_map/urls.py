@@ -1,8 +1,25 @@
 from django.urls import path, include
-from .views import CarnavalMapView, FilterBlocosView
+from .views import (
+    BlocoDetailView,
+    CarnavalMapView,
+    ClusterView,
+    FilterBlocosView,
+    SearchBlocosView,
+    SnapshotView,
+    ViewportBlocosView,
+)
 
 urlpatterns = [
     path("", CarnavalMapView.as_view(), name="index"),
     path("filter-blocos/", FilterBlocosView.as_view(), name="filter_blocos"),
+    path("search-blocos/", SearchBlocosView.as_view(), name="search_blocos"),
+    path("viewport-blocos/", ViewportBlocosView.as_view(), name="viewport_blocos"),
+    path("clusters/", ClusterView.as_view(), name="clusters"),
+    path("blocos/<int:pk>/", BlocoDetailView.as_view(), name="bloco_detail"),
+    path(
+        "blocos/snapshot/<slug:version>.json",
+        SnapshotView.as_view(),
+        name="blocos_snapshot",
+    ),
 
 ]
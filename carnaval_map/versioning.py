@@ -0,0 +1,54 @@
+"""
+Global data-version stamp, bumped by the ingest commands after they commit.
+
+The stamp lives in a small file instead of the database so that web workers
+can check it on every request without a query.
+"""
+
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+_version_cache = {"mtime": None, "version": None}
+
+
+def get_version_file():
+    return Path(settings.DATA_VERSION_FILE)
+
+
+def get_data_version():
+    """
+    Returns the current data version, rereading the file only when it changes.
+
+    Returns:
+        str: The data version or "0" if no ingest bumped it yet.
+    """
+    path = get_version_file()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return "0"
+
+    if _version_cache["mtime"] != mtime:
+        _version_cache["version"] = path.read_text().strip() or "0"
+        _version_cache["mtime"] = mtime
+    return _version_cache["version"]
+
+
+def bump_data_version():
+    """
+    Stores a new data version, invalidating everything derived from the old one.
+
+    Returns:
+        str: The new data version.
+    """
+    path = get_version_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    version = f"{time.time_ns():x}"
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(version)
+    os.replace(tmp_path, path)
+    return version
@@ -1,62 +1,201 @@
+import hashlib
+import math
 from datetime import datetime
 
-from django.http import JsonResponse
-from django.shortcuts import render
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import View
 
+from .caching import get_or_compute, make_key
+from .clusters import unproject
+from .facets import get_facet_index
 from .models import Bloco, City
+from .search import search_bloco_ids
+from .serializers import (
+    DETAIL_FIELDS,
+    SUMMARY_SOURCE_FIELDS,
+    bloco_json,
+    filter_response_json,
+    summary_fragment,
+)
+from .snapshot import ENCODINGS, get_manifest, snapshot_path
+from .versioning import get_data_version
 
 class CarnavalMapView(View):
     def get(self, request):
-        blocos = self.get_blocos()
+        snapshot = self.get_snapshot()
+        # O snapshot entra na chave: ele é reconstruído logo depois da troca de versão
+        key = make_key("index-context", snapshot["version"], snapshot.get("shards"))
+        context = get_or_compute(key, lambda: self.get_context(snapshot))
+        return render(request, "carnaval_map/index.html", context)
+
+    def get_context(self, snapshot):
         cities_coords = self.get_cities_coords()
-        cities = self.format_cities(blocos)
-        dates = self.format_dates(blocos)
+        cities = self.format_cities(snapshot["cities"])
+        dates = self.format_dates(snapshot["dates"])
 
-        context = {
-            "blocos": blocos,
+        return {
+            "snapshot_url": reverse("blocos_snapshot", args=[snapshot["version"]]),
+            "shards_url": snapshot.get("shards"),
             "cities": cities,
             "dates": dates,
             "cities_coords": cities_coords,
         }
-        return render(request, "carnaval_map/index.html", context)
 
-    def get_blocos(self):
-        return list(
-            Bloco.objects.values(
-                "name", "city", "subtitle", "event_date", "event_day", "event_time",
-                "description", "ticket_info", "ticket_url", "latitude", "longitude",
-                "neighborhood", "event_page_url", "address_gmaps_url", "address"
-            ).order_by("event_date")
-        )
+    def get_snapshot(self):
+        return get_manifest()
 
     def get_cities_coords(self):
-        return list(City.objects.values("name", "avg_latitude", "avg_longitude"))
+        return list(
+            City.objects.values(
+                "name",
+                "avg_latitude",
+                "avg_longitude",
+                "centroid_latitude",
+                "centroid_longitude",
+                "min_latitude",
+                "max_latitude",
+                "min_longitude",
+                "max_longitude",
+            )
+        )
 
-    def format_cities(self, blocos):
-        cities_ids = {bloco["city"] for bloco in blocos}
-        return [(city, city.replace("-", " ").title()) for city in cities_ids]
+    def format_cities(self, cities):
+        return [(city, city.replace("-", " ").title()) for city in cities]
 
-    def format_dates(self, blocos):
-        dates = sorted({bloco["event_date"] for bloco in blocos})
+    def format_dates(self, dates):
+        dates = [datetime.strptime(date, "%Y-%m-%d") for date in dates]
         return [(date.strftime("%Y-%m-%d"), date.strftime("%d/%m/%Y")) for date in dates]
 
 
+def accepted_encodings(header):
+    """
+    Parses an Accept-Encoding header.
+
+    Args:
+        header (str): E.g. "gzip;q=0.8, br;q=0".
+
+    Returns:
+        dict: The q-value of each listed encoding; malformed values count as 0.
+    """
+    accepted = {}
+    for value in header.split(","):
+        encoding, *params = (part.strip() for part in value.split(";"))
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        accepted[encoding.lower()] = quality if math.isfinite(quality) else 0.0
+    return accepted
+
+
+class SnapshotView(View):
+    """Serves a versioned bloco snapshot, precompressed when the client allows it."""
+
+    CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+    def get(self, request, version):
+        encoding, path = self.select_variant(request, version)
+        if path is None:
+            raise Http404("Snapshot não encontrado.")
+
+        etag = f'"{version}{"-" + encoding if encoding else ""}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(open(path, "rb"), content_type="application/json")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = self.CACHE_CONTROL
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+    def select_variant(self, request, version):
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        for encoding, _ in ENCODINGS:
+            path = snapshot_path(version, encoding)
+            if accepted.get(encoding, accepted.get("*", 0)) > 0 and path.exists():
+                return encoding, path
+
+        path = snapshot_path(version)
+        return None, path if path.exists() else None
+
+
+def query_etag(request):
+    """Derives the ETag of a data response without touching the database."""
+    key = "|".join([get_data_version(), *(f"{k}={v}" for k, v in sorted(request.GET.items()))])
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def parse_date_filter(value):
+    """
+    Parses the "date" filter.
+
+    Returns:
+        date: The parsed date or None when the filter is empty.
+
+    Raises:
+        ValueError: If the value is not a valid YYYY-MM-DD date.
+    """
+    if not value:
+        return None
+    event_date = parse_date(value)
+    if event_date is None:
+        raise ValueError(f"Data inválida: {value}")
+    return event_date
+
+
+@method_decorator(cache_control(no_cache=True), name="get")
+@method_decorator(condition(etag_func=query_etag), name="get")
 class FilterBlocosView(View):
     def get(self, request):
         city = request.GET.get("city", "")
         date = request.GET.get("date", "")
         neighborhood = request.GET.get("neighborhood", "")
 
-        blocos_query = self.filter_blocos(city, date, neighborhood)
-        blocos = self.get_blocos_list(blocos_query)
-        dates = self.get_dates(blocos_query)
-        neighborhoods = self.get_neighborhoods(blocos_query)
+        content = get_or_compute(
+            make_key("filter-blocos", city, date, neighborhood),
+            lambda: self.render_response(city, date, neighborhood),
+        )
+        return HttpResponse(content, content_type="application/json")
+
+    def render_response(self, city, date, neighborhood):
+        if settings.FACET_INDEX_ENABLED:
+            blocos, dates, neighborhoods = self.filter_from_index(city, date, neighborhood)
+        else:
+            blocos_query = self.filter_blocos(city, date, neighborhood)
+            blocos = self.get_blocos_list(blocos_query)
+            dates = self.get_dates(blocos_query)
+            neighborhoods = self.get_neighborhoods(blocos_query)
+
+        # Concatena os JSON pré-renderizados: mesmo corpo do JsonResponse
+        return filter_response_json(blocos, dates, neighborhoods)
 
-        return JsonResponse({"blocos": blocos, "dates": dates, "neighborhoods": neighborhoods})
+    def filter_from_index(self, city, date, neighborhood):
+        index = get_facet_index()
+        try:
+            event_date = parse_date_filter(date)
+        except ValueError:
+            return [], [], []
+
+        return index.filter_response(city, event_date, neighborhood)
 
     def filter_blocos(self, city, date, neighborhood):
-        query = Bloco.objects.all().order_by("event_date")
+        query = Bloco.objects.all().order_by("event_date", "id")
         if city:
             query = query.filter(city=city)
         if date:
@@ -66,17 +205,156 @@ class FilterBlocosView(View):
         return query
 
     def get_blocos_list(self, blocos_query):
-        return list(
-            blocos_query.values(
-                "name", "city", "subtitle", "event_date", "event_day", "event_time",
-                "description", "latitude", "longitude", "neighborhood", "ticket_url",
-                "ticket_info", "event_page_url", "address_gmaps_url", "address"
-            )
-        )
+        return [
+            bloco_json(values["id"], values["summary_json"] or summary_fragment(values))
+            for values in blocos_query.values(*SUMMARY_SOURCE_FIELDS, "summary_json")
+        ]
 
     def get_dates(self, blocos_query):
-        dates = sorted(blocos_query.values_list("event_date", flat=True).distinct())
+        dates = sorted(blocos_query.order_by().values_list("event_date", flat=True).distinct())
         return [(date, date.strftime("%d/%m/%Y")) for date in dates]
 
     def get_neighborhoods(self, blocos_query):
-        return sorted(blocos_query.values_list("neighborhood", flat=True).distinct())
+        return sorted(blocos_query.order_by().values_list("neighborhood", flat=True).distinct())
+
+
+@method_decorator(cache_control(no_cache=True), name="get")
+@method_decorator(condition(etag_func=query_etag), name="get")
+class ViewportBlocosView(View):
+    """Returns only the blocos inside the map viewport (bbox=south,west,north,east)."""
+
+    def get(self, request):
+        try:
+            bbox = self.parse_bbox(request.GET.get("bbox", ""))
+            event_date = parse_date_filter(request.GET.get("date", ""))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        index = get_facet_index()
+        positions = index.filter(
+            request.GET.get("city", ""),
+            event_date,
+            request.GET.get("neighborhood", ""),
+            bbox,
+        )
+        return JsonResponse({"blocos": index.blocos(positions), "count": len(positions)})
+
+    @staticmethod
+    def parse_bbox(value):
+        """
+        Parses the "bbox" parameter, clamping it to valid coordinates.
+
+        Returns:
+            tuple: (south, west, north, east).
+
+        Raises:
+            ValueError: If the value is malformed, not finite or inverted.
+        """
+        try:
+            south, west, north, east = (float(part) for part in value.split(","))
+        except ValueError:
+            raise ValueError("bbox deve estar no formato sul,oeste,norte,leste.")
+        if not all(math.isfinite(part) for part in (south, west, north, east)):
+            raise ValueError("bbox deve conter apenas números finitos.")
+        if south > north or west > east:
+            raise ValueError("bbox com limites invertidos.")
+
+        south, north = (min(max(part, -90.0), 90.0) for part in (south, north))
+        west, east = (min(max(part, -180.0), 180.0) for part in (west, east))
+        return south, west, north, east
+
+
+@method_decorator(cache_control(no_cache=True), name="get")
+@method_decorator(condition(etag_func=query_etag), name="get")
+class ClusterView(View):
+    """
+    Returns the precomputed marker clusters of a zoom level: centroids with
+    counts for groups and full rows for isolated blocos.
+    """
+
+    def get(self, request):
+        try:
+            zoom = int(request.GET.get("zoom", ""))
+            bbox = request.GET.get("bbox", "")
+            bbox = ViewportBlocosView.parse_bbox(bbox) if bbox else None
+            event_date = parse_date_filter(request.GET.get("date", ""))
+            since = parse_date_filter(request.GET.get("since", ""))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        index = get_facet_index()
+        tree = index.cluster_tree(
+            request.GET.get("city", ""),
+            event_date,
+            request.GET.get("neighborhood", ""),
+            since,
+        )
+
+        clusters, positions = [], []
+        for x, y, count, position in tree.get_nodes(zoom, bbox):
+            if position is not None:
+                positions.append(position)
+                continue
+            latitude, longitude = unproject(x, y)
+            clusters.append({"latitude": latitude, "longitude": longitude, "count": count})
+
+        return JsonResponse({"clusters": clusters, "blocos": index.blocos(sorted(positions))})
+
+
+@method_decorator(cache_control(no_cache=True), name="get")
+@method_decorator(condition(etag_func=query_etag), name="get")
+class SearchBlocosView(View):
+    """
+    Full-text search by name, subtitle, description and neighborhood,
+    combinable with the city, date and neighborhood filters.
+    """
+
+    MAX_LIMIT = 200
+
+    def get(self, request):
+        try:
+            event_date = parse_date_filter(request.GET.get("date", ""))
+            limit = self.parse_limit(request.GET.get("limit", "50"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        ids = search_bloco_ids(
+            request.GET.get("q", ""),
+            city=request.GET.get("city", ""),
+            date=event_date,
+            neighborhood=request.GET.get("neighborhood", ""),
+            limit=limit,
+        )
+        rows = Bloco.objects.filter(id__in=ids).values(*SUMMARY_SOURCE_FIELDS, "summary_json")
+        rows = {values["id"]: values for values in rows}
+        # Mantém a ordem de relevância da busca
+        blocos = [
+            bloco_json(pk, rows[pk]["summary_json"] or summary_fragment(rows[pk])) for pk in ids
+        ]
+        return HttpResponse(
+            f'{{"blocos": [{", ".join(blocos)}], "count": {len(blocos)}}}',
+            content_type="application/json",
+        )
+
+    def parse_limit(self, value):
+        try:
+            limit = int(value)
+        except ValueError:
+            raise ValueError("limit deve ser um número inteiro.")
+        if limit < 1:
+            raise ValueError("limit deve ser positivo.")
+        return min(limit, self.MAX_LIMIT)
+
+
+def bloco_detail_etag(request, pk):
+    return hashlib.sha1(f"{get_data_version()}|{pk}".encode()).hexdigest()[:20]
+
+
+@method_decorator(cache_control(public=True, max_age=3600), name="get")
+@method_decorator(condition(etag_func=bloco_detail_etag), name="get")
+class BlocoDetailView(View):
+    """Full data of a single bloco, fetched by the popup on demand."""
+
+    def get(self, request, pk):
+        bloco = get_object_or_404(Bloco.objects.values(*DETAIL_FIELDS), pk=pk)
+        return JsonResponse(bloco)
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "carnaval_map.middleware.ShardMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -121,6 +122,57 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# Published data (bloco snapshots rebuilt and data version bumped at the end
+# of each ingest)
+
+DATA_ROOT = BASE_DIR / "data"
+SNAPSHOT_ROOT = DATA_ROOT / "snapshots"
+DATA_VERSION_FILE = DATA_ROOT / "version"
+
+# URL of the static filter shards exported next to the snapshots
+SHARD_URL = "/shards/"
+
+# On-disk cache of the pages downloaded by the scraper
+HTTP_CACHE_ROOT = DATA_ROOT / "http_cache"
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Geocoding cache: successful results and ZERO_RESULTS answers expire after
+GEOCODE_CACHE_TTL_DAYS = 365
+GEOCODE_NEGATIVE_TTL_DAYS = 7
+
+# Geocoding quota: requests per second, back-to-back burst and lookups in flight
+GEOCODE_RATE_LIMIT = 10
+GEOCODE_BURST = 10
+GEOCODE_WORKERS = 8
+
+# Answer /filter-blocos/ from the per-process in-memory index instead of SQLite
+FACET_INDEX_ENABLED = True
+
+# Application cache of the index page context and the filter responses. Entries
+# are keyed by the data version, so an ingest invalidates them all at once.
+# CACHE_BACKEND=file shares the cache between worker processes.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHE_TIMEOUT = 24 * 60 * 60
+
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": DATA_ROOT / "cache",
+            "TIMEOUT": CACHE_TIMEOUT,
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "carnaval-map",
+            "TIMEOUT": CACHE_TIMEOUT,
+            "OPTIONS": {"MAX_ENTRIES": 1000},
+        }
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 